@@ -4,7 +4,14 @@ from flask_cors import CORS
 # Import configuration mapping to select proper config by environment
 from backend.config.config import config as config_map
 from backend.models import db
+from sqlalchemy import event
 import logging
+
+def _sqlite_wal(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.close()
+
 def create_app():
     """Factory function para criar a aplicação Flask com base em FLASK_ENV"""
     app = Flask(__name__)
@@ -25,6 +32,12 @@ def create_app():
     # Inicializar extensões
     db.init_app(app)
     
+    # SQLite (desenvolvimento): modo WAL, para que leituras como
+    # /api/import/status não esperem a transação de uma importação em background
+    if app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+        with app.app_context():
+            event.listen(db.engine, 'connect', _sqlite_wal)
+    
     # Configurar logging
     if not app.debug and not app.testing:
         logging.basicConfig(
@@ -68,5 +81,10 @@ def create_app():
     # Criar tabelas do banco de dados
     with app.app_context():
         db.create_all()
+        
+        # Importações interrompidas por um processo encerrado (reciclagem do
+        # gunicorn, OOM) não ficam 'queued'/'processing' para sempre
+        from backend.services.import_job_service import import_job_service
+        import_job_service.reap_stale(startup=True)
     
     return app
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+GET Condicional - ETags derivados da versão do dataset
+Os GETs dos blueprints registrados respondem com um ETag calculado da
+versão do dataset, do caminho, dos parâmetros e do dia corrente (os
+períodos padrão dependem de "hoje"); se o cliente enviar o mesmo ETag em
+If-None-Match a resposta é 304 sem executar o endpoint
+"""
+
+import hashlib
+from datetime import datetime
+from typing import Optional
+from flask import Blueprint, current_app, g, request
+from backend.services.dataset_version_service import dataset_version_service
+
+
+def request_etag() -> Optional[str]:
+    """ETag da requisição atual, ou None se a versão do dataset não estiver disponível"""
+    versao = dataset_version_service.current()
+    if versao is None:
+        return None
+    parametros = sorted((k, v) for k in request.args for v in request.args.getlist(k))
+    assinatura = repr((request.path, parametros, datetime.utcnow().date().isoformat()))
+    return f'{versao}-{hashlib.md5(assinatura.encode()).hexdigest()[:16]}'
+
+
+def register_conditional_get(bp: Blueprint) -> None:
+    """Ativa ETag/304 para os GETs do blueprint"""
+
+    @bp.before_request
+    def check_etag():
+        if request.method != 'GET':
+            return None
+        etag = request_etag()
+        g.dataset_etag = etag
+        if etag is not None and request.if_none_match.contains_weak(etag):
+            return not_modified(etag)
+        return None
+
+    @bp.after_request
+    def add_etag(response):
+        etag = getattr(g, 'dataset_etag', None)
+        if request.method == 'GET' and etag is not None and response.status_code == 200:
+            response.set_etag(etag, weak=True)
+            # O navegador revalida a cada uso em vez de reutilizar sem perguntar
+            response.headers.setdefault('Cache-Control', 'no-cache')
+        return response
+
+
+def not_modified(etag: str):
+    """Resposta 304 sem corpo"""
+    response = current_app.response_class(status=304)
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
@@ -1,176 +1,37 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, current_app, jsonify, request
+import base64
+import json
+from decimal import Decimal
 from datetime import datetime, timedelta
-from sqlalchemy import func, and_, or_
-from backend.models import db, Corrida, Motorista, Meta, MetricaDiaria, StatusCorrida, StatusMotorista
+from sqlalchemy import func, and_, or_, case
+from backend.models import db, Corrida, Motorista, Meta, MetricaDiaria, MetricaMensal, MetricaMotoristaDiaria, StatusCorrida, StatusMotorista
 from backend.services.cache_service import cache_service
+from backend.services.aggregation_service import aggregation_service
+from backend.services.columnar_service import columnar_service
+from backend.services.period_service import Periodo, resolve_period
+from backend.services.query_fingerprint import canonical_query, earliest_date
+from backend.services.rollup_service import month_start
+from backend.api.conditional import register_conditional_get
 import logging
 logger = logging.getLogger(__name__)
 
 bp = Blueprint('dashboard', __name__)
 
+# ETag da versão do dataset e 304 sem executar as consultas
+register_conditional_get(bp)
+
+# Tamanho máximo de uma página do ranking de motoristas
+MAX_PAGE_SIZE = 100
+
 @bp.route('/overview', methods=['GET'])
 def get_overview():
     """Retorna overview geral do dashboard com cache otimizado"""
     try:
-        # Parâmetros de filtro
-        municipio = request.args.get('municipio')
-        start_date = request.args.get('start_date')
-        end_date = request.args.get('end_date')
-        
-        # Criar chave de cache baseada nos parâmetros
-        cache_params = {
-            'municipio': municipio,
-            'start_date': start_date,
-            'end_date': end_date
-        }
-        
-        # Tentar recuperar do cache primeiro
-        cached_data = cache_service.get_dashboard_overview(cache_params)
-        if cached_data:
-            logger.info("📊 Overview recuperado do cache")
-            return jsonify({
-                'success': True,
-                'data': cached_data,
-                'from_cache': True
-            })
-        
-        logger.info("📊 Gerando overview - cache miss")
-        
-        # Definir período padrão (todos os dados se não especificado)
-        if not start_date:
-            # Buscar a data mais antiga das corridas
-            primeira_corrida = db.session.query(Corrida).order_by(Corrida.data).first()
-            if primeira_corrida:
-                start_date = primeira_corrida.data.date()
-            else:
-                start_date = (datetime.utcnow() - timedelta(days=365)).date()
-        else:
-            start_date = datetime.fromisoformat(start_date).date()
-        
-        if not end_date:
-            end_date = datetime.utcnow().date()
-        else:
-            end_date = datetime.fromisoformat(end_date).date()
-        
-        # Query base para corridas
-        corridas_query = db.session.query(Corrida).filter(
-            func.date(Corrida.data).between(start_date, end_date)
-        )
+        # Cache com stale-while-revalidate (política 'overview')
+        record, cache_state = cache_service.get_or_refresh_record(*overview_fragment(request.args.copy()))
+        logger.info(f"📊 Overview - cache {cache_state}")
         
-        if municipio:
-            corridas_query = corridas_query.filter(Corrida.municipio == municipio)
-        
-        # Métricas principais
-        total_corridas = corridas_query.count()
-        corridas_concluidas = corridas_query.filter(Corrida.status == StatusCorrida.CONCLUIDA).count()
-        corridas_canceladas = corridas_query.filter(Corrida.status == StatusCorrida.CANCELADA).count()
-        corridas_perdidas = corridas_query.filter(Corrida.status == StatusCorrida.PERDIDA).count()
-        
-        # Taxa de conversão
-        taxa_conversao = 0
-        if total_corridas > 0:
-            taxa_conversao = (corridas_concluidas / total_corridas) * 100
-        
-        # Receita total
-        receita_total = db.session.query(func.coalesce(func.sum(Corrida.valor), 0)).filter(
-            and_(
-                func.date(Corrida.data).between(start_date, end_date),
-                Corrida.status == StatusCorrida.CONCLUIDA,
-                Corrida.municipio == municipio if municipio else True
-            )
-        ).scalar() or 0
-        
-        # Receita média por corrida
-        receita_media = receita_total / corridas_concluidas if corridas_concluidas > 0 else 0
-        
-        # Motoristas ativos
-        motoristas_ativos = db.session.query(func.count(func.distinct(Corrida.motorista_nome))).filter(
-            and_(
-                func.date(Corrida.data).between(start_date, end_date),
-                Corrida.municipio == municipio if municipio else True
-            )
-        ).scalar() or 0
-        
-        # Usuários únicos
-        usuarios_unicos = db.session.query(func.count(func.distinct(Corrida.usuario_nome))).filter(
-            and_(
-                func.date(Corrida.data).between(start_date, end_date),
-                Corrida.municipio == municipio if municipio else True
-            )
-        ).scalar() or 0
-        
-        # Avaliação média
-        avaliacao_media = db.session.query(func.avg(Corrida.avaliacao)).filter(
-            and_(
-                func.date(Corrida.data).between(start_date, end_date),
-                Corrida.status == StatusCorrida.CONCLUIDA,
-                Corrida.avaliacao.isnot(None),
-                Corrida.municipio == municipio if municipio else True
-            )
-        ).scalar() or 0
-        
-        # Comparação com período anterior
-        previous_start = start_date - (end_date - start_date + timedelta(days=1))
-        previous_end = start_date - timedelta(days=1)
-        
-        previous_corridas = db.session.query(func.count(Corrida.id)).filter(
-            and_(
-                func.date(Corrida.data).between(previous_start, previous_end),
-                Corrida.municipio == municipio if municipio else True
-            )
-        ).scalar() or 0
-        
-        previous_receita = db.session.query(func.coalesce(func.sum(Corrida.valor), 0)).filter(
-            and_(
-                func.date(Corrida.data).between(previous_start, previous_end),
-                Corrida.status == StatusCorrida.CONCLUIDA,
-                Corrida.municipio == municipio if municipio else True
-            )
-        ).scalar() or 0
-        
-        # Calcular variações percentuais
-        variacao_corridas = 0
-        if previous_corridas > 0:
-            variacao_corridas = ((total_corridas - previous_corridas) / previous_corridas) * 100
-        
-        variacao_receita = 0
-        if previous_receita > 0:
-            variacao_receita = ((receita_total - previous_receita) / previous_receita) * 100
-        
-        # Preparar dados para resposta e cache
-        response_data = {
-            'periodo': {
-                'start_date': start_date.isoformat(),
-                'end_date': end_date.isoformat(),
-                'municipio': municipio
-            },
-            'metricas_principais': {
-                'total_corridas': total_corridas,
-                'corridas_concluidas': corridas_concluidas,
-                'corridas_canceladas': corridas_canceladas,
-                'corridas_perdidas': corridas_perdidas,
-                'taxa_conversao': round(taxa_conversao, 2),
-                'receita_total': float(receita_total),
-                'receita_media_corrida': round(float(receita_media), 2),
-                'motoristas_ativos': motoristas_ativos,
-                'usuarios_unicos': usuarios_unicos,
-                'avaliacao_media': round(float(avaliacao_media), 2)
-            },
-            'comparacao_anterior': {
-                'variacao_corridas': round(variacao_corridas, 2),
-                'variacao_receita': round(variacao_receita, 2)
-            }
-        }
-        
-        # Armazenar no cache (5 minutos TTL)
-        cache_service.set_dashboard_overview(cache_params, response_data, 300)
-        logger.info("📊 Overview armazenado no cache")
-        
-        return jsonify({
-            'success': True,
-            'data': response_data,
-            'from_cache': False
-        })
+        return cached_json_response(record, cache_state)
         
     except Exception as e:
         logger.error(f"Erro ao buscar overview: {e}")
@@ -183,12 +44,9 @@ def get_overview():
 def get_municipios():
     """Retorna lista de municípios disponíveis"""
     try:
-        municipios = db.session.query(Corrida.municipio).distinct().order_by(Corrida.municipio).all()
+        record, cache_state = cache_service.get_or_refresh_record(*municipios_fragment(request.args.copy()))
         
-        return jsonify({
-            'success': True,
-            'data': [m[0] for m in municipios if m[0]]
-        })
+        return cached_json_response(record, cache_state)
         
     except Exception as e:
         logger.error(f"Erro ao buscar municípios: {e}")
@@ -201,58 +59,10 @@ def get_municipios():
 def get_metricas_diarias():
     """Retorna métricas diárias para gráficos"""
     try:
-        municipio = request.args.get('municipio')
-        start_date = request.args.get('start_date')
-        end_date = request.args.get('end_date')
-        
-        # Definir período padrão (todos os dados se não especificado)
-        if not start_date:
-            # Buscar a data mais antiga dos dados
-            primeira_metrica = db.session.query(MetricaDiaria).order_by(MetricaDiaria.data).first()
-            if primeira_metrica:
-                start_date = primeira_metrica.data
-            else:
-                start_date = (datetime.utcnow() - timedelta(days=365)).date()
-        else:
-            start_date = datetime.fromisoformat(start_date).date()
-        
-        if not end_date:
-            end_date = datetime.utcnow().date()
-        else:
-            end_date = datetime.fromisoformat(end_date).date()
-        
-        # Query base
-        query = db.session.query(MetricaDiaria).filter(
-            MetricaDiaria.data.between(start_date, end_date)
-        )
-        
-        if municipio:
-            query = query.filter(MetricaDiaria.municipio == municipio)
-        
-        # Buscar métricas
-        metricas = query.order_by(MetricaDiaria.data).all()
-        
-        # Organizar dados para gráficos
-        dados_grafico = []
-        for metrica in metricas:
-            dados_grafico.append({
-                'data': metrica.data.isoformat(),
-                'municipio': metrica.municipio,
-                'total_corridas': metrica.total_corridas,
-                'corridas_concluidas': metrica.corridas_concluidas,
-                'corridas_canceladas': metrica.corridas_canceladas,
-                'receita_total': float(metrica.receita_total),
-                'receita_media_corrida': float(metrica.ticket_medio or 0),
-                'taxa_conversao': float(metrica.taxa_conversao),
-                'motoristas_ativos': metrica.motoristas_ativos,
-                'usuarios_unicos': metrica.usuarios_unicos,
-                'avaliacao_media': float(metrica.avaliacao_media)
-            })
+        # Cache com stale-while-revalidate (política 'metricas')
+        record, cache_state = cache_service.get_or_refresh_record(*metricas_fragment(request.args.copy()))
         
-        return jsonify({
-            'success': True,
-            'data': dados_grafico
-        })
+        return cached_json_response(record, cache_state)
         
     except Exception as e:
         logger.error(f"Erro ao buscar métricas diárias: {e}")
@@ -265,57 +75,39 @@ def get_metricas_diarias():
 def get_ranking_municipios():
     """Retorna ranking de municípios por performance"""
     try:
-        start_date = request.args.get('start_date')
-        end_date = request.args.get('end_date')
+        # Cache com stale-while-revalidate (política 'ranking')
+        record, cache_state = cache_service.get_or_refresh_record(*ranking_fragment(request.args.copy()))
         
-        # Definir período padrão (últimos 30 dias)
-        if not start_date:
-            start_date = (datetime.utcnow() - timedelta(days=30)).date()
-        else:
-            start_date = datetime.fromisoformat(start_date).date()
+        return cached_json_response(record, cache_state)
         
-        if not end_date:
-            end_date = datetime.utcnow().date()
-        else:
-            end_date = datetime.fromisoformat(end_date).date()
-        
-        # Agregar métricas por município
-        ranking = db.session.query(
-            MetricaDiaria.municipio,
-            func.sum(MetricaDiaria.total_corridas).label('total_corridas'),
-            func.sum(MetricaDiaria.corridas_concluidas).label('corridas_concluidas'),
-            func.sum(MetricaDiaria.receita_total).label('receita_total'),
-            func.avg(MetricaDiaria.taxa_conversao).label('taxa_conversao_media'),
-            func.avg(MetricaDiaria.avaliacao_media).label('avaliacao_media'),
-            func.avg(MetricaDiaria.motoristas_ativos).label('motoristas_ativos_media')
-        ).filter(
-            MetricaDiaria.data.between(start_date, end_date)
-        ).group_by(
-            MetricaDiaria.municipio
-        ).order_by(
-            func.sum(MetricaDiaria.receita_total).desc()
-        ).all()
+    except Exception as e:
+        logger.error(f"Erro ao buscar ranking de municípios: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@bp.route('/resumo', methods=['GET'])
+def get_resumo():
+    """
+    Retorna overview, métricas diárias, ranking e municípios em uma única
+    resposta; os fragmentos em cache são lidos em uma única ida ao Redis
+    """
+    try:
+        args = request.args.copy()
+        partes = {
+            'overview': overview_fragment(args),
+            'metricas_diarias': metricas_fragment(args),
+            'ranking_municipios': ranking_fragment(args),
+            'municipios': municipios_fragment(args)
+        }
         
-        dados_ranking = []
-        for i, item in enumerate(ranking, 1):
-            dados_ranking.append({
-                'posicao': i,
-                'municipio': item.municipio,
-                'total_corridas': int(item.total_corridas or 0),
-                'corridas_concluidas': int(item.corridas_concluidas or 0),
-                'receita_total': float(item.receita_total or 0),
-                'taxa_conversao_media': round(float(item.taxa_conversao_media or 0), 2),
-                'avaliacao_media': round(float(item.avaliacao_media or 0), 2),
-                'motoristas_ativos_media': round(float(item.motoristas_ativos_media or 0), 1)
-            })
+        resultados = cache_service.get_or_refresh_many(list(partes.values()))
         
-        return jsonify({
-            'success': True,
-            'data': dados_ranking
-        })
+        return cached_json_bundle(dict(zip(partes.keys(), resultados)))
         
     except Exception as e:
-        logger.error(f"Erro ao buscar ranking de municípios: {e}")
+        logger.error(f"Erro ao buscar resumo do dashboard: {e}")
         return jsonify({
             'success': False,
             'error': str(e)
@@ -326,50 +118,55 @@ def get_metas_performance():
     """Retorna performance vs metas"""
     try:
         municipio = request.args.get('municipio')
-        mes = request.args.get('mes')
+        mes = request.args.get('mes') or datetime.utcnow().date()
         
-        if not mes:
-            mes = datetime.utcnow().replace(day=1).date()
-        else:
-            mes = datetime.fromisoformat(mes).date()
+        # Intervalo de meses: mes_inicio/mes_fim (inclusivos) ou apenas `mes`
+        periodo = Periodo(
+            Periodo.from_month(request.args.get('mes_inicio') or mes).start_date,
+            Periodo.from_month(request.args.get('mes_fim') or request.args.get('mes_inicio') or mes).end_date
+        )
         
-        # Query base para metas
+        # Query base para metas (intervalo dos meses, sem date_trunc na coluna)
         metas_query = db.session.query(Meta).filter(
-            func.date_trunc('month', Meta.mes) == mes
+            periodo.filter_dates(Meta.mes)
         )
         
         if municipio:
             metas_query = metas_query.filter(Meta.municipio == municipio)
         
-        metas = metas_query.all()
+        metas = metas_query.order_by(Meta.mes, Meta.municipio).all()
+        
+        # Performance real de todos os (município, mês) em uma única query,
+        # independente da quantidade de metas ou de meses no intervalo
+        performance_query = db.session.query(
+            MetricaMensal.municipio,
+            MetricaMensal.mes,
+            func.sum(MetricaMensal.corridas_concluidas).label('corridas_realizadas'),
+            func.sum(MetricaMensal.receita_total).label('receita_realizada'),
+            func.sum(MetricaMensal.motoristas_ativos_media).label('motoristas_ativos_media')
+        ).filter(
+            periodo.filter_dates(MetricaMensal.mes)
+        )
+        
+        if municipio:
+            performance_query = performance_query.filter(MetricaMensal.municipio == municipio)
+        
+        performances = {
+            (linha.municipio, linha.mes): linha
+            for linha in performance_query.group_by(MetricaMensal.municipio, MetricaMensal.mes).all()
+        }
         
         dados_metas = []
         for meta in metas:
-            # Buscar performance real do mês
-            start_month = meta.mes.replace(day=1)
-            if start_month.month == 12:
-                end_month = start_month.replace(year=start_month.year + 1, month=1) - timedelta(days=1)
-            else:
-                end_month = start_month.replace(month=start_month.month + 1) - timedelta(days=1)
-            
-            performance = db.session.query(
-                func.sum(MetricaDiaria.corridas_concluidas).label('corridas_realizadas'),
-                func.sum(MetricaDiaria.receita_total).label('receita_realizada'),
-                func.avg(MetricaDiaria.motoristas_ativos).label('motoristas_ativos_media')
-            ).filter(
-                and_(
-                    MetricaDiaria.municipio == meta.municipio,
-                    MetricaDiaria.data.between(start_month, end_month)
-                )
-            ).first()
+            performance = performances.get((meta.municipio, month_start(meta.mes)))
             
-            corridas_realizadas = int(performance.corridas_realizadas or 0)
-            receita_realizada = float(performance.receita_realizada or 0)
-            motoristas_ativos = int(performance.motoristas_ativos_media or 0)
+            corridas_realizadas = int(performance.corridas_realizadas or 0) if performance else 0
+            receita_realizada = float(performance.receita_realizada or 0) if performance else 0.0
+            motoristas_ativos = int(performance.motoristas_ativos_media or 0) if performance else 0
             
             # Calcular percentuais de atingimento
             perc_corridas = (corridas_realizadas / meta.meta_corridas * 100) if meta.meta_corridas > 0 else 0
-            perc_receita = (receita_realizada / meta.meta_receita * 100) if meta.meta_receita else 0
+            perc_receita = (receita_realizada / float(meta.meta_receita) * 100) if meta.meta_receita else 0
             perc_motoristas = (motoristas_ativos / meta.meta_motoristas * 100) if meta.meta_motoristas else 0
             
             dados_metas.append({
@@ -406,46 +203,71 @@ def get_metas_performance():
 
 @bp.route('/motoristas-performance', methods=['GET'])
 def get_motoristas_performance():
-    """Retorna performance dos motoristas"""
+    """Retorna performance dos motoristas (ranking por receita com paginação por cursor)"""
     try:
         municipio = request.args.get('municipio')
-        start_date = request.args.get('start_date')
-        end_date = request.args.get('end_date')
-        limit = int(request.args.get('limit', 20))
+        try:
+            limit = int(request.args.get('limit', 20))
+            if limit < 1:
+                raise ValueError('limit deve ser maior que zero')
+            limit = min(limit, MAX_PAGE_SIZE)
+            cursor = decode_ranking_cursor(request.args.get('cursor'))
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
         
         # Definir período padrão (últimos 30 dias)
-        if not start_date:
-            start_date = (datetime.utcnow() - timedelta(days=30)).date()
-        else:
-            start_date = datetime.fromisoformat(start_date).date()
+        periodo = resolve_period(request.args, default_days=30)
         
-        if not end_date:
-            end_date = datetime.utcnow().date()
-        else:
-            end_date = datetime.fromisoformat(end_date).date()
-        
-        # Agregar performance por motorista
+        # Top-K sobre o rollup diário por motorista (sem varrer corridas).
+        # Receita arredondada em centavos para que o cursor compare por igualdade
+        receita_total = func.round(func.coalesce(func.sum(MetricaMotoristaDiaria.receita_total), 0), 2)
         query = db.session.query(
-            Corrida.motorista_nome,
-            Corrida.municipio,
-            func.count(Corrida.id).label('total_corridas'),
-            func.sum(func.case([(Corrida.status == StatusCorrida.CONCLUIDA, 1)], else_=0)).label('corridas_concluidas'),
-            func.sum(func.case([(Corrida.status == StatusCorrida.CANCELADA, 1)], else_=0)).label('corridas_canceladas'),
-            func.coalesce(func.sum(func.case([(Corrida.status == StatusCorrida.CONCLUIDA, Corrida.valor)], else_=0)), 0).label('receita_total'),
-            func.coalesce(func.avg(func.case([(Corrida.avaliacao.isnot(None), Corrida.avaliacao)], else_=None)), 0).label('avaliacao_media')
+            MetricaMotoristaDiaria.motorista_nome,
+            MetricaMotoristaDiaria.municipio,
+            func.sum(MetricaMotoristaDiaria.total_corridas).label('total_corridas'),
+            func.sum(MetricaMotoristaDiaria.corridas_concluidas).label('corridas_concluidas'),
+            func.sum(MetricaMotoristaDiaria.corridas_canceladas).label('corridas_canceladas'),
+            receita_total.label('receita_total'),
+            func.sum(MetricaMotoristaDiaria.avaliacao_soma).label('avaliacao_soma'),
+            func.sum(MetricaMotoristaDiaria.avaliacao_quantidade).label('avaliacao_quantidade')
         ).filter(
-            func.date(Corrida.data).between(start_date, end_date)
+            periodo.filter_dates(MetricaMotoristaDiaria.data)
         )
         
         if municipio:
-            query = query.filter(Corrida.municipio == municipio)
+            query = query.filter(MetricaMotoristaDiaria.municipio == municipio)
         
-        motoristas_performance = query.group_by(
-            Corrida.motorista_nome,
-            Corrida.municipio
-        ).order_by(
-            func.coalesce(func.sum(func.case([(Corrida.status == StatusCorrida.CONCLUIDA, Corrida.valor)], else_=0)), 0).desc()
-        ).limit(limit).all()
+        query = query.group_by(
+            MetricaMotoristaDiaria.motorista_nome,
+            MetricaMotoristaDiaria.municipio
+        )
+        
+        # Keyset: continua após a última linha da página anterior
+        if cursor:
+            ultima_receita, ultimo_nome, ultimo_municipio = cursor
+            query = query.having(or_(
+                receita_total < ultima_receita,
+                and_(receita_total == ultima_receita, or_(
+                    MetricaMotoristaDiaria.motorista_nome > ultimo_nome,
+                    and_(MetricaMotoristaDiaria.motorista_nome == ultimo_nome,
+                         MetricaMotoristaDiaria.municipio > ultimo_municipio)
+                ))
+            ))
+        
+        motoristas_performance = query.order_by(
+            receita_total.desc(),
+            MetricaMotoristaDiaria.motorista_nome,
+            MetricaMotoristaDiaria.municipio
+        ).limit(limit + 1).all()
+        
+        proximo_cursor = None
+        if len(motoristas_performance) > limit:
+            motoristas_performance = motoristas_performance[:limit]
+            ultima = motoristas_performance[-1]
+            proximo_cursor = encode_ranking_cursor(ultima.receita_total, ultima.motorista_nome, ultima.municipio)
         
         dados_motoristas = []
         for performance in motoristas_performance:
@@ -455,23 +277,31 @@ def get_motoristas_performance():
             
             receita_media = 0
             if performance.corridas_concluidas > 0:
-                receita_media = performance.receita_total / performance.corridas_concluidas
+                receita_media = float(performance.receita_total) / performance.corridas_concluidas
+            
+            avaliacao_media = 0
+            if performance.avaliacao_quantidade:
+                avaliacao_media = performance.avaliacao_soma / performance.avaliacao_quantidade
             
             dados_motoristas.append({
                 'nome': performance.motorista_nome,
                 'municipio': performance.municipio,
-                'total_corridas': performance.total_corridas,
-                'corridas_concluidas': performance.corridas_concluidas,
-                'corridas_canceladas': performance.corridas_canceladas,
+                'total_corridas': int(performance.total_corridas),
+                'corridas_concluidas': int(performance.corridas_concluidas),
+                'corridas_canceladas': int(performance.corridas_canceladas),
                 'taxa_conversao': round(taxa_conversao, 2),
                 'receita_total': float(performance.receita_total),
                 'receita_media_corrida': round(receita_media, 2),
-                'avaliacao_media': round(float(performance.avaliacao_media), 2)
+                'avaliacao_media': round(avaliacao_media, 2)
             })
         
         return jsonify({
             'success': True,
-            'data': dados_motoristas
+            'data': dados_motoristas,
+            'paginacao': {
+                'limit': limit,
+                'next_cursor': proximo_cursor
+            }
         })
         
     except Exception as e:
@@ -480,3 +310,212 @@ def get_motoristas_performance():
             'success': False,
             'error': str(e)
         }), 500
+
+def cached_json_response(record, cache_state: str):
+    """Resposta {success, data, from_cache} usando o JSON de `data` já codificado no cache"""
+    from_cache = b'true' if cache_state != 'miss' else b'false'
+    body = b'{"success":true,"data":' + record.json() + b',"from_cache":' + from_cache + b'}'
+    return current_app.response_class(body, mimetype='application/json')
+
+def overview_fragment(args):
+    """(prefixo, parâmetros, cálculo, chave) do cache do overview para os parâmetros da requisição"""
+    # Período padrão: todos os dados; chave a partir dos parâmetros canônicos
+    consulta = canonical_query(args, default_days=365, default_start=earliest_date(Corrida.data))
+    periodo, municipio, municipios = consulta.periodo, consulta.municipio, consulta.municipios
+    
+    def build_overview():
+        # Partições das quais o valor depende (inclui o período anterior da comparação)
+        cache_service.declare_scope(periodo.previous().start_date, periodo.end_date,
+                                    consulta.scope_municipios())
+        
+        if municipios:
+            # Total do conjunto + detalhamento por município em uma única passada
+            metricas, por_municipio = aggregation_service.get_overview_by_municipio(periodo, municipios)
+            return {
+                'periodo': {
+                    **periodo.to_dict(),
+                    'municipio': None,
+                    'municipios': municipios
+                },
+                **build_overview_sections(metricas),
+                'por_municipio': [
+                    {'municipio': nome, **build_overview_sections(por_municipio[nome])}
+                    for nome in municipios
+                ]
+            }
+        
+        # Todas as métricas (período atual e anterior) em uma única query
+        metricas = aggregation_service.get_overview_metrics(periodo, municipio)
+        return {
+            'periodo': {
+                **periodo.to_dict(),
+                'municipio': municipio
+            },
+            **build_overview_sections(metricas)
+        }
+    
+    return 'overview', consulta.cache_params(), build_overview, None
+
+def municipios_fragment(args):
+    """(prefixo, parâmetros, cálculo, chave) do cache da lista de municípios"""
+    def build_municipios():
+        municipios = db.session.query(Corrida.municipio).distinct().order_by(Corrida.municipio).all()
+        return [m[0] for m in municipios if m[0]]
+    
+    return 'municipios', None, build_municipios, 'dashboard:municipios'
+
+def metricas_fragment(args):
+    """(prefixo, parâmetros, cálculo, chave) do cache das métricas diárias"""
+    # Período padrão: todos os dados
+    consulta = canonical_query(args, default_days=365, default_start=earliest_date(MetricaDiaria.data))
+    periodo, municipio = consulta.periodo, consulta.municipio
+    
+    def build_metricas():
+        cache_service.declare_scope(periodo.start_date, periodo.end_date,
+                                    [municipio] if municipio else None)
+        
+        # Query base
+        query = db.session.query(MetricaDiaria).filter(
+            periodo.filter_dates(MetricaDiaria.data)
+        )
+        
+        if municipio:
+            query = query.filter(MetricaDiaria.municipio == municipio)
+        
+        # Buscar métricas
+        metricas = query.order_by(MetricaDiaria.data).all()
+        
+        # Organizar dados para gráficos
+        dados_grafico = []
+        for metrica in metricas:
+            dados_grafico.append({
+                'data': metrica.data.isoformat(),
+                'municipio': metrica.municipio,
+                'total_corridas': metrica.total_corridas,
+                'corridas_concluidas': metrica.corridas_concluidas,
+                'corridas_canceladas': metrica.corridas_canceladas,
+                'receita_total': float(metrica.receita_total),
+                'receita_media_corrida': float(metrica.ticket_medio or 0),
+                'taxa_conversao': float(metrica.taxa_conclusao or 0),
+                'motoristas_ativos': metrica.motoristas_ativos,
+                'usuarios_unicos': metrica.usuarios_unicos or 0,
+                'avaliacao_media': float(metrica.avaliacao_media or 0)
+            })
+        
+        return dados_grafico
+    
+    return 'metricas', consulta.cache_params(), build_metricas, None
+
+def ranking_fragment(args):
+    """(prefixo, parâmetros, cálculo, chave) do cache do ranking de municípios"""
+    # Período padrão: últimos 30 dias
+    periodo = canonical_query(args, default_days=30).periodo
+    
+    def build_ranking():
+        cache_service.declare_scope(periodo.start_date, periodo.end_date)
+        
+        if columnar_service.is_ready():
+            ranking = columnar_service.get_municipio_ranking(periodo)
+        else:
+            # Agregar métricas por município
+            ranking = db.session.query(
+                MetricaDiaria.municipio,
+                func.sum(MetricaDiaria.total_corridas).label('total_corridas'),
+                func.sum(MetricaDiaria.corridas_concluidas).label('corridas_concluidas'),
+                func.sum(MetricaDiaria.receita_total).label('receita_total'),
+                func.avg(MetricaDiaria.taxa_conclusao).label('taxa_conversao_media'),
+                func.avg(MetricaDiaria.avaliacao_media).label('avaliacao_media'),
+                func.avg(MetricaDiaria.motoristas_ativos).label('motoristas_ativos_media')
+            ).filter(
+                periodo.filter_dates(MetricaDiaria.data)
+            ).group_by(
+                MetricaDiaria.municipio
+            ).order_by(
+                func.sum(MetricaDiaria.receita_total).desc()
+            ).all()
+        
+        dados_ranking = []
+        for i, item in enumerate(ranking, 1):
+            dados_ranking.append({
+                'posicao': i,
+                'municipio': item.municipio,
+                'total_corridas': int(item.total_corridas or 0),
+                'corridas_concluidas': int(item.corridas_concluidas or 0),
+                'receita_total': float(item.receita_total or 0),
+                'taxa_conversao_media': round(float(item.taxa_conversao_media or 0), 2),
+                'avaliacao_media': round(float(item.avaliacao_media or 0), 2),
+                'motoristas_ativos_media': round(float(item.motoristas_ativos_media or 0), 1)
+            })
+        
+        return dados_ranking
+    
+    return 'ranking', periodo.to_dict(), build_ranking, None
+
+def cached_json_bundle(partes: dict):
+    """Resposta {success, data: {parte: ...}, from_cache: {parte: bool}} com os JSONs já codificados"""
+    dados = b','.join(json.dumps(nome).encode() + b':' + record.json()
+                      for nome, (record, _) in partes.items())
+    from_cache = {nome: estado != 'miss' for nome, (_, estado) in partes.items()}
+    body = b'{"success":true,"data":{' + dados + b'},"from_cache":' + json.dumps(from_cache).encode() + b'}'
+    return current_app.response_class(body, mimetype='application/json')
+
+def encode_ranking_cursor(receita, motorista_nome: str, municipio: str) -> str:
+    """Cursor opaco com a chave de ordenação da última linha retornada"""
+    chave = json.dumps([str(receita), motorista_nome, municipio])
+    return base64.urlsafe_b64encode(chave.encode('utf-8')).decode('ascii')
+
+def decode_ranking_cursor(cursor: str):
+    """Inverso de encode_ranking_cursor; None quando não há cursor"""
+    if not cursor:
+        return None
+    try:
+        receita, motorista_nome, municipio = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return Decimal(receita), motorista_nome, municipio
+    except (ValueError, TypeError, ArithmeticError):
+        raise ValueError('cursor inválido')
+
+def build_overview_sections(metricas: dict) -> dict:
+    """Seções metricas_principais e comparacao_anterior do overview"""
+    total_corridas = metricas['total_corridas']
+    corridas_concluidas = metricas['corridas_concluidas']
+    receita_total = metricas['receita_total']
+    previous_corridas = metricas['previous_corridas']
+    previous_receita = metricas['previous_receita']
+    
+    # Taxa de conversão
+    taxa_conversao = 0
+    if total_corridas > 0:
+        taxa_conversao = (corridas_concluidas / total_corridas) * 100
+    
+    # Receita média por corrida
+    receita_media = receita_total / corridas_concluidas if corridas_concluidas > 0 else 0
+    
+    # Calcular variações percentuais
+    variacao_corridas = 0
+    if previous_corridas > 0:
+        variacao_corridas = ((total_corridas - previous_corridas) / previous_corridas) * 100
+    
+    variacao_receita = 0
+    if previous_receita > 0:
+        variacao_receita = ((receita_total - previous_receita) / previous_receita) * 100
+    
+    return {
+        'metricas_principais': {
+            'total_corridas': total_corridas,
+            'corridas_concluidas': corridas_concluidas,
+            'corridas_canceladas': metricas['corridas_canceladas'],
+            'corridas_perdidas': metricas['corridas_perdidas'],
+            'taxa_conversao': round(taxa_conversao, 2),
+            'receita_total': float(receita_total),
+            'receita_media_corrida': round(float(receita_media), 2),
+            'motoristas_ativos': metricas['motoristas_ativos'],
+            'usuarios_unicos': metricas['usuarios_unicos'],
+            # Motoristas e usuários estimados pelos sketches HyperLogLog (~1,6% de erro)
+            'aproximado': metricas.get('aproximado', False),
+            'avaliacao_media': round(float(metricas['avaliacao_media']), 2)
+        },
+        'comparacao_anterior': {
+            'variacao_corridas': round(variacao_corridas, 2),
+            'variacao_receita': round(variacao_receita, 2)
+        }
+    }
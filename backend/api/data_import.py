@@ -1,7 +1,9 @@
 from flask import Blueprint, request, jsonify
 from werkzeug.utils import secure_filename
 import os
+from backend.models import db, ImportLog
 from backend.services.import_service import ImportService
+from backend.services.import_job_service import import_job_service, FINAL_STATUSES
 import logging
 logger = logging.getLogger(__name__)
 
@@ -115,9 +117,20 @@ def execute_import():
                 'error': 'Mapeamento de colunas é obrigatório'
             }), 400
         
-        # Executar importação baseado no tipo
+        # Corridas: job em background; o cliente acompanha por /status/<id>
         if import_type == 'corridas':
-            result = import_service.import_corridas(filepath, column_mapping)
+            import_log = import_service.create_import_log(filepath, 'corridas', status='queued')
+            import_log_id = import_log.id
+            import_job_service.submit(
+                import_log_id, lambda: _run_corridas_import(filepath, column_mapping, import_log_id))
+            
+            return jsonify({
+                'success': True,
+                'data': {
+                    **import_log.to_dict(),
+                    'status_url': f'/api/import/status/{import_log_id}'
+                }
+            }), 202
         elif import_type == 'motoristas':
             # TODO: Implementar importação de motoristas
             result = {'success': False, 'error': 'Importação de motoristas não implementada ainda'}
@@ -128,11 +141,7 @@ def execute_import():
             result = {'success': False, 'error': f'Tipo de importação não suportado: {import_type}'}
         
         # Remover arquivo após importação (sucesso ou erro)
-        try:
-            if os.path.exists(filepath):
-                os.remove(filepath)
-        except Exception as e:
-            logger.warning(f"Não foi possível remover arquivo temporário: {e}")
+        _remove_upload(filepath)
         
         return jsonify(result)
         
@@ -143,12 +152,59 @@ def execute_import():
             'error': str(e)
         }), 500
 
+def _run_corridas_import(filepath, column_mapping, import_log_id):
+    """
+    Job de importação de corridas; o arquivo é removido antes do status
+    final (sucesso ou erro) e, se o job falhar antes, antes de marcá-lo
+    como 'failed'
+    """
+    try:
+        return import_service.import_corridas(filepath, column_mapping, import_log_id, remove_file=True)
+    finally:
+        _remove_upload(filepath)
+
+def _remove_upload(filepath):
+    """Remove o arquivo temporário do upload"""
+    try:
+        if os.path.exists(filepath):
+            os.remove(filepath)
+    except Exception as e:
+        logger.warning(f"Não foi possível remover arquivo temporário: {e}")
+
+@bp.route('/status/<int:import_log_id>', methods=['GET'])
+def get_import_status(import_log_id):
+    """Endpoint para acompanhar uma importação (status e linhas processadas)"""
+    try:
+        import_job_service.reap_stale()
+        import_log = db.session.get(ImportLog, import_log_id)
+        if import_log is None:
+            return jsonify({
+                'success': False,
+                'error': 'Importação não encontrada'
+            }), 404
+        
+        return jsonify({
+            'success': True,
+            'data': {
+                **import_log.to_dict(),
+                'finished': import_log.status in FINAL_STATUSES
+            }
+        })
+        
+    except Exception as e:
+        logger.error(f"Erro ao buscar status da importação: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
 @bp.route('/history', methods=['GET'])
 def get_import_history():
     """Endpoint para buscar histórico de importações"""
     try:
         limit = int(request.args.get('limit', 50))
         
+        import_job_service.reap_stale()
         history = import_service.get_import_history(limit)
         
         return jsonify({
@@ -85,31 +85,26 @@ def chat():
 def get_insights():
     """Gera insights automáticos baseados nos dados atuais"""
     try:
-        # Verificar cache de insights primeiro
-        cached_insights = cache_service.get("dashboard:insights")
-        if cached_insights:
+        def build_insights():
+            # Obter dados do dashboard e gerar insights com LLM síncrono
+            dashboard_data = _get_dashboard_data_for_context()
+            return llm_service.generate_insights_sync(dashboard_data)
+        
+        # Cache por 15 minutos (+15 servindo o anterior enquanto um único
+        # worker gera o novo); só respostas com sucesso são guardadas
+        response, cache_state = cache_service.get_or_compute(
+            "dashboard:insights", build_insights, ttl=900, stale_ttl=900,
+            cache_if=lambda r: r.get('success')
+        )
+        if cache_state == 'miss':
+            logger.info("🔍 Insights gerados")
+        else:
             logger.info("🔍 Insights recuperados do cache")
-            return jsonify({
-                'success': True,
-                'data': cached_insights,
-                'from_cache': True
-            })
-        
-        # Obter dados do dashboard
-        dashboard_data = _get_dashboard_data_for_context()
-        
-        # Gerar insights com LLM síncrono
-        response = llm_service.generate_insights_sync(dashboard_data)
-        
-        if response['success']:
-            # Cache por 15 minutos
-            cache_service.set("dashboard:insights", response, 900)
-            logger.info("🔍 Insights gerados e armazenados no cache")
         
         return jsonify({
             'success': response['success'],
             'data': response,
-            'from_cache': False
+            'from_cache': cache_state != 'miss'
         })
         
     except Exception as e:
@@ -135,32 +130,25 @@ def generate_report():
                 'error': f'Tipo de relatório inválido. Use: {", ".join(valid_types)}'
             }), 400
         
-        # Verificar cache específico do tipo de relatório
-        cache_key = f"dashboard:report:{report_type}"
-        cached_report = cache_service.get(cache_key)
-        if cached_report:
+        def build_report():
+            # Obter dados do dashboard e gerar relatório com LLM síncrono
+            dashboard_data = _get_dashboard_data_for_context()
+            return llm_service.generate_report_sync(dashboard_data, report_type)
+        
+        # Cache específico do tipo por 30 minutos (+30 servindo o anterior)
+        response, cache_state = cache_service.get_or_compute(
+            f"dashboard:report:{report_type}", build_report, ttl=1800, stale_ttl=1800,
+            cache_if=lambda r: r.get('success')
+        )
+        if cache_state == 'miss':
+            logger.info(f"📋 Relatório {report_type} gerado")
+        else:
             logger.info(f"📋 Relatório {report_type} recuperado do cache")
-            return jsonify({
-                'success': True,
-                'data': cached_report,
-                'from_cache': True
-            })
-        
-        # Obter dados do dashboard
-        dashboard_data = _get_dashboard_data_for_context()
-        
-        # Gerar relatório com LLM síncrono
-        response = llm_service.generate_report_sync(dashboard_data, report_type)
-        
-        if response['success']:
-            # Cache por 30 minutos
-            cache_service.set(cache_key, response, 1800)
-            logger.info(f"📋 Relatório {report_type} gerado e armazenado no cache")
         
         return jsonify({
             'success': response['success'],
             'data': response,
-            'from_cache': False
+            'from_cache': cache_state != 'miss'
         })
         
     except Exception as e:
@@ -233,27 +221,14 @@ def get_llm_status():
 def _get_dashboard_data_for_context():
     """Obtém dados atuais do dashboard para contexto do LLM"""
     try:
-        # Tentar usar dados em cache primeiro
-        cache_params = {'municipio': None, 'start_date': None, 'end_date': None}
-        cached_data = cache_service.get_dashboard_overview(cache_params)
+        # Mesma entrada de cache do overview sem filtros (calculada se ausente)
+        from werkzeug.datastructures import MultiDict
+        from backend.api.dashboard import overview_fragment
         
-        if cached_data:
+        data, cache_state = cache_service.get_or_refresh(*overview_fragment(MultiDict()))
+        if cache_state != 'miss':
             logger.info("📊 Dados do dashboard recuperados do cache para LLM")
-            return cached_data
-        
-        # Se não há cache, fazer chamada direta (isso acionará o cache)
-        from flask import Flask
-        from backend.api.dashboard import get_overview
-        
-        # Simular request context para a função
-        with Flask(__name__).test_request_context():
-            overview_response = get_overview()
-            if overview_response.status_code == 200:
-                response_data = overview_response.get_json()
-                return response_data.get('data', {})
-        
-        logger.warning("⚠️ Não foi possível obter dados do dashboard para LLM")
-        return {}
+        return data
         
     except Exception as e:
         logger.error(f"Erro ao obter dados para contexto LLM: {e}")
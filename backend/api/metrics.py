@@ -1,7 +1,12 @@
 from flask import Blueprint, request, jsonify
 from datetime import datetime, timedelta
-from sqlalchemy import func, and_, text
-from backend.models import db, Corrida, Motorista, Meta, MetricaDiaria, StatusCorrida
+from sqlalchemy import func, and_, text, case
+from backend.models import db, Corrida, Motorista, Meta, MetricaDiaria, MetricaHoraria, MetricaSemanal, StatusCorrida
+from backend.services.aggregation_service import aggregation_service
+from backend.services.columnar_service import columnar_service
+from backend.services.period_service import Periodo, resolve_period
+from backend.services.rollup_service import week_start
+from backend.api.conditional import register_conditional_get
 import logging
 logger = logging.getLogger(__name__)
 from fastapi import APIRouter
@@ -26,28 +31,21 @@ async def metrics_overview():
     return JSONResponse(content={"success": True, "data": data})
 bp = Blueprint('metrics', __name__)
 
+# ETag da versão do dataset e 304 sem executar as consultas
+register_conditional_get(bp)
+
 @bp.route('/kpis', methods=['GET'])
 def get_kpis():
     """Retorna KPIs principais"""
     try:
         municipio = request.args.get('municipio')
-        start_date = request.args.get('start_date')
-        end_date = request.args.get('end_date')
         
         # Definir período padrão (últimos 30 dias)
-        if not start_date:
-            start_date = (datetime.utcnow() - timedelta(days=30)).date()
-        else:
-            start_date = datetime.fromisoformat(start_date).date()
-        
-        if not end_date:
-            end_date = datetime.utcnow().date()
-        else:
-            end_date = datetime.fromisoformat(end_date).date()
+        periodo = resolve_period(request.args, default_days=30)
         
         # Base query para métricas
         base_query = db.session.query(MetricaDiaria).filter(
-            MetricaDiaria.data.between(start_date, end_date)
+            periodo.filter_dates(MetricaDiaria.data)
         )
         
         if municipio:
@@ -61,17 +59,15 @@ def get_kpis():
             func.sum(MetricaDiaria.receita_total).label('receita_total'),
             func.avg(MetricaDiaria.ticket_medio).label('ticket_medio'),
             func.avg(MetricaDiaria.taxa_conclusao).label('taxa_conclusao_media'),
-            func.avg(MetricaDiaria.avaliacao_media).label('avaliacao_media'),
-            func.avg(MetricaDiaria.motoristas_ativos).label('motoristas_ativos_media')
+            func.avg(MetricaDiaria.avaliacao_media).label('avaliacao_media')
         ).first()
         
-        # Calcular período anterior para comparação
-        periodo_dias = (end_date - start_date).days + 1
-        previous_start = start_date - timedelta(days=periodo_dias)
-        previous_end = start_date - timedelta(days=1)
+        # Contagens distintas do período (mescla dos sketches diários)
+        unicos = aggregation_service.get_unique_counts(periodo, municipio)
         
-        previous_query = base_query.filter(
-            MetricaDiaria.data.between(previous_start, previous_end)
+        # Calcular período anterior para comparação
+        previous_query = db.session.query(MetricaDiaria).filter(
+            periodo.previous().filter_dates(MetricaDiaria.data)
         )
         
         if municipio:
@@ -80,7 +76,7 @@ def get_kpis():
         previous_result = previous_query.with_entities(
             func.sum(MetricaDiaria.total_corridas).label('total_corridas'),
             func.sum(MetricaDiaria.receita_total).label('receita_total'),
-            func.avg(MetricaDiaria.taxa_conversao).label('taxa_conversao_media')
+            func.avg(MetricaDiaria.taxa_conclusao).label('taxa_conclusao_media')
         ).first()
         
         # Calcular variações
@@ -122,10 +118,12 @@ def get_kpis():
                 'valor': round(float(kpis_result.avaliacao_media or 0), 2)
             },
             'motoristas_ativos': {
-                'valor': round(float(kpis_result.motoristas_ativos_media or 0), 1)
+                'valor': unicos['motoristas_ativos'],
+                'aproximado': unicos['aproximado']
             },
             'usuarios_unicos': {
-                'valor': int(kpis_result.usuarios_unicos_total or 0)
+                'valor': unicos['usuarios_unicos'],
+                'aproximado': unicos['aproximado']
             }
         }
         
@@ -133,8 +131,7 @@ def get_kpis():
             'success': True,
             'data': {
                 'periodo': {
-                    'start_date': start_date.isoformat(),
-                    'end_date': end_date.isoformat(),
+                    **periodo.to_dict(),
                     'municipio': municipio
                 },
                 'kpis': kpis
@@ -153,15 +150,14 @@ def get_tendencias():
     """Retorna análise de tendências"""
     try:
         municipio = request.args.get('municipio')
-        periodo = request.args.get('periodo', '30')  # dias
+        dias = int(request.args.get('periodo', '30'))
         
         # Definir período
-        end_date = datetime.utcnow().date()
-        start_date = end_date - timedelta(days=int(periodo))
+        periodo = Periodo.last_days(dias)
         
         # Query base
         query = db.session.query(MetricaDiaria).filter(
-            MetricaDiaria.data.between(start_date, end_date)
+            periodo.filter_dates(MetricaDiaria.data)
         )
         
         if municipio:
@@ -193,7 +189,7 @@ def get_tendencias():
         # Extrair valores para análise
         corridas_valores = [d.total_corridas for d in dados_diarios]
         receita_valores = [float(d.receita_total) for d in dados_diarios]
-        conversao_valores = [float(d.taxa_conversao) for d in dados_diarios]
+        conversao_valores = [float(d.taxa_conclusao or 0) for d in dados_diarios]
         
         tendencias = {
             'corridas': {
@@ -224,9 +220,8 @@ def get_tendencias():
             'success': True,
             'data': {
                 'periodo_analise': {
-                    'start_date': start_date.isoformat(),
-                    'end_date': end_date.isoformat(),
-                    'dias': int(periodo)
+                    **periodo.to_dict(),
+                    'dias': dias
                 },
                 'tendencias': tendencias
             }
@@ -246,29 +241,28 @@ def get_comparativo_semanal():
         municipio = request.args.get('municipio')
         semanas = int(request.args.get('semanas', 4))
         
-        # Calcular semanas
-        end_date = datetime.utcnow().date()
-        start_date = end_date - timedelta(weeks=semanas)
+        # Semanas completas (segunda a domingo) que cobrem os últimos `semanas * 7` dias
+        ultimos_dias = Periodo.last_days(semanas * 7)
+        periodo = Periodo(week_start(ultimos_dias.start_date), ultimos_dias.end_date)
         
-        # Query com agrupamento por semana
+        # Leitura direta do rollup semanal (uma linha por semana/município)
         query = db.session.query(
-            func.date_trunc('week', MetricaDiaria.data).label('semana'),
-            func.sum(MetricaDiaria.total_corridas).label('total_corridas'),
-            func.sum(MetricaDiaria.corridas_concluidas).label('corridas_concluidas'),
-            func.sum(MetricaDiaria.receita_total).label('receita_total'),
-            func.avg(MetricaDiaria.taxa_conversao).label('taxa_conversao_media'),
-            func.avg(MetricaDiaria.avaliacao_media).label('avaliacao_media')
+            MetricaSemanal.semana,
+            func.sum(MetricaSemanal.total_corridas).label('total_corridas'),
+            func.sum(MetricaSemanal.corridas_concluidas).label('corridas_concluidas'),
+            func.sum(MetricaSemanal.receita_total).label('receita_total'),
+            func.avg(MetricaSemanal.avaliacao_media).label('avaliacao_media')
         ).filter(
-            MetricaDiaria.data.between(start_date, end_date)
+            periodo.filter_dates(MetricaSemanal.semana)
         )
         
         if municipio:
-            query = query.filter(MetricaDiaria.municipio == municipio)
+            query = query.filter(MetricaSemanal.municipio == municipio)
         
         dados_semanais = query.group_by(
-            func.date_trunc('week', MetricaDiaria.data)
+            MetricaSemanal.semana
         ).order_by(
-            func.date_trunc('week', MetricaDiaria.data)
+            MetricaSemanal.semana
         ).all()
         
         comparativo = []
@@ -279,7 +273,9 @@ def get_comparativo_semanal():
                 'total_corridas': int(semana.total_corridas or 0),
                 'corridas_concluidas': int(semana.corridas_concluidas or 0),
                 'receita_total': float(semana.receita_total or 0),
-                'taxa_conversao_media': round(float(semana.taxa_conversao_media or 0), 2),
+                'taxa_conversao_media': round(
+                    float(semana.corridas_concluidas or 0) / semana.total_corridas * 100, 2
+                ) if semana.total_corridas else 0,
                 'avaliacao_media': round(float(semana.avaliacao_media or 0), 2)
             })
         
@@ -287,8 +283,7 @@ def get_comparativo_semanal():
             'success': True,
             'data': {
                 'periodo': {
-                    'start_date': start_date.isoformat(),
-                    'end_date': end_date.isoformat(),
+                    **periodo.to_dict(),
                     'semanas_analisadas': semanas
                 },
                 'comparativo_semanal': comparativo
@@ -307,38 +302,32 @@ def get_distribuicao_horarios():
     """Retorna distribuição de corridas por horário"""
     try:
         municipio = request.args.get('municipio')
-        start_date = request.args.get('start_date')
-        end_date = request.args.get('end_date')
         
         # Definir período padrão (últimos 30 dias)
-        if not start_date:
-            start_date = (datetime.utcnow() - timedelta(days=30)).date()
-        else:
-            start_date = datetime.fromisoformat(start_date).date()
+        periodo = resolve_period(request.args, default_days=30)
         
-        if not end_date:
-            end_date = datetime.utcnow().date()
+        if columnar_service.is_ready():
+            distribuicao_horaria = columnar_service.get_hourly_distribution(periodo, municipio)
         else:
-            end_date = datetime.fromisoformat(end_date).date()
-        
-        # Query para distribuição por hora
-        query = db.session.query(
-            func.extract('hour', Corrida.data).label('hora'),
-            func.count(Corrida.id).label('total_corridas'),
-            func.sum(func.case([(Corrida.status == StatusCorrida.CONCLUIDA, 1)], else_=0)).label('corridas_concluidas'),
-            func.coalesce(func.sum(func.case([(Corrida.status == StatusCorrida.CONCLUIDA, Corrida.valor)], else_=0)), 0).label('receita_total')
-        ).filter(
-            func.date(Corrida.data).between(start_date, end_date)
-        )
+            # Distribuição por hora a partir do rollup metricas_horarias
+            concluida = MetricaHoraria.status == StatusCorrida.CONCLUIDA
+            query = db.session.query(
+                MetricaHoraria.hora,
+                func.sum(MetricaHoraria.total_corridas).label('total_corridas'),
+                func.sum(case((concluida, MetricaHoraria.total_corridas), else_=0)).label('corridas_concluidas'),
+                func.coalesce(func.sum(case((concluida, MetricaHoraria.receita_total), else_=0)), 0).label('receita_total')
+            ).filter(
+                periodo.filter_dates(MetricaHoraria.data)
+            )
         
-        if municipio:
-            query = query.filter(Corrida.municipio == municipio)
+            if municipio:
+                query = query.filter(MetricaHoraria.municipio == municipio)
         
-        distribuicao_horaria = query.group_by(
-            func.extract('hour', Corrida.data)
-        ).order_by(
-            func.extract('hour', Corrida.data)
-        ).all()
+            distribuicao_horaria = query.group_by(
+                MetricaHoraria.hora
+            ).order_by(
+                MetricaHoraria.hora
+            ).all()
         
         dados_horarios = []
         for hora_data in distribuicao_horaria:
@@ -350,8 +339,8 @@ def get_distribuicao_horarios():
             dados_horarios.append({
                 'hora': hora,
                 'hora_formatada': f"{hora:02d}:00",
-                'total_corridas': hora_data.total_corridas,
-                'corridas_concluidas': hora_data.corridas_concluidas,
+                'total_corridas': int(hora_data.total_corridas),
+                'corridas_concluidas': int(hora_data.corridas_concluidas),
                 'receita_total': float(hora_data.receita_total),
                 'taxa_conversao': round(taxa_conversao, 2)
             })
@@ -360,8 +349,7 @@ def get_distribuicao_horarios():
             'success': True,
             'data': {
                 'periodo': {
-                    'start_date': start_date.isoformat(),
-                    'end_date': end_date.isoformat(),
+                    **periodo.to_dict(),
                     'municipio': municipio
                 },
                 'distribuicao_horarios': dados_horarios
@@ -380,92 +368,90 @@ def get_analise_cancelamentos():
     """Retorna análise de cancelamentos"""
     try:
         municipio = request.args.get('municipio')
-        start_date = request.args.get('start_date')
-        end_date = request.args.get('end_date')
         
         # Definir período padrão (últimos 30 dias)
-        if not start_date:
-            start_date = (datetime.utcnow() - timedelta(days=30)).date()
-        else:
-            start_date = datetime.fromisoformat(start_date).date()
-        
-        if not end_date:
-            end_date = datetime.utcnow().date()
+        periodo = resolve_period(request.args, default_days=30)
+        
+        if columnar_service.is_ready():
+            cancelamentos = columnar_service.get_cancellation_analysis(periodo, municipio)
+            motivos = cancelamentos['motivos']
+            cancelamentos_por_hora = cancelamentos['por_horario']
+            cancelamentos_por_municipio = cancelamentos['por_municipio']
+            total_cancelamentos = cancelamentos['total_cancelamentos']
+            total_corridas = cancelamentos['total_corridas']
         else:
-            end_date = datetime.fromisoformat(end_date).date()
-        
-        # Query base para cancelamentos
-        cancelamentos_query = db.session.query(Corrida).filter(
-            and_(
-                func.date(Corrida.data).between(start_date, end_date),
-                Corrida.status == StatusCorrida.CANCELADA
-            )
-        )
-        
-        if municipio:
-            cancelamentos_query = cancelamentos_query.filter(Corrida.municipio == municipio)
-        
-        # Análise por motivo de cancelamento
-        motivos = db.session.query(
-            Corrida.motivo_cancelamento,
-            func.count(Corrida.id).label('quantidade')
-        ).filter(
-            and_(
-                func.date(Corrida.data).between(start_date, end_date),
-                Corrida.status == StatusCorrida.CANCELADA,
-                Corrida.motivo_cancelamento.isnot(None),
-                Corrida.municipio == municipio if municipio else True
+            # Query base para cancelamentos
+            cancelamentos_query = db.session.query(Corrida).filter(
+                and_(
+                    periodo.filter(Corrida.data),
+                    Corrida.status == StatusCorrida.CANCELADA
+                )
             )
-        ).group_by(
-            Corrida.motivo_cancelamento
-        ).order_by(
-            func.count(Corrida.id).desc()
-        ).all()
         
-        # Análise por horário
-        cancelamentos_por_hora = db.session.query(
-            func.extract('hour', Corrida.data).label('hora'),
-            func.count(Corrida.id).label('cancelamentos')
-        ).filter(
-            and_(
-                func.date(Corrida.data).between(start_date, end_date),
-                Corrida.status == StatusCorrida.CANCELADA,
-                Corrida.municipio == municipio if municipio else True
-            )
-        ).group_by(
-            func.extract('hour', Corrida.data)
-        ).order_by(
-            func.extract('hour', Corrida.data)
-        ).all()
+            if municipio:
+                cancelamentos_query = cancelamentos_query.filter(Corrida.municipio == municipio)
         
-        # Análise por município (se não filtrado)
-        cancelamentos_por_municipio = []
-        if not municipio:
-            cancelamentos_por_municipio = db.session.query(
-                Corrida.municipio,
-                func.count(Corrida.id).label('cancelamentos'),
-                func.count(Corrida.id) * 100.0 / func.count(Corrida.id).over().label('percentual')
+            # Análise por motivo de cancelamento
+            motivos = db.session.query(
+                Corrida.motivo_cancelamento,
+                func.count(Corrida.id).label('quantidade')
             ).filter(
                 and_(
-                    func.date(Corrida.data).between(start_date, end_date),
-                    Corrida.status == StatusCorrida.CANCELADA
+                    periodo.filter(Corrida.data),
+                    Corrida.status == StatusCorrida.CANCELADA,
+                    Corrida.motivo_cancelamento.isnot(None),
+                    Corrida.municipio == municipio if municipio else True
                 )
             ).group_by(
-                Corrida.municipio
+                Corrida.motivo_cancelamento
             ).order_by(
                 func.count(Corrida.id).desc()
             ).all()
         
-        # Total de cancelamentos
-        total_cancelamentos = cancelamentos_query.count()
+            # Análise por horário (rollup metricas_horarias)
+            cancelamentos_por_hora = db.session.query(
+                MetricaHoraria.hora,
+                func.sum(MetricaHoraria.total_corridas).label('cancelamentos')
+            ).filter(
+                and_(
+                    periodo.filter_dates(MetricaHoraria.data),
+                    MetricaHoraria.status == StatusCorrida.CANCELADA,
+                    MetricaHoraria.municipio == municipio if municipio else True
+                )
+            ).group_by(
+                MetricaHoraria.hora
+            ).order_by(
+                MetricaHoraria.hora
+            ).all()
         
-        # Total geral de corridas para calcular taxa
-        total_corridas = db.session.query(func.count(Corrida.id)).filter(
-            and_(
-                func.date(Corrida.data).between(start_date, end_date),
-                Corrida.municipio == municipio if municipio else True
-            )
-        ).scalar()
+            # Análise por município (se não filtrado)
+            cancelamentos_por_municipio = []
+            if not municipio:
+                cancelamentos_por_municipio = db.session.query(
+                    Corrida.municipio,
+                    func.count(Corrida.id).label('cancelamentos'),
+                    (func.count(Corrida.id) * 100.0 / func.sum(func.count(Corrida.id)).over()).label('percentual')
+                ).filter(
+                    and_(
+                        periodo.filter(Corrida.data),
+                        Corrida.status == StatusCorrida.CANCELADA
+                    )
+                ).group_by(
+                    Corrida.municipio
+                ).order_by(
+                    func.count(Corrida.id).desc()
+                ).all()
+        
+            # Total de cancelamentos
+            total_cancelamentos = cancelamentos_query.count()
+        
+            # Total geral de corridas para calcular taxa
+            total_corridas = db.session.query(func.count(Corrida.id)).filter(
+                and_(
+                    periodo.filter(Corrida.data),
+                    Corrida.municipio == municipio if municipio else True
+                )
+            ).scalar()
         
         taxa_cancelamento = (total_cancelamentos / total_corridas * 100) if total_corridas > 0 else 0
         
@@ -487,7 +473,7 @@ def get_analise_cancelamentos():
                 {
                     'hora': int(hora.hora),
                     'hora_formatada': f"{int(hora.hora):02d}:00",
-                    'cancelamentos': hora.cancelamentos
+                    'cancelamentos': int(hora.cancelamentos)
                 }
                 for hora in cancelamentos_por_hora
             ],
@@ -505,8 +491,7 @@ def get_analise_cancelamentos():
             'success': True,
             'data': {
                 'periodo': {
-                    'start_date': start_date.isoformat(),
-                    'end_date': end_date.isoformat(),
+                    **periodo.to_dict(),
                     'municipio': municipio
                 },
                 'analise_cancelamentos': analise
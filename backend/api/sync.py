@@ -1,5 +1,6 @@
 from flask import Blueprint, request, jsonify
 from backend.services.sync_service import DataSyncService
+from backend.services.partitions import PartitionSet
 import logging
 logger = logging.getLogger(__name__)
 
@@ -64,8 +65,10 @@ def recalculate_metrics():
             from datetime import datetime
             start_date = datetime.fromisoformat(start_date)
         
-        # Recalcular métricas
-        result = sync_service.recalculate_daily_metrics(start_date=start_date)
+        # Recalcular métricas e republicar apenas as partições que mudaram
+        changes = PartitionSet()
+        result = sync_service.recalculate_daily_metrics(start_date=start_date, changes=changes)
+        result.update(sync_service.publish_data_change('recalculate', changes))
         
         return jsonify({
             'success': True,
@@ -84,7 +87,10 @@ def resolve_duplicates():
     """Endpoint para resolver duplicatas"""
     try:
         # Resolver duplicatas
-        result = sync_service.resolve_duplicates()
+        changes = PartitionSet()
+        result = sync_service.resolve_duplicates(changes)
+        if result.get('duplicates_resolved'):
+            result.update(sync_service.publish_data_change('duplicates', changes))
         
         return jsonify({
             'success': True,
@@ -117,6 +123,50 @@ def get_sync_status():
             'error': str(e)
         }), 500
 
+@bp.route('/columnar', methods=['GET'])
+def get_columnar_status():
+    """Endpoint para obter o estado do motor colunar em memória"""
+    from backend.services.columnar_service import columnar_service
+    return jsonify({
+        'success': True,
+        'data': columnar_service.get_status()
+    })
+
+@bp.route('/columnar/refresh', methods=['POST'])
+def refresh_columnar():
+    """Endpoint para atualizar (ou reconstruir) o snapshot colunar"""
+    try:
+        from backend.services.columnar_service import columnar_service
+        result = columnar_service.refresh()
+        
+        status_code = 200 if result['success'] else 400
+        
+        return jsonify(result), status_code
+        
+    except Exception as e:
+        logger.error(f"Erro ao atualizar motor colunar: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@bp.route('/cache', methods=['GET'])
+def get_cache_stats():
+    """Endpoint para obter a telemetria do cache por prefixo (processo e todos os workers)"""
+    try:
+        from backend.services.cache_service import cache_service
+        return jsonify({
+            'success': True,
+            'data': cache_service.get_cache_stats()
+        })
+        
+    except Exception as e:
+        logger.error(f"Erro ao obter estatísticas do cache: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
 @bp.route('/health', methods=['GET'])
 def sync_health_check():
     """Endpoint para verificar saúde do sistema de sincronização"""
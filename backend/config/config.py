@@ -30,7 +30,7 @@ class Config:
     
     # Configurações de Upload
     UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER') or 'uploads'
-    MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH', 16777216))  # 16MB
+    MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH', 536870912))  # 512MB (CSV lido em blocos)
     
     # Configurações de Cache
     CACHE_TYPE = os.environ.get('CACHE_TYPE') or 'redis'
@@ -46,6 +46,9 @@ class Corrida(db.Model):
     motorista_id = db.Column(db.Integer, db.ForeignKey('motoristas.id'))
     motorista = db.relationship('Motorista', back_populates='corridas')
     
+    # Índice composto usado pelos filtros de período + município
+    __table_args__ = (db.Index('idx_corridas_data_municipio', 'data', 'municipio'),)
+    
     def __repr__(self):
         return f'<Corrida {self.id}: {self.usuario_nome} - {self.status.value}>'
     
@@ -155,7 +158,9 @@ class MetricaDiaria(db.Model):
     corridas_perdidas = db.Column(db.Integer, default=0)
     receita_total = db.Column(db.Numeric(10, 2), default=0)
     motoristas_ativos = db.Column(db.Integer, default=0)
+    usuarios_unicos = db.Column(db.Integer, default=0)
     avaliacao_media = db.Column(db.Float)
+    avaliacoes_quantidade = db.Column(db.Integer)  # corridas avaliadas (peso de avaliacao_media nos rollups)
     tempo_medio_corrida = db.Column(db.Float)
     distancia_media = db.Column(db.Float)
     
@@ -164,6 +169,10 @@ class MetricaDiaria(db.Model):
     taxa_conclusao = db.Column(db.Float)  # percentual
     ticket_medio = db.Column(db.Numeric(10, 2))
     
+    # Sketches HyperLogLog (mescláveis entre dias/municípios)
+    motoristas_hll = db.Column(db.LargeBinary)
+    usuarios_hll = db.Column(db.LargeBinary)
+    
     # Campos de controle
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -185,7 +194,9 @@ class MetricaDiaria(db.Model):
             'corridas_perdidas': self.corridas_perdidas,
             'receita_total': float(self.receita_total) if self.receita_total else None,
             'motoristas_ativos': self.motoristas_ativos,
+            'usuarios_unicos': self.usuarios_unicos,
             'avaliacao_media': self.avaliacao_media,
+            'avaliacoes_quantidade': self.avaliacoes_quantidade,
             'tempo_medio_corrida': self.tempo_medio_corrida,
             'distancia_media': self.distancia_media,
             'total_corridas': self.total_corridas,
@@ -195,6 +206,206 @@ class MetricaDiaria(db.Model):
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
 
+class MetricaHoraria(db.Model):
+    """Model para métricas consolidadas por hora do dia"""
+    __tablename__ = 'metricas_horarias'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    data = db.Column(db.Date, nullable=False)
+    hora = db.Column(db.Integer, nullable=False)  # 0-23
+    municipio = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.Enum(StatusCorrida), nullable=False)
+    total_corridas = db.Column(db.Integer, default=0)
+    receita_total = db.Column(db.Numeric(12, 2), default=0)
+    
+    # Campos de controle
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Uma linha por (data, hora, município, status)
+    __table_args__ = (
+        db.UniqueConstraint('data', 'hora', 'municipio', 'status', name='unique_metrica_horaria'),
+        db.Index('idx_metricas_horarias_data_municipio', 'data', 'municipio'),
+    )
+    
+    def __repr__(self):
+        return f'<MetricaHoraria {self.id}: {self.municipio} - {self.data} {self.hora:02d}h>'
+    
+    def to_dict(self):
+        """Converte o objeto para dicionário"""
+        return {
+            'id': self.id,
+            'data': self.data.isoformat() if self.data else None,
+            'hora': self.hora,
+            'municipio': self.municipio,
+            'status': self.status.value if self.status else None,
+            'total_corridas': self.total_corridas,
+            'receita_total': float(self.receita_total) if self.receita_total else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+class MetricaMotoristaDiaria(db.Model):
+    """Model para métricas consolidadas diárias por motorista"""
+    __tablename__ = 'metricas_motorista_diarias'
+
+    id = db.Column(db.Integer, primary_key=True)
+    data = db.Column(db.Date, nullable=False)
+    motorista_nome = db.Column(db.String(100), nullable=False)
+    municipio = db.Column(db.String(50), nullable=False)
+    total_corridas = db.Column(db.Integer, default=0)
+    corridas_concluidas = db.Column(db.Integer, default=0)
+    corridas_canceladas = db.Column(db.Integer, default=0)
+    receita_total = db.Column(db.Numeric(12, 2), default=0)
+
+    # Soma e quantidade de avaliações (média exata em qualquer período)
+    avaliacao_soma = db.Column(db.Integer, default=0)
+    avaliacao_quantidade = db.Column(db.Integer, default=0)
+
+    # Campos de controle
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # Uma linha por (data, motorista, município)
+    __table_args__ = (
+        db.UniqueConstraint('data', 'motorista_nome', 'municipio', name='unique_metrica_motorista_diaria'),
+        db.Index('idx_metricas_motorista_diarias_data_municipio', 'data', 'municipio'),
+    )
+
+    def __repr__(self):
+        return f'<MetricaMotoristaDiaria {self.id}: {self.motorista_nome} - {self.data}>'
+
+    def to_dict(self):
+        """Converte o objeto para dicionário"""
+        return {
+            'id': self.id,
+            'data': self.data.isoformat() if self.data else None,
+            'motorista_nome': self.motorista_nome,
+            'municipio': self.municipio,
+            'total_corridas': self.total_corridas,
+            'corridas_concluidas': self.corridas_concluidas,
+            'corridas_canceladas': self.corridas_canceladas,
+            'receita_total': float(self.receita_total) if self.receita_total else None,
+            'avaliacao_soma': self.avaliacao_soma,
+            'avaliacao_quantidade': self.avaliacao_quantidade,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+class MetricaSemanal(db.Model):
+    """Model para métricas consolidadas semanais, derivadas de metricas_diarias (semanas de segunda a domingo)"""
+    __tablename__ = 'metricas_semanais'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    semana = db.Column(db.Date, nullable=False)
+    municipio = db.Column(db.String(50), nullable=False)
+    total_corridas = db.Column(db.Integer, default=0)
+    corridas_concluidas = db.Column(db.Integer, default=0)
+    corridas_canceladas = db.Column(db.Integer, default=0)
+    corridas_perdidas = db.Column(db.Integer, default=0)
+    receita_total = db.Column(db.Numeric(12, 2), default=0)
+    avaliacao_media = db.Column(db.Float)  # média ponderada pelas corridas avaliadas
+    avaliacoes_quantidade = db.Column(db.Integer, default=0)
+    taxa_conclusao = db.Column(db.Float)
+    motoristas_ativos = db.Column(db.Integer, default=0)  # distintos no período (HyperLogLog)
+    motoristas_ativos_media = db.Column(db.Float)  # média diária
+    usuarios_unicos = db.Column(db.Integer, default=0)  # distintos no período (HyperLogLog)
+    dias_com_dados = db.Column(db.Integer, default=0)
+    
+    # Sketches mesclados dos dias. NULL se algum dia não tem sketch: os
+    # distintos acima são então o maior valor diário (limite inferior)
+    motoristas_hll = db.Column(db.LargeBinary)
+    usuarios_hll = db.Column(db.LargeBinary)
+    
+    # Campos de controle
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Chave natural: uma linha por período e município
+    __table_args__ = (db.UniqueConstraint('semana', 'municipio', name='unique_metrica_semana_municipio'),)
+    
+    def __repr__(self):
+        return f'<MetricaSemanal {self.id}: {self.municipio} - {self.semana}>'
+    
+    def to_dict(self):
+        """Converte o objeto para dicionário"""
+        return {
+            'id': self.id,
+            'semana': self.semana.isoformat() if self.semana else None,
+            'municipio': self.municipio,
+            'total_corridas': self.total_corridas,
+            'corridas_concluidas': self.corridas_concluidas,
+            'corridas_canceladas': self.corridas_canceladas,
+            'corridas_perdidas': self.corridas_perdidas,
+            'receita_total': float(self.receita_total) if self.receita_total else None,
+            'avaliacao_media': self.avaliacao_media,
+            'avaliacoes_quantidade': self.avaliacoes_quantidade,
+            'taxa_conclusao': self.taxa_conclusao,
+            'motoristas_ativos': self.motoristas_ativos,
+            'motoristas_ativos_media': self.motoristas_ativos_media,
+            'usuarios_unicos': self.usuarios_unicos,
+            'dias_com_dados': self.dias_com_dados,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+class MetricaMensal(db.Model):
+    """Model para métricas consolidadas mensais (derivadas de metricas_diarias)"""
+    __tablename__ = 'metricas_mensais'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    mes = db.Column(db.Date, nullable=False)
+    municipio = db.Column(db.String(50), nullable=False)
+    total_corridas = db.Column(db.Integer, default=0)
+    corridas_concluidas = db.Column(db.Integer, default=0)
+    corridas_canceladas = db.Column(db.Integer, default=0)
+    corridas_perdidas = db.Column(db.Integer, default=0)
+    receita_total = db.Column(db.Numeric(12, 2), default=0)
+    avaliacao_media = db.Column(db.Float)  # média ponderada pelas corridas avaliadas
+    avaliacoes_quantidade = db.Column(db.Integer, default=0)
+    taxa_conclusao = db.Column(db.Float)
+    motoristas_ativos = db.Column(db.Integer, default=0)  # distintos no período (HyperLogLog)
+    motoristas_ativos_media = db.Column(db.Float)  # média diária
+    usuarios_unicos = db.Column(db.Integer, default=0)  # distintos no período (HyperLogLog)
+    dias_com_dados = db.Column(db.Integer, default=0)
+    
+    # Sketches mesclados dos dias. NULL se algum dia não tem sketch: os
+    # distintos acima são então o maior valor diário (limite inferior)
+    motoristas_hll = db.Column(db.LargeBinary)
+    usuarios_hll = db.Column(db.LargeBinary)
+    
+    # Campos de controle
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Chave natural: uma linha por período e município
+    __table_args__ = (db.UniqueConstraint('mes', 'municipio', name='unique_metrica_mes_municipio'),)
+    
+    def __repr__(self):
+        return f'<MetricaMensal {self.id}: {self.municipio} - {self.mes}>'
+    
+    def to_dict(self):
+        """Converte o objeto para dicionário"""
+        return {
+            'id': self.id,
+            'mes': self.mes.isoformat() if self.mes else None,
+            'municipio': self.municipio,
+            'total_corridas': self.total_corridas,
+            'corridas_concluidas': self.corridas_concluidas,
+            'corridas_canceladas': self.corridas_canceladas,
+            'corridas_perdidas': self.corridas_perdidas,
+            'receita_total': float(self.receita_total) if self.receita_total else None,
+            'avaliacao_media': self.avaliacao_media,
+            'avaliacoes_quantidade': self.avaliacoes_quantidade,
+            'taxa_conclusao': self.taxa_conclusao,
+            'motoristas_ativos': self.motoristas_ativos,
+            'motoristas_ativos_media': self.motoristas_ativos_media,
+            'usuarios_unicos': self.usuarios_unicos,
+            'dias_com_dados': self.dias_com_dados,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
 class ImportLog(db.Model):
     """Model para log de importações"""
     __tablename__ = 'import_logs'
@@ -206,12 +417,19 @@ class ImportLog(db.Model):
     success_rows = db.Column(db.Integer)
     error_rows = db.Column(db.Integer)
     import_type = db.Column(db.String(50))  # 'corridas', 'metas', etc.
-    status = db.Column(db.String(20))  # 'processing', 'completed', 'failed'
+    status = db.Column(db.String(30))  # 'queued', 'processing', 'completed', 'completed_with_errors', 'failed'
     error_message = db.Column(db.Text)
+    processed_rows = db.Column(db.Integer, default=0)  # linhas lidas até agora (progresso do job)
+    
+    # Desempenho da gravação em lote
+    rows_per_second = db.Column(db.Float)
+    insert_seconds = db.Column(db.Float)
+    batch_timings = db.Column(db.JSON)  # [{'rows': n, 'seconds': s}, ...]
     
     # Campos de controle
     started_at = db.Column(db.DateTime, default=datetime.utcnow)
     completed_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)  # último sinal do processo que executa o job
     
     def __repr__(self):
         return f'<ImportLog {self.id}: {self.filename} - {self.status}>'
@@ -228,6 +446,24 @@ class ImportLog(db.Model):
             'import_type': self.import_type,
             'status': self.status,
             'error_message': self.error_message,
+            'processed_rows': self.processed_rows,
+            'progress': round(100 * (self.processed_rows or 0) / self.total_rows, 1) if self.total_rows else None,
+            'rows_per_second': self.rows_per_second,
+            'insert_seconds': self.insert_seconds,
+            'batch_timings': self.batch_timings,
             'started_at': self.started_at.isoformat() if self.started_at else None,
-            'completed_at': self.completed_at.isoformat() if self.completed_at else None
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None,
+            'heartbeat_at': self.heartbeat_at.isoformat() if self.heartbeat_at else None
         }
+
+class VersaoDataset(db.Model):
+    """Versão monotônica dos dados (linha única), incrementada a cada importação, sincronização ou recálculo"""
+    __tablename__ = 'versao_dataset'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    versao = db.Column(db.BigInteger, nullable=False, default=0)
+    motivo = db.Column(db.String(50))
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<VersaoDataset {self.versao} ({self.motivo})>'
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Serviço de Agregação - Métricas do Overview em uma única passada
+Calcula todas as métricas do período atual e do período anterior
+com agregação condicional, evitando varreduras repetidas de corridas
+"""
+
+import os
+from types import SimpleNamespace
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+from sqlalchemy import func, case, and_
+from backend.models import db, Corrida, MetricaDiaria, MetricaMensal, MetricaSemanal, StatusCorrida
+from backend.services.columnar_service import columnar_service
+from backend.services.hll import HyperLogLog, merge_sketches
+from backend.services.period_service import Periodo
+from backend.services.rollup_service import split_period
+
+# Um município ou uma lista de municípios
+Municipios = Union[str, List[str], None]
+
+# Períodos de até OVERVIEW_EXACT_DISTINCT_DAYS dias contam motoristas e
+# usuários distintos exatamente (na mesma passada do overview); os mais
+# longos usam os sketches HyperLogLog e são marcados como aproximados
+EXACT_DISTINCT_DAYS = int(os.getenv('OVERVIEW_EXACT_DISTINCT_DAYS', '31'))
+
+# Colunas somáveis da agregação do overview
+OVERVIEW_SUM_FIELDS = (
+    'total_corridas', 'corridas_concluidas', 'corridas_canceladas', 'corridas_perdidas',
+    'receita_total', 'avaliacao_soma', 'avaliacao_quantidade', 'previous_corridas', 'previous_receita'
+)
+
+
+def municipio_filter(column, municipio: Municipios):
+    """Condição de igualdade (um município) ou IN (lista de municípios)"""
+    if isinstance(municipio, (list, tuple, set)):
+        return column.in_(list(municipio))
+    return column == municipio
+
+
+class AggregationService:
+    """Serviço de agregação de métricas sobre a tabela de corridas"""
+
+    @staticmethod
+    def _overview_columns(periodo: Periodo, anterior_periodo: Periodo) -> List:
+        """Colunas da agregação condicional (período atual e anterior) do overview"""
+        atual = periodo.filter(Corrida.data)
+        anterior = anterior_periodo.filter(Corrida.data)
+        concluida = Corrida.status == StatusCorrida.CONCLUIDA
+
+        return [
+            func.sum(case((atual, 1), else_=0)).label('total_corridas'),
+            func.sum(case((and_(atual, concluida), 1), else_=0)).label('corridas_concluidas'),
+            func.sum(case((and_(atual, Corrida.status == StatusCorrida.CANCELADA), 1), else_=0)).label('corridas_canceladas'),
+            func.sum(case((and_(atual, Corrida.status == StatusCorrida.PERDIDA), 1), else_=0)).label('corridas_perdidas'),
+            func.coalesce(func.sum(case((and_(atual, concluida), Corrida.valor), else_=None)), 0).label('receita_total'),
+            # Soma e quantidade (em vez de AVG) para que a média de vários municípios possa ser recomposta
+            func.sum(case((and_(atual, concluida), Corrida.avaliacao), else_=None)).label('avaliacao_soma'),
+            func.count(case((and_(atual, concluida), Corrida.avaliacao), else_=None)).label('avaliacao_quantidade'),
+            func.sum(case((anterior, 1), else_=0)).label('previous_corridas'),
+            func.coalesce(func.sum(case((and_(anterior, concluida), Corrida.valor), else_=None)), 0).label('previous_receita')
+        ]
+
+    @staticmethod
+    def _distinct_columns(periodo: Periodo) -> List:
+        """Contagem distinta exata de motoristas e usuários do período atual"""
+        atual = periodo.filter(Corrida.data)
+        return [
+            func.count(func.distinct(case((atual, Corrida.motorista_nome), else_=None))).label('motoristas_ativos'),
+            func.count(func.distinct(case((atual, Corrida.usuario_nome), else_=None))).label('usuarios_unicos')
+        ]
+
+    @staticmethod
+    def _sum_rows(rows: Iterable) -> SimpleNamespace:
+        """Soma linhas da agregação do overview (ex.: de vários municípios)"""
+        rows = list(rows)
+        return SimpleNamespace(**{
+            campo: sum((getattr(row, campo) or 0) for row in rows)
+            for campo in OVERVIEW_SUM_FIELDS
+        })
+
+    @staticmethod
+    def _overview_from_row(row, unicos: Dict[str, int]) -> Dict[str, Any]:
+        """Converte uma linha da agregação no dicionário de métricas do overview"""
+        avaliacao_quantidade = int(row.avaliacao_quantidade or 0)
+        avaliacao_media = float(row.avaliacao_soma) / avaliacao_quantidade if avaliacao_quantidade else 0.0
+
+        return {
+            'total_corridas': int(row.total_corridas or 0),
+            'corridas_concluidas': int(row.corridas_concluidas or 0),
+            'corridas_canceladas': int(row.corridas_canceladas or 0),
+            'corridas_perdidas': int(row.corridas_perdidas or 0),
+            'receita_total': float(row.receita_total or 0),
+            'motoristas_ativos': unicos['motoristas_ativos'],
+            'usuarios_unicos': unicos['usuarios_unicos'],
+            'aproximado': unicos.get('aproximado', False),
+            'avaliacao_media': avaliacao_media,
+            'previous_corridas': int(row.previous_corridas or 0),
+            'previous_receita': float(row.previous_receita or 0)
+        }
+
+    def get_overview_metrics(self, periodo: Periodo, municipio: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Calcula as métricas do overview para o período e o período anterior
+        em uma única query (agregação condicional com CASE), ou no motor
+        colunar em memória quando ativo
+        """
+        if columnar_service.is_ready():
+            return columnar_service.get_overview_metrics(periodo, municipio)
+
+        anterior_periodo = periodo.previous()
+
+        # Contagens distintas de períodos longos vêm dos sketches, quando disponíveis
+        unicos = self.get_sketch_unique_counts(periodo, municipio) if periodo.dias > EXACT_DISTINCT_DAYS else None
+        colunas_distintas = self._distinct_columns(periodo) if unicos is None else []
+
+        query = db.session.query(
+            *self._overview_columns(periodo, anterior_periodo),
+            *colunas_distintas
+        ).filter(
+            periodo.extend_to(anterior_periodo).filter(Corrida.data)
+        )
+
+        if municipio:
+            query = query.filter(Corrida.municipio == municipio)
+
+        row = query.one()
+        if unicos is None:
+            unicos = {
+                'motoristas_ativos': int(row.motoristas_ativos or 0),
+                'usuarios_unicos': int(row.usuarios_unicos or 0)
+            }
+        elif unicos['total_corridas'] != int(row.total_corridas or 0):
+            # Rollup desatualizado para o período: contagem exata
+            unicos = self.get_unique_counts(periodo, municipio, use_sketches=False)
+
+        return self._overview_from_row(row, unicos)
+
+    def get_overview_by_municipio(self, periodo: Periodo, municipios: List[str],
+                                  use_sketches: bool = True) -> Tuple[Dict[str, Any], Dict[str, Dict[str, Any]]]:
+        """
+        Métricas do overview de vários municípios com uma única passada
+        em corridas (GROUP BY municipio)
+
+        Retorna (total do conjunto, métricas por município). Motoristas e
+        usuários do total são distintos no conjunto, não a soma das cidades.
+        """
+        if columnar_service.is_ready():
+            return (columnar_service.get_overview_metrics(periodo, municipios),
+                    {m: columnar_service.get_overview_metrics(periodo, m) for m in municipios})
+
+        anterior_periodo = periodo.previous()
+
+        use_sketches = use_sketches and periodo.dias > EXACT_DISTINCT_DAYS
+        sketches = self.get_sketch_unique_counts_by_municipio(periodo, municipios) if use_sketches else None
+        colunas_distintas = self._distinct_columns(periodo) if sketches is None else []
+
+        rows = db.session.query(
+            Corrida.municipio,
+            *self._overview_columns(periodo, anterior_periodo),
+            *colunas_distintas
+        ).filter(
+            periodo.extend_to(anterior_periodo).filter(Corrida.data),
+            Corrida.municipio.in_(municipios)
+        ).group_by(
+            Corrida.municipio
+        ).all()
+        rows = {row.municipio: row for row in rows}
+
+        if sketches is not None and any(
+            sketches['por_municipio'].get(m, {}).get('total_corridas', 0) !=
+            (int(rows[m].total_corridas or 0) if m in rows else 0)
+            for m in municipios
+        ):
+            # Rollup desatualizado para o período: contagem exata
+            return self.get_overview_by_municipio(periodo, municipios, use_sketches=False)
+
+        por_municipio = {}
+        for municipio in municipios:
+            row = rows.get(municipio)
+            if row is None:
+                unicos = {'motoristas_ativos': 0, 'usuarios_unicos': 0}
+                row = self._sum_rows([])
+            elif sketches is not None:
+                unicos = sketches['por_municipio'][municipio]
+            else:
+                unicos = {
+                    'motoristas_ativos': int(row.motoristas_ativos or 0),
+                    'usuarios_unicos': int(row.usuarios_unicos or 0)
+                }
+            por_municipio[municipio] = self._overview_from_row(row, unicos)
+
+        if sketches is not None:
+            unicos_total = sketches['total']
+        else:
+            unicos_total = self.get_unique_counts(periodo, municipios, use_sketches=False)
+
+        total = self._overview_from_row(self._sum_rows(rows.values()), unicos_total)
+        return total, por_municipio
+
+    @staticmethod
+    def _sketch_rows(periodo: Periodo, municipio: Municipios = None) -> List:
+        """
+        Linhas (municipio, total_corridas, sketches) que cobrem o período:
+        meses inteiros de metricas_mensais, semanas inteiras de
+        metricas_semanais e os dias restantes de metricas_diarias
+        """
+        meses, semanas, dias = split_period(periodo)
+        rows = []
+        for model, coluna, chaves in ((MetricaMensal, MetricaMensal.mes, meses),
+                                      (MetricaSemanal, MetricaSemanal.semana, semanas),
+                                      (MetricaDiaria, MetricaDiaria.data, dias)):
+            if not chaves:
+                continue
+            query = db.session.query(
+                model.municipio,
+                model.total_corridas,
+                model.motoristas_hll,
+                model.usuarios_hll
+            ).filter(coluna.in_(chaves))
+            if municipio:
+                query = query.filter(municipio_filter(model.municipio, municipio))
+            rows.extend(query.all())
+        return rows
+
+    def get_sketch_unique_counts(self, periodo: Periodo,
+                                 municipio: Municipios = None) -> Optional[Dict[str, Any]]:
+        """
+        Estima motoristas ativos e usuários únicos mesclando os sketches
+        HyperLogLog dos rollups (ver _sketch_rows). Retorna None se algum
+        trecho do período ainda não tem sketch (ex.: linha gravada pelo
+        trigger SQL); quem chama confere total_corridas contra a tabela de
+        corridas para detectar rollups desatualizados
+        """
+        rows = self._sketch_rows(periodo, municipio)
+        if not rows or any(r.motoristas_hll is None or r.usuarios_hll is None for r in rows):
+            return None
+
+        return {
+            'motoristas_ativos': merge_sketches(r.motoristas_hll for r in rows).count(),
+            'usuarios_unicos': merge_sketches(r.usuarios_hll for r in rows).count(),
+            'total_corridas': sum(r.total_corridas or 0 for r in rows),
+            'aproximado': True
+        }
+
+    def get_sketch_unique_counts_by_municipio(self, periodo: Periodo,
+                                              municipios: List[str]) -> Optional[Dict[str, Any]]:
+        """
+        Como get_sketch_unique_counts, por município e para o conjunto,
+        lendo os sketches uma única vez
+        """
+        rows = self._sketch_rows(periodo, municipios)
+        if not rows or any(r.motoristas_hll is None or r.usuarios_hll is None for r in rows):
+            return None
+
+        por_municipio = {}
+        motoristas_total, usuarios_total = HyperLogLog(), HyperLogLog()
+        for municipio in municipios:
+            linhas = [r for r in rows if r.municipio == municipio]
+            if not linhas:
+                continue
+            motoristas = merge_sketches(r.motoristas_hll for r in linhas)
+            usuarios = merge_sketches(r.usuarios_hll for r in linhas)
+            por_municipio[municipio] = {
+                'motoristas_ativos': motoristas.count(),
+                'usuarios_unicos': usuarios.count(),
+                'total_corridas': sum(r.total_corridas or 0 for r in linhas),
+                'aproximado': True
+            }
+            motoristas_total.merge(motoristas)
+            usuarios_total.merge(usuarios)
+
+        return {
+            'por_municipio': por_municipio,
+            'total': {
+                'motoristas_ativos': motoristas_total.count(),
+                'usuarios_unicos': usuarios_total.count(),
+                'aproximado': True
+            }
+        }
+
+    def get_unique_counts(self, periodo: Periodo, municipio: Municipios = None,
+                          use_sketches: bool = True) -> Dict[str, int]:
+        """
+        Motoristas ativos e usuários únicos do período (sketches ou contagem
+        exata; `aproximado` indica qual)
+        """
+        if use_sketches:
+            unicos = self.get_sketch_unique_counts(periodo, municipio)
+            if unicos is not None:
+                return unicos
+
+        query = db.session.query(
+            func.count(func.distinct(Corrida.motorista_nome)).label('motoristas_ativos'),
+            func.count(func.distinct(Corrida.usuario_nome)).label('usuarios_unicos')
+        ).filter(
+            periodo.filter(Corrida.data)
+        )
+
+        if municipio:
+            query = query.filter(municipio_filter(Corrida.municipio, municipio))
+
+        row = query.one()
+        return {
+            'motoristas_ativos': int(row.motoristas_ativos or 0),
+            'usuarios_unicos': int(row.usuarios_unicos or 0),
+            'aproximado': False
+        }
+
+
+# Instância global do serviço de agregação
+aggregation_service = AggregationService()
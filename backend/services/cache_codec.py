@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Codec do Cache - Serialização compacta dos valores guardados
+Codifica valores com orjson, msgpack ou json (o que estiver instalado),
+comprime com zstd/lz4 acima de um limite de tamanho e marca o formato
+no cabeçalho, de modo que entradas antigas (JSON puro) continuem legíveis
+"""
+
+import json
+import math
+import os
+import struct
+import time
+from typing import Any, Optional
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - dependência opcional
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - dependência opcional
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - dependência opcional
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:  # pragma: no cover - dependência opcional
+    lz4_frame = None
+
+# Cabeçalho: MAGIC + codec (1 byte) + compressão (1 byte) + instante de gravação (double, NaN se
+# ausente; negativo quando a entrada foi invalidada e aguarda recálculo)
+MAGIC = b'\xffMC1'
+HEADER = struct.Struct('!cc d')
+HEADER_SIZE = len(MAGIC) + HEADER.size
+
+JSON, ORJSON, MSGPACK = b'j', b'o', b'm'
+NONE, ZSTD, LZ4 = b'-', b'z', b'l'
+
+# Codecs cujo corpo já é o JSON do valor (pode ir direto para a resposta HTTP)
+JSON_CODECS = (JSON, ORJSON)
+
+
+def _default(value: Any) -> Any:
+    """Tipos fora do JSON (Decimal, datas) viram texto, como no json.dumps(default=str)"""
+    return str(value)
+
+
+def dumps_json(value: Any) -> bytes:
+    """JSON do valor em bytes (orjson quando disponível)"""
+    if orjson is not None:
+        return orjson.dumps(value, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(value, default=str, separators=(',', ':')).encode()
+
+
+class CacheRecord:
+    """
+    Valor lido do cache, com o instante de gravação e o JSON já codificado
+    (quando houver). `invalidated` marca valores cujos dados mudaram: podem
+    ser servidos obsoletos, mas nunca como frescos
+    """
+
+    __slots__ = ('value', 'stamp', '_json', 'invalidated')
+
+    def __init__(self, value: Any, stamp: Optional[float] = None, json_bytes: Optional[bytes] = None,
+                 invalidated: bool = False):
+        self.value = value
+        self.stamp = stamp
+        self._json = json_bytes
+        self.invalidated = invalidated
+
+    def json(self) -> bytes:
+        """JSON do valor, sem reserializar quando o corpo guardado já é JSON"""
+        if self._json is None:
+            self._json = dumps_json(self.value)
+        return self._json
+
+
+class CacheCodec:
+    """Serializa valores do cache (CACHE_CODEC, CACHE_COMPRESSION, CACHE_COMPRESS_THRESHOLD)"""
+
+    def __init__(self, codec: Optional[str] = None, compression: Optional[str] = None,
+                 threshold: Optional[int] = None):
+        codec = (codec or os.getenv('CACHE_CODEC', 'auto')).lower()
+        if codec == 'auto':
+            codec = 'orjson' if orjson is not None else 'json'
+        if codec == 'orjson' and orjson is None or codec == 'msgpack' and msgpack is None:
+            print(f"Codec de cache {codec} não instalado, usando json")
+            codec = 'json'
+        self.codec = {'json': JSON, 'orjson': ORJSON, 'msgpack': MSGPACK}.get(codec, JSON)
+
+        compression = (compression or os.getenv('CACHE_COMPRESSION', 'auto')).lower()
+        if compression == 'auto':
+            compression = 'zstd' if zstandard is not None else 'lz4' if lz4_frame is not None else 'none'
+        if compression == 'zstd' and zstandard is None or compression == 'lz4' and lz4_frame is None:
+            print(f"Compressão de cache {compression} não instalada, desativada")
+            compression = 'none'
+        self.compression = {'zstd': ZSTD, 'lz4': LZ4}.get(compression, NONE)
+        self.threshold = int(threshold if threshold is not None else os.getenv('CACHE_COMPRESS_THRESHOLD', '4096'))
+
+    @property
+    def name(self) -> str:
+        codecs = {JSON: 'json', ORJSON: 'orjson', MSGPACK: 'msgpack'}
+        compressoes = {NONE: 'none', ZSTD: 'zstd', LZ4: 'lz4'}
+        return f'{codecs[self.codec]}+{compressoes[self.compression]}'
+
+    def encode(self, value: Any, stamp: Optional[float] = None) -> bytes:
+        if self.codec == MSGPACK:
+            body = msgpack.packb(value, default=_default, use_bin_type=True)
+        else:
+            body = dumps_json(value) if self.codec == ORJSON else json.dumps(value, default=str).encode()
+
+        compression = NONE
+        if self.compression != NONE and len(body) >= self.threshold:
+            compression = self.compression
+            body = _compress(compression, body)
+
+        header = HEADER.pack(self.codec, compression, math.nan if stamp is None else stamp)
+        return MAGIC + header + body
+
+    def decode(self, payload: Any) -> CacheRecord:
+        """Decodifica qualquer formato já gravado, inclusive JSON puro de versões anteriores"""
+        if isinstance(payload, str):
+            payload = payload.encode()
+        if not payload.startswith(MAGIC):
+            return _legacy_record(json.loads(payload))
+
+        codec, compression, stamp = HEADER.unpack_from(payload, len(MAGIC))
+        body = payload[HEADER_SIZE:]
+        if compression != NONE:
+            body = _decompress(compression, body)
+        invalidated = stamp < 0
+        stamp = None if math.isnan(stamp) else abs(stamp)
+
+        if codec == MSGPACK:
+            return CacheRecord(msgpack.unpackb(body, raw=False), stamp, invalidated=invalidated)
+        value = orjson.loads(body) if orjson is not None else json.loads(body)
+        return CacheRecord(value, stamp, body if codec in JSON_CODECS else None, invalidated)
+
+    def invalidate(self, payload: Any) -> bytes:
+        """Payload marcado como invalidado, sem recodificar o corpo (entradas sem instante recebem o atual)"""
+        if isinstance(payload, str):
+            payload = payload.encode()
+        if not payload.startswith(MAGIC):
+            record = _legacy_record(json.loads(payload))
+            payload = self.encode(record.value, record.stamp)
+        codec, compression, stamp = HEADER.unpack_from(payload, len(MAGIC))
+        stamp = time.time() if math.isnan(stamp) else abs(stamp)
+        return MAGIC + HEADER.pack(codec, compression, -stamp) + payload[HEADER_SIZE:]
+
+
+def _compress(compression: bytes, body: bytes) -> bytes:
+    if compression == ZSTD:
+        return zstandard.ZstdCompressor(level=3).compress(body)
+    return lz4_frame.compress(body)
+
+
+def _decompress(compression: bytes, body: bytes) -> bytes:
+    if compression == ZSTD:
+        return zstandard.ZstdDecompressor().decompress(body)
+    return lz4_frame.decompress(body)
+
+
+def _legacy_record(value: Any) -> CacheRecord:
+    """Entrada em JSON puro; o envelope de stale-while-revalidate vira o instante do registro"""
+    if isinstance(value, dict) and value.get('__swr__'):
+        return CacheRecord(value['v'], value['t'])
+    return CacheRecord(value)
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Telemetria do Cache - Contadores e latências por prefixo de chave
+Cada processo acumula acertos, faltas, preenchimentos, evicções e
+histogramas de latência de leitura/gravação por prefixo; com Redis os
+deltas são somados periodicamente em hashes compartilhados, de modo que
+as estatísticas cubram todos os workers
+"""
+
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Any, Dict, Optional
+
+COUNTERS = ('hits', 'local_hits', 'stale_hits', 'misses', 'fills', 'evictions')
+
+# Limites superiores (ms) dos baldes dos histogramas de latência
+LATENCY_BUCKETS_MS = (0.25, 0.5, 1, 2, 5, 10, 25, 50, 100, 250, 1000)
+
+STATS_KEY = 'cache:stats:{prefix}'
+PREFIXES_KEY = 'cache:stats:prefixes'
+
+
+def _bucket_field(op: str, ms: float) -> str:
+    for limite in LATENCY_BUCKETS_MS:
+        if ms <= limite:
+            return f'{op}_le_{limite}'
+    return f'{op}_le_inf'
+
+
+class CacheMetrics:
+    """Telemetria do cache em processo, com envio periódico ao Redis"""
+
+    def __init__(self, flush_interval: Optional[float] = None):
+        self.flush_interval = float(flush_interval if flush_interval is not None
+                                    else os.getenv('CACHE_METRICS_FLUSH_INTERVAL', '10'))
+        self._lock = threading.Lock()
+        self._totals: Dict[str, Counter] = defaultdict(Counter)
+        self._pending: Dict[str, Counter] = defaultdict(Counter)
+        self._last_flush = time.monotonic()
+        self.started_at = time.time()
+
+    def incr(self, prefix: str, field: str, n: int = 1) -> None:
+        with self._lock:
+            self._totals[prefix][field] += n
+            self._pending[prefix][field] += n
+
+    def observe(self, prefix: str, op: str, seconds: float) -> None:
+        """Registra a latência de uma operação ('get' ou 'set') no histograma do prefixo"""
+        ms = seconds * 1000
+        campos = (_bucket_field(op, ms), f'{op}_count')
+        micros = int(seconds * 1_000_000)
+        with self._lock:
+            for destino in (self._totals[prefix], self._pending[prefix]):
+                for campo in campos:
+                    destino[campo] += 1
+                destino[f'{op}_sum_us'] += micros
+
+    def maybe_flush(self, redis_client) -> None:
+        """Envia os deltas ao Redis se o intervalo de envio já passou"""
+        if redis_client is not None and time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush(redis_client)
+
+    def flush(self, redis_client) -> None:
+        """Soma os deltas pendentes nos hashes cache:stats:<prefixo> (um pipeline)"""
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(Counter)
+            self._last_flush = time.monotonic()
+        pending = {prefix: campos for prefix, campos in pending.items() if campos}
+        if not pending:
+            return
+        try:
+            pipe = redis_client.pipeline(transaction=False)
+            pipe.sadd(PREFIXES_KEY, *pending.keys())
+            for prefix, campos in pending.items():
+                chave = STATS_KEY.format(prefix=prefix)
+                for campo, valor in campos.items():
+                    pipe.hincrby(chave, campo, valor)
+            pipe.execute()
+        except Exception as e:
+            print(f"Erro ao enviar telemetria do cache: {e}")
+            # Devolve os deltas para a próxima tentativa
+            with self._lock:
+                for prefix, campos in pending.items():
+                    self._pending[prefix].update(campos)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Telemetria deste processo"""
+        with self._lock:
+            totals = {prefix: Counter(campos) for prefix, campos in self._totals.items()}
+        return self.summarize(totals)
+
+    def cluster_snapshot(self, redis_client) -> Optional[Dict[str, Any]]:
+        """Telemetria somada de todos os workers (None sem Redis)"""
+        if redis_client is None:
+            return None
+        self.flush(redis_client)
+        prefixes = sorted(p.decode() if isinstance(p, bytes) else p
+                          for p in redis_client.smembers(PREFIXES_KEY))
+        pipe = redis_client.pipeline(transaction=False)
+        for prefix in prefixes:
+            pipe.hgetall(STATS_KEY.format(prefix=prefix))
+        totals = {}
+        for prefix, campos in zip(prefixes, pipe.execute()):
+            totals[prefix] = Counter({
+                (k.decode() if isinstance(k, bytes) else k): int(v) for k, v in campos.items()
+            })
+        return self.summarize(totals)
+
+    @classmethod
+    def summarize(cls, totals: Dict[str, Counter]) -> Dict[str, Any]:
+        """Contadores, taxa de acerto e percentis aproximados por prefixo"""
+        resumo = {}
+        for prefix, campos in sorted(totals.items()):
+            consultas = campos['hits'] + campos['misses']
+            resumo[prefix] = {
+                **{contador: campos[contador] for contador in COUNTERS},
+                'hit_rate': round(campos['hits'] / consultas * 100, 2) if consultas else 0,
+                'latency_ms': {op: cls._histogram(campos, op) for op in ('get', 'set')}
+            }
+        return resumo
+
+    @staticmethod
+    def _histogram(campos: Counter, op: str) -> Dict[str, Any]:
+        total = campos[f'{op}_count']
+        baldes = [(str(limite), campos[f'{op}_le_{limite}']) for limite in LATENCY_BUCKETS_MS]
+        baldes.append(('inf', campos[f'{op}_le_inf']))
+
+        def percentil(p: float):
+            if not total:
+                return None
+            alvo, acumulado = total * p, 0
+            for limite, quantidade in baldes:
+                acumulado += quantidade
+                if acumulado >= alvo:
+                    return float(limite) if limite != 'inf' else None
+            return None
+
+        return {
+            'count': total,
+            'avg': round(campos[f'{op}_sum_us'] / total / 1000, 3) if total else None,
+            'p50': percentil(0.5),
+            'p95': percentil(0.95),
+            'p99': percentil(0.99),
+            'buckets': dict(baldes)
+        }
@@ -7,9 +7,43 @@ Implementa cache inteligente para dados frequentes do dashboard
 import redis
 import json
 import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
 from datetime import datetime, timedelta
-from typing import Any, Optional, Dict
+from typing import Any, Callable, Iterator, Optional, Dict, List, Tuple
 import hashlib
+from backend.services.cache_codec import CacheCodec, CacheRecord
+from backend.services.cache_metrics import CacheMetrics
+from backend.services.local_cache import LocalCache, key_prefix
+from backend.services.partitions import GLOBAL_SCOPE, PartitionScope, PartitionSet
+
+# Políticas por prefixo: até soft_ttl o valor é servido como fresco; entre
+# soft_ttl e hard_ttl é servido obsoleto enquanto um refresh em background
+# o recalcula (stale-while-revalidate); após hard_ttl a entrada expira.
+# Sobrescrevíveis por CACHE_<PREFIXO>_SOFT_TTL, CACHE_<PREFIXO>_HARD_TTL e
+# CACHE_<PREFIXO>_SWR (0 desativa o refresh em background)
+DEFAULT_CACHE_POLICIES = {
+    'overview': {'soft_ttl': 300, 'hard_ttl': 1800, 'swr': True},
+    'metricas': {'soft_ttl': 600, 'hard_ttl': 3600, 'swr': True},
+    'municipios': {'soft_ttl': 3600, 'hard_ttl': 86400, 'swr': True},
+    'ranking': {'soft_ttl': 600, 'hard_ttl': 3600, 'swr': True},
+}
+
+
+def load_cache_policies() -> Dict[str, Dict[str, Any]]:
+    """Políticas padrão com os overrides de variáveis de ambiente"""
+    policies = {}
+    for prefix, policy in DEFAULT_CACHE_POLICIES.items():
+        env = f'CACHE_{prefix.upper()}'
+        soft_ttl = int(os.getenv(f'{env}_SOFT_TTL', policy['soft_ttl']))
+        policies[prefix] = {
+            'soft_ttl': soft_ttl,
+            'hard_ttl': max(soft_ttl, int(os.getenv(f'{env}_HARD_TTL', policy['hard_ttl']))),
+            'swr': os.getenv(f'{env}_SWR', '1' if policy['swr'] else '0') not in ('0', 'false', 'no')
+        }
+    return policies
 
 class CacheService:
     """Serviço de cache Redis para otimização de performance"""
@@ -18,14 +52,55 @@ class CacheService:
         """Inicializa conexão com Redis"""
         self.redis_url = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
         try:
-            self.redis_client = redis.from_url(self.redis_url, decode_responses=True)
+            # Valores são bytes do codec (ver cache_codec), não texto. Um único
+            # pool por processo, compartilhado por todos os usos do Redis na aplicação
+            self.redis_pool = redis.ConnectionPool.from_url(
+                self.redis_url,
+                decode_responses=False,
+                max_connections=int(os.getenv('REDIS_MAX_CONNECTIONS', '50'))
+            )
+            self.redis_client = redis.Redis(connection_pool=self.redis_pool)
             # Testar conexão
             self.redis_client.ping()
             print("✅ Cache Redis conectado com sucesso")
         except Exception as e:
             print(f"Redis não disponível, usando cache em memória: {e}")
             self.redis_client = None
-            self._memory_cache = {}
+        
+        # Nível local (LRU/TTL limitado por prefixo) na frente do Redis. Com
+        # Redis, a cópia local vive no máximo CACHE_LOCAL_TTL segundos para
+        # que invalidações feitas por outros workers se propaguem
+        self.metrics = CacheMetrics()
+        self.local = LocalCache(on_evict=lambda prefix: self.metrics.incr(prefix, 'evictions'))
+        self.codec = CacheCodec()
+        self.local_ttl = int(os.getenv('CACHE_LOCAL_TTL', '30'))
+        
+        # Gerações por namespace ('dashboard', 'dashboard:overview', ...):
+        # invalidar um namespace é incrementar um contador, e as chaves
+        # antigas deixam de ser lidas e expiram pelo próprio TTL
+        self._generations: Dict[str, Tuple[int, float]] = {}
+        self._generation_lock = threading.Lock()
+        self.generation_ttl = float(os.getenv('CACHE_GENERATION_TTL', '5'))
+        # Gerações em preparação (warm-up), visíveis só para a thread que as preenche
+        self._staged = threading.local()
+        
+        self.policies = load_cache_policies()
+        self._refreshing = set()
+        self._refresh_lock = threading.Lock()
+        
+        # Single-flight: apenas quem obtém a trava calcula um valor ausente;
+        # os demais aguardam até CACHE_FILL_WAIT segundos (ou recebem o
+        # valor obsoleto). A trava no Redis expira em CACHE_FILL_LOCK_TTL
+        self._filling: Dict[str, threading.Event] = {}
+        self._fill_lock = threading.Lock()
+        self.fill_wait = float(os.getenv('CACHE_FILL_WAIT', '5'))
+        self.fill_lock_ttl = float(os.getenv('CACHE_FILL_LOCK_TTL', '30'))
+        
+        # Escopos (período, municípios) das entradas do dashboard, por
+        # geração, para invalidar só o que cruza as partições alteradas
+        self._scope = threading.local()
+        self._scope_index: Dict[str, Dict[str, str]] = {}
+        self.scope_index_ttl = int(os.getenv('CACHE_SCOPE_INDEX_TTL', '86400'))
     
     def _get_cache_key(self, prefix: str, params: Dict[str, Any]) -> str:
         """Gera chave única de cache baseada nos parâmetros"""
@@ -33,41 +108,144 @@ class CacheService:
         params_hash = hashlib.md5(params_str.encode()).hexdigest()[:8]
         return f"dashboard:{prefix}:{params_hash}"
     
+    # Gerações de namespace
+    
+    @staticmethod
+    def _namespaces(key: str) -> List[str]:
+        """Namespaces de uma chave: 'dashboard:report:x' -> ['dashboard', 'dashboard:report']"""
+        partes = key.split(':')
+        namespaces = [partes[0]]
+        if len(partes) > 2:
+            namespaces.append(f'{partes[0]}:{partes[1]}')
+        return namespaces
+    
+    def _get_generations(self, namespaces: List[str]) -> List[int]:
+        """Gerações atuais dos namespaces (memorizadas por generation_ttl segundos no processo)"""
+        agora = time.monotonic()
+        with self._generation_lock:
+            geracoes = {ns: self._generations.get(ns) for ns in namespaces}
+        faltando = [ns for ns, g in geracoes.items()
+                    if g is None or (self.redis_client and agora - g[1] > self.generation_ttl)]
+        
+        if faltando:
+            valores = [0] * len(faltando)
+            if self.redis_client:
+                try:
+                    valores = [int(v or 0) for v in
+                               self.redis_client.mget([f'cache:gen:{ns}' for ns in faltando])]
+                except Exception as e:
+                    print(f"Erro ao ler gerações do cache: {e}")
+                    valores = [(geracoes[ns] or (0, 0))[0] for ns in faltando]
+            with self._generation_lock:
+                for ns, valor in zip(faltando, valores):
+                    self._generations[ns] = (valor, agora)
+                    geracoes[ns] = (valor, agora)
+        
+        staged = getattr(self._staged, 'generations', None) or {}
+        return [staged.get(ns, geracoes[ns][0]) for ns in namespaces]
+    
+    def bump_generation(self, namespace: str) -> int:
+        """Invalida todas as chaves do namespace em O(1) incrementando sua geração"""
+        if self.redis_client:
+            geracao = int(self.redis_client.incr(f'cache:gen:{namespace}'))
+        else:
+            geracao = self._get_generations([namespace])[0] + 1
+        with self._generation_lock:
+            self._generations[namespace] = (geracao, time.monotonic())
+            self._prune_scope_index(namespace, geracao)
+        # Libera já a memória local ocupada pela geração anterior
+        self.local.delete_matching(f'{namespace}:')
+        return geracao
+    
+    @contextmanager
+    def staged_generation(self, namespace: str = 'dashboard') -> Iterator[int]:
+        """
+        Nesta thread, lê e grava o namespace na próxima geração, ainda não
+        publicada: os demais continuam servindo a geração atual até que
+        publish_generation a torne visível (ex.: warm-up após importação)
+        """
+        if self.redis_client:
+            # Lê a geração atual do Redis, não a memorizada no processo
+            with self._generation_lock:
+                self._generations.pop(namespace, None)
+        proxima = self._get_generations([namespace])[0] + 1
+        anteriores = getattr(self._staged, 'generations', None)
+        self._staged.generations = {**(anteriores or {}), namespace: proxima}
+        try:
+            yield proxima
+        finally:
+            self._staged.generations = anteriores
+    
+    @contextmanager
+    def recompute_invalidated(self) -> Iterator[None]:
+        """
+        Nesta thread, entradas invalidadas por invalidate_partitions são
+        recalculadas e regravadas na hora em vez de servidas obsoletas
+        (ex.: warm-up após importação); as demais threads continuam
+        recebendo o valor antigo até a regravação
+        """
+        anterior = getattr(self._staged, 'recompute_invalidated', False)
+        self._staged.recompute_invalidated = True
+        try:
+            yield
+        finally:
+            self._staged.recompute_invalidated = anterior
+    
+    def publish_generation(self, namespace: str, generation: int) -> int:
+        """Torna a geração preparada a atual (nunca retrocede o contador)"""
+        if self.redis_client:
+            geracao = int(self.redis_client.eval(
+                "local atual = tonumber(redis.call('get', KEYS[1]) or '0') "
+                "if atual < tonumber(ARGV[1]) then redis.call('set', KEYS[1], ARGV[1]) return tonumber(ARGV[1]) end "
+                "return atual",
+                1, f'cache:gen:{namespace}', generation
+            ))
+        else:
+            geracao = max(self._get_generations([namespace])[0], generation)
+        with self._generation_lock:
+            self._generations[namespace] = (geracao, time.monotonic())
+            self._prune_scope_index(namespace, geracao)
+        return geracao
+    
+    def current_generation(self, namespace: str) -> int:
+        """Geração atual do namespace"""
+        return self._get_generations([namespace])[0]
+    
+    def _prune_scope_index(self, namespace: str, geracao: int) -> None:
+        # Sem Redis, os índices de escopo de gerações anteriores não expiram sozinhos
+        if namespace == 'dashboard':
+            for indice in [i for i in self._scope_index if int(i.rsplit(':', 1)[1]) < geracao]:
+                del self._scope_index[indice]
+    
+    def versioned_key(self, key: str) -> str:
+        """Chave física: a chave lógica com as gerações dos seus namespaces"""
+        geracoes = self._get_generations(self._namespaces(key))
+        return f"{key}#{'.'.join(str(g) for g in geracoes)}"
+    
+    def versioned_keys(self, keys: List[str]) -> List[str]:
+        """Chaves físicas de várias chaves lógicas (gerações lidas de uma só vez)"""
+        namespaces = [self._namespaces(key) for key in keys]
+        unicos = list(dict.fromkeys(ns for grupo in namespaces for ns in grupo))
+        geracoes = dict(zip(unicos, self._get_generations(unicos)))
+        return [f"{key}#{'.'.join(str(geracoes[ns]) for ns in grupo)}"
+                for key, grupo in zip(keys, namespaces)]
+    
+    # Operações básicas (chaves lógicas)
+    
     def get(self, key: str) -> Optional[Any]:
-        """Recupera valor do cache"""
+        """Recupera valor do cache (nível local primeiro, depois Redis)"""
         try:
-            if self.redis_client:
-                value = self.redis_client.get(key)
-                if value:
-                    return json.loads(value)
-            else:
-                # Fallback para cache em memória
-                cache_item = self._memory_cache.get(key)
-                if cache_item and cache_item['expires'] > datetime.now():
-                    return cache_item['data']
-                elif cache_item:
-                    del self._memory_cache[key]
-            return None
+            record = self._read(self.versioned_key(key))
         except Exception as e:
             print(f"Erro ao recuperar cache {key}: {e}")
-            return None
+            record = None
+        self._record_lookup(key, 'fresh' if record is not None else 'miss')
+        return record.value if record is not None else None
     
     def set(self, key: str, value: Any, ttl: int = 300) -> bool:
         """Armazena valor no cache com TTL (Time To Live)"""
         try:
-            if self.redis_client:
-                return self.redis_client.setex(
-                    key, 
-                    ttl, 
-                    json.dumps(value, default=str)
-                )
-            else:
-                # Fallback para cache em memória
-                self._memory_cache[key] = {
-                    'data': value,
-                    'expires': datetime.now() + timedelta(seconds=ttl)
-                }
-                return True
+            return bool(self._write(self.versioned_key(key), value, ttl))
         except Exception as e:
             print(f"Erro ao armazenar cache {key}: {e}")
             return False
@@ -75,64 +253,709 @@ class CacheService:
     def delete(self, key: str) -> bool:
         """Remove valor do cache"""
         try:
+            physical = self.versioned_key(key)
+            removed = self.local.delete(physical)
             if self.redis_client:
-                return bool(self.redis_client.delete(key))
-            else:
-                if key in self._memory_cache:
-                    del self._memory_cache[key]
-                    return True
-            return False
+                return bool(self.redis_client.delete(physical)) or removed
+            return removed
         except Exception as e:
             print(f"Erro ao deletar cache {key}: {e}")
             return False
     
+    def get_many(self, keys: List[str]) -> Dict[str, Any]:
+        """Recupera várias chaves em uma ida ao Redis (MGET); chaves ausentes ficam fora do resultado"""
+        try:
+            records = self._read_many(self.versioned_keys(keys))
+        except Exception as e:
+            print(f"Erro ao recuperar chaves do cache: {e}")
+            records = [None] * len(keys)
+        valores = {}
+        for key, record in zip(keys, records):
+            self._record_lookup(key, 'fresh' if record is not None else 'miss')
+            if record is not None:
+                valores[key] = record.value
+        return valores
+    
+    def set_many(self, values: Dict[str, Any], ttl: int = 300) -> bool:
+        """Armazena várias chaves com o mesmo TTL em um único pipeline"""
+        try:
+            physicals = self.versioned_keys(list(values))
+            self._write_many({physical: (value, ttl, None)
+                              for physical, value in zip(physicals, values.values())})
+            return True
+        except Exception as e:
+            print(f"Erro ao armazenar chaves no cache: {e}")
+            return False
+    
+    def delete_many(self, keys: List[str]) -> int:
+        """Remove várias chaves em uma única chamada"""
+        if not keys:
+            return 0
+        try:
+            physicals = self.versioned_keys(keys)
+            removed = sum(1 for physical in physicals if self.local.delete(physical))
+            if self.redis_client:
+                return int(self.redis_client.unlink(*physicals))
+            return removed
+        except Exception as e:
+            print(f"Erro ao deletar chaves do cache: {e}")
+            return 0
+    
     def invalidate_pattern(self, pattern: str) -> int:
-        """Invalida múltiplas chaves por padrão"""
+        """
+        Invalida múltiplas chaves por padrão
+        
+        Padrões de namespace ('dashboard:*', 'dashboard:report:*') apenas
+        incrementam a geração; outros padrões varrem as chaves com SCAN
+        (sem bloquear o Redis como KEYS). Retorna o número de namespaces
+        ou chaves invalidados
+        
+        As chaves encontradas são removidas em lotes de 500 com UNLINK (a
+        memória é liberada fora da thread principal do Redis)
+        """
         try:
+            namespace = pattern[:-2] if pattern.endswith(':*') else None
+            if namespace and '*' not in namespace and namespace.count(':') <= 1:
+                self.bump_generation(namespace)
+                return 1
+            
+            removed = self.local.delete_matching(pattern.replace('*', ''))
             if self.redis_client:
-                keys = self.redis_client.keys(pattern)
-                if keys:
-                    return self.redis_client.delete(*keys)
+                removed = 0
+                batch = []
+                for key in self.redis_client.scan_iter(match=pattern, count=500):
+                    batch.append(key)
+                    if len(batch) >= 500:
+                        removed += self.redis_client.unlink(*batch)
+                        batch = []
+                if batch:
+                    removed += self.redis_client.unlink(*batch)
+            return removed
+        except Exception as e:
+            print(f"Erro ao invalidar padrão {pattern}: {e}")
+            return 0
+    
+    # Operações básicas (chaves físicas, já com geração)
+    
+    def _read(self, physical: str, use_local: bool = True) -> Optional[CacheRecord]:
+        inicio = time.perf_counter()
+        prefix = key_prefix(physical)
+        try:
+            if use_local:
+                record = self.local.get(physical)
+                if record is not None:
+                    self.metrics.incr(prefix, 'local_hits')
+                    return record
+            if self.redis_client:
+                payload = self.redis_client.get(physical)
+                if payload:
+                    record = self.codec.decode(payload)
+                    self.local.set(physical, record, self.local_ttl, size=len(record.json()))
+                    return record
+            return None
+        finally:
+            self.metrics.observe(prefix, 'get', time.perf_counter() - inicio)
+    
+    def _read_many(self, physicals: List[str], use_local: bool = True) -> List[Optional[CacheRecord]]:
+        """Como _read para várias chaves: o que faltar no nível local vem em um único MGET"""
+        inicio = time.perf_counter()
+        try:
+            records: List[Optional[CacheRecord]] = [None] * len(physicals)
+            pendentes = []
+            for i, physical in enumerate(physicals):
+                record = self.local.get(physical) if use_local else None
+                if record is not None:
+                    self.metrics.incr(key_prefix(physical), 'local_hits')
+                    records[i] = record
+                else:
+                    pendentes.append(i)
+            
+            if pendentes and self.redis_client:
+                payloads = self.redis_client.mget([physicals[i] for i in pendentes])
+                for i, payload in zip(pendentes, payloads):
+                    if payload:
+                        record = self.codec.decode(payload)
+                        self.local.set(physicals[i], record, self.local_ttl, size=len(record.json()))
+                        records[i] = record
+            return records
+        finally:
+            duracao = time.perf_counter() - inicio
+            for prefix in {key_prefix(physical) for physical in physicals}:
+                self.metrics.observe(prefix, 'get', duracao)
+    
+    def _write(self, physical: str, value: Any, ttl: int, stamp: Optional[float] = None) -> CacheRecord:
+        inicio = time.perf_counter()
+        try:
+            return self._write_payload(physical, value, ttl, stamp)
+        finally:
+            self.metrics.observe(key_prefix(physical), 'set', time.perf_counter() - inicio)
+    
+    def _write_payload(self, physical: str, value: Any, ttl: int, stamp: Optional[float]) -> CacheRecord:
+        payload = self.codec.encode(value, stamp)
+        # O nível local guarda o registro decodificado do payload: mesmos
+        # tipos de uma leitura do Redis e o JSON pronto para as respostas
+        record = self.codec.decode(payload)
+        if self.redis_client:
+            self.redis_client.setex(physical, ttl, payload)
+            ttl = min(ttl, self.local_ttl)
+        self.local.set(physical, record, ttl, size=len(record.json()))
+        return record
+    
+    def _write_many(self, entries: Dict[str, Tuple[Any, int, Optional[float]]]) -> Dict[str, CacheRecord]:
+        """Grava {chave física: (valor, ttl, instante)} em um único pipeline"""
+        inicio = time.perf_counter()
+        try:
+            gravados = {}
+            pipe = self.redis_client.pipeline(transaction=False) if self.redis_client else None
+            for physical, (value, ttl, stamp) in entries.items():
+                payload = self.codec.encode(value, stamp)
+                gravados[physical] = (self.codec.decode(payload), ttl)
+                if pipe is not None:
+                    pipe.setex(physical, ttl, payload)
+            if pipe is not None:
+                pipe.execute()
+            
+            for physical, (record, ttl) in gravados.items():
+                local_ttl = min(ttl, self.local_ttl) if self.redis_client else ttl
+                self.local.set(physical, record, local_ttl, size=len(record.json()))
+            return {physical: record for physical, (record, _) in gravados.items()}
+        finally:
+            duracao = time.perf_counter() - inicio
+            for prefix in {key_prefix(physical) for physical in entries}:
+                self.metrics.observe(prefix, 'set', duracao)
+    
+    # Telemetria
+    
+    def _record_lookup(self, key: str, state: str) -> None:
+        """Conta uma consulta ('fresh', 'stale' ou 'miss') no prefixo da chave"""
+        prefix = key_prefix(key)
+        if state == 'miss':
+            self.metrics.incr(prefix, 'misses')
+        else:
+            self.metrics.incr(prefix, 'hits')
+            if state == 'stale':
+                self.metrics.incr(prefix, 'stale_hits')
+        self.metrics.maybe_flush(self.redis_client)
+    
+    def get_prefix_stats(self, cluster: bool = True) -> Dict[str, Any]:
+        """
+        Telemetria por prefixo: deste processo e, com Redis, somada de
+        todos os workers ('cluster')
+        """
+        stats = {'process': self.metrics.snapshot(), 'since': self.metrics.started_at}
+        if cluster and self.redis_client:
+            try:
+                stats['cluster'] = self.metrics.cluster_snapshot(self.redis_client)
+            except Exception as e:
+                stats['cluster_error'] = str(e)
+        return stats
+    
+    # Stale-while-revalidate
+    
+    def get_policy(self, prefix: str) -> Dict[str, Any]:
+        """Política de TTL do prefixo (prefixos sem política: 300s, sem SWR)"""
+        return self.policies.get(prefix, {'soft_ttl': 300, 'hard_ttl': 300, 'swr': False})
+    
+    def get_entry(self, key: str) -> Optional[Tuple[Any, float]]:
+        """Recupera (valor, idade em segundos) de uma entrada gravada com set_entry"""
+        try:
+            record = self._read(self.versioned_key(key))
+        except Exception as e:
+            print(f"Erro ao recuperar cache {key}: {e}")
+            record = None
+        self._record_lookup(key, 'fresh' if record is not None else 'miss')
+        return (record.value, self._age(record)) if record is not None else None
+    
+    def set_entry(self, key: str, value: Any, prefix: str) -> bool:
+        """Armazena valor com o instante de gravação; expira no hard_ttl do prefixo"""
+        return bool(self._write_entry(self.versioned_key(key), value, prefix))
+    
+    def _entry_ttl(self, prefix: str) -> int:
+        policy = self.get_policy(prefix)
+        return policy['hard_ttl'] if policy['swr'] else policy['soft_ttl']
+    
+    @staticmethod
+    def _age(record: CacheRecord) -> float:
+        # Entrada gravada sem instante (antes do SWR): considerada fresca até expirar
+        return time.time() - record.stamp if record.stamp is not None else 0.0
+    
+    def _is_fresh(self, record: CacheRecord, soft_ttl: float) -> bool:
+        return not record.invalidated and self._age(record) < soft_ttl
+    
+    def _may_serve(self, record: CacheRecord) -> bool:
+        """Entradas invalidadas são servidas obsoletas, exceto na thread que as recalcula (ver recompute_invalidated)"""
+        return not (record.invalidated and getattr(self._staged, 'recompute_invalidated', False))
+    
+    def get_or_refresh(self, prefix: str, params: Optional[Dict[str, Any]],
+                       compute: Callable[[], Any], key: Optional[str] = None) -> Tuple[Any, str]:
+        """Retorna (valor, estado) com estado 'fresh', 'stale' ou 'miss' (ver get_or_refresh_record)"""
+        record, state = self.get_or_refresh_record(prefix, params, compute, key)
+        return record.value, state
+    
+    def get_or_refresh_record(self, prefix: str, params: Optional[Dict[str, Any]],
+                              compute: Callable[[], Any], key: Optional[str] = None) -> Tuple[CacheRecord, str]:
+        """
+        Retorna (registro, estado) com estado 'fresh', 'stale' ou 'miss';
+        record.json() dá o valor já codificado para a resposta HTTP
+        
+        Entradas além do soft_ttl são servidas imediatamente e um único
+        refresh em background recalcula o valor; sem entrada (ou além do
+        hard_ttl) o valor é calculado na hora
+        
+        A geração é resolvida antes do cálculo: um valor calculado durante
+        uma invalidação fica na geração antiga e não é servido depois dela
+        """
+        key = key or self._get_cache_key(prefix, params or {})
+        policy = self.get_policy(prefix)
+        physical = self.versioned_key(key)
+        
+        record = self._read_entry(physical)
+        if record is not None and not self._is_fresh(record, policy['soft_ttl']) and self.redis_client:
+            # A cópia local pode estar atrás de um valor já renovado por outro worker
+            record = self._read_entry(physical, use_local=False) or record
+        if record is not None and self._may_serve(record):
+            if self._is_fresh(record, policy['soft_ttl']):
+                self._record_lookup(key, 'fresh')
+                return record, 'fresh'
+            if policy['swr'] and self._age(record) < policy['hard_ttl']:
+                self._schedule_refresh(physical, prefix, compute)
+                self._record_lookup(key, 'stale')
+                return record, 'stale'
+        
+        record, state = self._single_flight(
+            physical, compute,
+            write=lambda value: self._write_entry(physical, value, prefix) or CacheRecord(value),
+            is_fresh=lambda record: self._is_fresh(record, policy['soft_ttl'])
+        )
+        self._record_lookup(key, state)
+        return record, state
+    
+    def get_or_refresh_many(self, specs: List[Tuple[str, Optional[Dict[str, Any]], Callable[[], Any], Optional[str]]]
+                            ) -> List[Tuple[CacheRecord, str]]:
+        """
+        get_or_refresh_record para vários fragmentos (prefixo, parâmetros,
+        cálculo, chave) de uma mesma resposta: as entradas são lidas em um
+        único MGET e os valores calculados na hora gravados em um único
+        pipeline. Retorna (registro, estado) na ordem de specs
+        """
+        keys = [key or self._get_cache_key(prefix, params or {}) for prefix, params, _, key in specs]
+        policies = [self.get_policy(prefix) for prefix, _, _, _ in specs]
+        physicals = self.versioned_keys(keys)
+        
+        records = self._read_many_entries(physicals)
+        if self.redis_client:
+            # Cópias locais além do soft_ttl podem estar atrás do Redis: relê de uma vez
+            antigos = [i for i, record in enumerate(records)
+                       if record is not None and not self._is_fresh(record, policies[i]['soft_ttl'])]
+            if antigos:
+                relidos = self._read_many_entries([physicals[i] for i in antigos], use_local=False)
+                for i, record in zip(antigos, relidos):
+                    records[i] = record or records[i]
+        
+        results: List[Optional[Tuple[CacheRecord, str]]] = [None] * len(specs)
+        faltando = []
+        for i, record in enumerate(records):
+            if record is not None and self._may_serve(record):
+                if self._is_fresh(record, policies[i]['soft_ttl']):
+                    results[i] = (record, 'fresh')
+                    continue
+                if policies[i]['swr'] and self._age(record) < policies[i]['hard_ttl']:
+                    self._schedule_refresh(physicals[i], specs[i][0], specs[i][2])
+                    results[i] = (record, 'stale')
+                    continue
+            faltando.append(i)
+        
+        # Faltas: calcula as que obtiver a trava e grava todas juntas
+        tokens = {i: self._acquire_fill(physicals[i]) for i in faltando}
+        try:
+            calculados = {i: self._compute_scoped(specs[i][2]) for i, token in tokens.items() if token is not None}
+            valores = {i: value for i, (value, _) in calculados.items()}
+            try:
+                gravados = self._write_many({
+                    physicals[i]: (value, self._entry_ttl(specs[i][0]), time.time())
+                    for i, value in valores.items()
+                }) if valores else {}
+            except Exception as e:
+                print(f"Erro ao armazenar fragmentos no cache: {e}")
+                gravados = {}
+            self._index_scopes({physicals[i]: scope for i, (_, scope) in calculados.items()})
+            for i, value in valores.items():
+                results[i] = (gravados.get(physicals[i]) or CacheRecord(value), 'miss')
+                self.metrics.incr(specs[i][0], 'fills')
+        finally:
+            for i, token in tokens.items():
+                if token is not None:
+                    self._release_fill(physicals[i], token)
+        
+        # Faltas sendo calculadas por outro processo/thread: aguarda (ou calcula) uma a uma
+        for i, token in tokens.items():
+            if token is None:
+                prefix, compute, physical = specs[i][0], specs[i][2], physicals[i]
+                results[i] = self._single_flight(
+                    physical, compute,
+                    write=lambda value, p=physical, x=prefix: self._write_entry(p, value, x) or CacheRecord(value),
+                    is_fresh=lambda record, s=policies[i]['soft_ttl']: self._is_fresh(record, s)
+                )
+        
+        for key, (_, state) in zip(keys, results):
+            self._record_lookup(key, state)
+        return results
+    
+    def get_or_compute(self, key: str, compute: Callable[[], Any], ttl: int = 300,
+                       stale_ttl: int = 0,
+                       cache_if: Optional[Callable[[Any], bool]] = None) -> Tuple[Any, str]:
+        """
+        Retorna (valor, estado) calculando o valor no máximo uma vez por
+        vez entre processos quando ausente ou expirado
+        
+        O valor é fresco por ttl segundos e fica guardado mais stale_ttl
+        segundos: nesse intervalo quem obtém a trava recalcula e os demais
+        recebem o valor obsoleto ('stale'). Sem valor, os demais aguardam
+        o cálculo em andamento. cache_if decide se o resultado é guardado
+        (ex.: apenas respostas com sucesso)
+        """
+        physical = self.versioned_key(key)
+        
+        def write(value):
+            if cache_if is not None and not cache_if(value):
+                return CacheRecord(value)
+            try:
+                return self._write(physical, value, ttl + stale_ttl, stamp=time.time())
+            except Exception as e:
+                print(f"Erro ao armazenar cache {physical}: {e}")
+                return CacheRecord(value)
+        
+        record = self._read_entry(physical)
+        if record is not None and not self._is_fresh(record, ttl) and self.redis_client:
+            record = self._read_entry(physical, use_local=False) or record
+        if record is not None and self._is_fresh(record, ttl):
+            self._record_lookup(key, 'fresh')
+            return record.value, 'fresh'
+        
+        stale = record if record is not None and self._may_serve(record) else None
+        record, state = self._single_flight(physical, compute, write,
+                                            is_fresh=lambda r: self._is_fresh(r, ttl), stale=stale)
+        self._record_lookup(key, state)
+        return record.value, state
+    
+    def _single_flight(self, physical: str, compute: Callable[[], Any],
+                       write: Callable[[Any], CacheRecord], is_fresh: Callable[[CacheRecord], bool],
+                       stale: Optional[CacheRecord] = None) -> Tuple[CacheRecord, str]:
+        """Calcula e grava se obtiver a trava; senão devolve o obsoleto ou aguarda quem calcula"""
+        token = self._acquire_fill(physical)
+        if token is None:
+            if stale is not None:
+                return stale, 'stale'
+            record = self._wait_fill(physical, is_fresh)
+            if record is not None:
+                return record, 'fresh'
+            # Quem calculava falhou ou demorou demais: calcula sem trava
+            return self._fill(physical, compute, write), 'miss'
+        
+        try:
+            return self._fill(physical, compute, write), 'miss'
+        finally:
+            self._release_fill(physical, token)
+    
+    def _fill(self, physical: str, compute: Callable[[], Any], write: Callable[[Any], Any]):
+        """Calcula e grava um valor, contando o preenchimento na telemetria"""
+        value, scope = self._compute_scoped(compute)
+        result = write(value)
+        self._index_scopes({physical: scope})
+        self.metrics.incr(key_prefix(physical), 'fills')
+        return result
+    
+    def _acquire_fill(self, physical: str) -> Optional[str]:
+        """Trava de preenchimento da chave: no processo e, com Redis, entre workers"""
+        with self._fill_lock:
+            if physical in self._filling:
+                return None
+            self._filling[physical] = threading.Event()
+        
+        token = uuid.uuid4().hex
+        if self.redis_client:
+            try:
+                acquired = self.redis_client.set(f'{physical}:fill', token, nx=True,
+                                                 px=int(self.fill_lock_ttl * 1000))
+            except Exception as e:
+                print(f"Erro ao obter trava de {physical}: {e}")
+                acquired = True
+            if not acquired:
+                self._release_fill(physical, None)
+                return None
+        return token
+    
+    def _release_fill(self, physical: str, token: Optional[str]) -> None:
+        if token and self.redis_client:
+            try:
+                # Só remove a trava se ainda for a nossa (pode ter expirado e sido retomada)
+                self.redis_client.eval(
+                    "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0",
+                    1, f'{physical}:fill', token
+                )
+            except Exception as e:
+                print(f"Erro ao liberar trava de {physical}: {e}")
+        with self._fill_lock:
+            event = self._filling.pop(physical, None)
+        if event is not None:
+            event.set()
+    
+    def _wait_fill(self, physical: str, is_fresh: Callable[[CacheRecord], bool]) -> Optional[CacheRecord]:
+        """Aguarda até fill_wait segundos pelo valor calculado por outro processo/thread"""
+        deadline = time.monotonic() + self.fill_wait
+        with self._fill_lock:
+            event = self._filling.get(physical)
+        
+        while True:
+            restante = deadline - time.monotonic()
+            if restante <= 0:
+                return None
+            if event is not None:
+                done = event.wait(restante)
+            else:
+                time.sleep(min(0.05, restante))
+                done = False
+            
+            # Valor de outro worker chega pelo Redis; o da mesma thread, também pelo nível local
+            record = self._read_entry(physical, use_local=event is not None or not self.redis_client)
+            if record is not None and is_fresh(record):
+                return record
+            if done:
+                # Quem calculava terminou sem gravar (ex.: resposta sem sucesso)
+                return None
+            if event is None and self.redis_client:
+                try:
+                    if not self.redis_client.exists(f'{physical}:fill'):
+                        record = self._read_entry(physical, use_local=False)
+                        return record if record is not None and is_fresh(record) else None
+                except Exception:
+                    return None
+    
+    def _read_entry(self, physical: str, use_local: bool = True) -> Optional[CacheRecord]:
+        try:
+            return self._read(physical, use_local)
+        except Exception as e:
+            print(f"Erro ao recuperar cache {physical}: {e}")
+            return None
+    
+    def _read_many_entries(self, physicals: List[str], use_local: bool = True) -> List[Optional[CacheRecord]]:
+        try:
+            return self._read_many(physicals, use_local)
+        except Exception as e:
+            print(f"Erro ao recuperar chaves do cache: {e}")
+            return [None] * len(physicals)
+    
+    def _write_entry(self, physical: str, value: Any, prefix: str) -> Optional[CacheRecord]:
+        """Grava com o instante atual (None se a gravação falhar)"""
+        try:
+            return self._write(physical, value, self._entry_ttl(prefix), stamp=time.time())
+        except Exception as e:
+            print(f"Erro ao armazenar cache {physical}: {e}")
+            return None
+    
+    def _schedule_refresh(self, key: str, prefix: str, compute: Callable[[], Any]) -> bool:
+        """Dispara um refresh em background por chave física (no processo e entre workers)"""
+        with self._refresh_lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+        
+        # Entre workers: apenas quem obtiver a marca no Redis recalcula
+        if self.redis_client:
+            try:
+                ttl = max(1, min(self.get_policy(prefix)['soft_ttl'], 60))
+                if not self.redis_client.set(f'{key}:refreshing', 1, nx=True, ex=ttl):
+                    with self._refresh_lock:
+                        self._refreshing.discard(key)
+                    return False
+            except Exception as e:
+                print(f"Erro ao reservar refresh de {key}: {e}")
+        
+        app = None
+        try:
+            from flask import current_app, has_app_context
+            if has_app_context():
+                app = current_app._get_current_object()
+        except ImportError:
+            pass
+        
+        def refresh():
+            try:
+                if app is not None:
+                    with app.app_context():
+                        self._fill(key, compute, lambda value: self._write_entry(key, value, prefix))
+                else:
+                    self._fill(key, compute, lambda value: self._write_entry(key, value, prefix))
+            except Exception as e:
+                print(f"Erro no refresh em background de {key}: {e}")
+            finally:
+                with self._refresh_lock:
+                    self._refreshing.discard(key)
+                if self.redis_client:
+                    try:
+                        self.redis_client.delete(f'{key}:refreshing')
+                    except Exception:
+                        pass
+        
+        threading.Thread(target=refresh, name=f'cache-refresh:{key}', daemon=True).start()
+        return True
+    
+    # Invalidação por partições (data, município)
+    
+    def declare_scope(self, start_date=None, end_date=None, municipios: Optional[List[str]] = None) -> None:
+        """
+        Chamado dentro do cálculo de um valor do dashboard: declara o
+        período e os municípios dos quais o valor depende (None = sem
+        limite). Valores sem escopo declarado dependem de todos os dados
+        """
+        self._scope.value = PartitionScope(start_date, end_date, municipios)
+    
+    def _compute_scoped(self, compute: Callable[[], Any]) -> Tuple[Any, PartitionScope]:
+        anterior = getattr(self._scope, 'value', None)
+        self._scope.value = None
+        try:
+            value = compute()
+            return value, self._scope.value or GLOBAL_SCOPE
+        finally:
+            self._scope.value = anterior
+    
+    @staticmethod
+    def _scope_index_key(physical: str) -> Optional[Tuple[str, str]]:
+        """(índice da geração, chave lógica) de uma chave física do dashboard"""
+        key, _, geracoes = physical.rpartition('#')
+        if not key.startswith('dashboard:'):
+            return None
+        return f"cache:scopes:{geracoes.split('.')[0]}", key
+    
+    def _index_scopes(self, scopes: Dict[str, PartitionScope]) -> None:
+        """Registra o escopo das chaves gravadas no índice da geração do dashboard"""
+        por_indice: Dict[str, Dict[str, str]] = {}
+        for physical, scope in scopes.items():
+            destino = self._scope_index_key(physical)
+            if destino:
+                por_indice.setdefault(destino[0], {})[destino[1]] = scope.encode()
+        if not por_indice:
+            return
+        try:
+            if self.redis_client:
+                pipe = self.redis_client.pipeline(transaction=False)
+                for indice, campos in por_indice.items():
+                    pipe.hset(indice, mapping=campos)
+                    pipe.expire(indice, self.scope_index_ttl)
+                pipe.execute()
             else:
-                # Fallback para cache em memória
-                keys_to_delete = [k for k in self._memory_cache.keys() if pattern.replace('*', '') in k]
-                for key in keys_to_delete:
-                    del self._memory_cache[key]
-                return len(keys_to_delete)
+                with self._generation_lock:
+                    for indice, campos in por_indice.items():
+                        self._scope_index.setdefault(indice, {}).update(campos)
+        except Exception as e:
+            print(f"Erro ao registrar escopo do cache: {e}")
+    
+    def invalidate_partitions(self, partitions: PartitionSet) -> Dict[str, Any]:
+        """
+        Marca como invalidadas, na geração atual do dashboard, apenas as
+        entradas cujo escopo cruza as partições alteradas; as demais
+        continuam frescas. As marcadas não são removidas: continuam servidas
+        obsoletas (com um único refresh em background) até o warm-up
+        regravá-las, e purge_invalidated remove as que sobrarem. Cópias
+        locais de outros workers vivem no máximo CACHE_LOCAL_TTL segundos
+        """
+        if not partitions:
+            return {'keys_checked': 0, 'keys_invalidated': 0}
+        try:
+            _, entradas, afetadas = self._keys_overlapping(partitions)
+            if afetadas:
+                self._mark_invalidated(self.versioned_keys(afetadas))
+            return {'keys_checked': len(entradas), 'keys_invalidated': len(afetadas)}
+        except Exception as e:
+            # Sem o índice não há como saber o que manter: invalida tudo
+            print(f"Erro na invalidação por partições, invalidando o dashboard: {e}")
+            self.invalidate_dashboard_cache()
+            return {'keys_checked': 0, 'keys_invalidated': None, 'fallback': 'dashboard:*'}
+    
+    def purge_invalidated(self, partitions: PartitionSet) -> int:
+        """
+        Remove as entradas das partições que continuam invalidadas (não
+        regravadas pelo warm-up nem por um refresh), antes que a nova versão
+        do dataset as sirva com um ETag novo
+        """
+        if not partitions:
             return 0
+        try:
+            indice, _, afetadas = self._keys_overlapping(partitions)
+            physicals = self.versioned_keys(afetadas)
+            records = self._read_many(physicals, use_local=not self.redis_client)
+            restantes = [i for i, record in enumerate(records) if record is not None and record.invalidated]
+            if not restantes:
+                return 0
+            for i in restantes:
+                self.local.delete(physicals[i])
+            if self.redis_client:
+                self.redis_client.unlink(*[physicals[i] for i in restantes])
+                self.redis_client.hdel(indice, *[afetadas[i] for i in restantes])
+            else:
+                with self._generation_lock:
+                    for i in restantes:
+                        self._scope_index.get(indice, {}).pop(afetadas[i], None)
+            return len(restantes)
         except Exception as e:
-            print(f"Erro ao invalidar padrão {pattern}: {e}")
+            print(f"Erro ao remover entradas invalidadas, invalidando o dashboard: {e}")
+            self.invalidate_dashboard_cache()
             return 0
     
+    def _keys_overlapping(self, partitions: PartitionSet) -> Tuple[str, Dict[str, Any], List[str]]:
+        """(índice de escopos da geração atual, suas entradas, chaves lógicas que cruzam as partições)"""
+        indice = f"cache:scopes:{self.current_generation('dashboard')}"
+        if self.redis_client:
+            entradas = {k.decode(): v for k, v in self.redis_client.hgetall(indice).items()}
+        else:
+            with self._generation_lock:
+                entradas = dict(self._scope_index.get(indice, {}))
+        afetadas = [key for key, scope in entradas.items() if PartitionScope.decode(scope).overlaps(partitions)]
+        return indice, entradas, afetadas
+    
+    def _mark_invalidated(self, physicals: List[str]) -> None:
+        """Marca as entradas como invalidadas mantendo valor e TTL (nível local e Redis)"""
+        for physical in physicals:
+            record = self.local.get(physical)
+            if record is not None:
+                record.invalidated = True
+        if not self.redis_client:
+            return
+        pipe = self.redis_client.pipeline(transaction=False)
+        for physical, payload in zip(physicals, self.redis_client.mget(physicals)):
+            if payload:
+                # XX: não recria uma entrada que expirou entre a leitura e a escrita
+                pipe.set(physical, self.codec.invalidate(payload), keepttl=True, xx=True)
+        pipe.execute()
+    
     # Métodos específicos para o dashboard
     
     def get_dashboard_overview(self, params: Dict[str, Any]) -> Optional[Dict]:
-        """Cache para overview do dashboard"""
-        key = self._get_cache_key("overview", params)
-        return self.get(key)
+        """Cache para overview do dashboard (inclui entradas obsoletas dentro do hard TTL)"""
+        entry = self.get_entry(self._get_cache_key("overview", params))
+        return entry[0] if entry else None
     
-    def set_dashboard_overview(self, params: Dict[str, Any], data: Dict, ttl: int = 300) -> bool:
-        """Armazena overview no cache (5 minutos padrão)"""
-        key = self._get_cache_key("overview", params)
-        return self.set(key, data, ttl)
+    def set_dashboard_overview(self, params: Dict[str, Any], data: Dict) -> bool:
+        """Armazena overview no cache (TTLs da política 'overview')"""
+        return self.set_entry(self._get_cache_key("overview", params), data, "overview")
     
     def get_metricas_diarias(self, params: Dict[str, Any]) -> Optional[Dict]:
         """Cache para métricas diárias"""
-        key = self._get_cache_key("metricas", params)
-        return self.get(key)
+        entry = self.get_entry(self._get_cache_key("metricas", params))
+        return entry[0] if entry else None
     
-    def set_metricas_diarias(self, params: Dict[str, Any], data: Dict, ttl: int = 600) -> bool:
-        """Armazena métricas no cache (10 minutos padrão)"""
-        key = self._get_cache_key("metricas", params)
-        return self.set(key, data, ttl)
+    def set_metricas_diarias(self, params: Dict[str, Any], data: Dict) -> bool:
+        """Armazena métricas no cache (TTLs da política 'metricas')"""
+        return self.set_entry(self._get_cache_key("metricas", params), data, "metricas")
     
     def get_municipios(self) -> Optional[list]:
         """Cache para lista de municípios"""
-        return self.get("dashboard:municipios")
+        entry = self.get_entry("dashboard:municipios")
+        return entry[0] if entry else None
     
-    def set_municipios(self, data: list, ttl: int = 3600) -> bool:
-        """Armazena municípios no cache (1 hora)"""
-        return self.set("dashboard:municipios", data, ttl)
+    def set_municipios(self, data: list) -> bool:
+        """Armazena municípios no cache (TTLs da política 'municipios')"""
+        return self.set_entry("dashboard:municipios", data, "municipios")
     
     def invalidate_dashboard_cache(self) -> int:
         """Invalida todo cache do dashboard"""
@@ -148,13 +971,20 @@ class CacheService:
                     'used_memory': info.get('used_memory_human', '0B'),
                     'keyspace_hits': info.get('keyspace_hits', 0),
                     'keyspace_misses': info.get('keyspace_misses', 0),
-                    'hit_rate': self._calculate_hit_rate(info)
+                    'hit_rate': self._calculate_hit_rate(info),
+                    'codec': self.codec.name,
+                    'local': self.local.get_stats(),
+                    'prefixes': self.get_prefix_stats()
                 }
             else:
+                local = self.local.get_stats()
                 return {
                     'cache_type': 'memory',
-                    'cached_keys': len(self._memory_cache),
-                    'memory_usage': 'N/A'
+                    'cached_keys': local['keys'],
+                    'memory_usage': f"{local['bytes']}B",
+                    'codec': self.codec.name,
+                    'local': local,
+                    'prefixes': self.get_prefix_stats()
                 }
         except Exception as e:
             return {'error': str(e)}
@@ -0,0 +1,426 @@
+#!/usr/bin/env python3
+"""
+Serviço Colunar - Motor analítico em memória (opcional)
+Mantém a tabela de corridas como arrays NumPy (municipio, motorista,
+usuario, status e motivo codificados por dicionário, timestamps int64 e
+receita float) gravados em arquivos .npy mapeados em memória, para que
+overview, distribuição horária, ranking e cancelamentos sejam respondidos
+com máscaras vetorizadas e bincount, sem ORM nem ida ao banco
+
+Ativação: COLUMNAR_ENGINE=1 (diretório em COLUMNAR_DATA_DIR)
+"""
+
+import json
+import os
+import shutil
+import threading
+from collections import namedtuple
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import func
+
+from backend.models import db, Corrida, StatusCorrida
+from backend.services.period_service import Periodo
+
+# Colunas numéricas persistidas e seus tipos
+COLUNAS = {
+    'id': np.int64,
+    'ts': np.int64,          # segundos desde a época (timestamps sem fuso, como em corridas.data)
+    'municipio': np.int32,
+    'motorista': np.int32,
+    'usuario': np.int32,
+    'status': np.int8,
+    'motivo': np.int32,      # -1 quando não há motivo de cancelamento
+    'valor': np.float64,     # NaN quando nulo
+    'avaliacao': np.float32  # NaN quando nula
+}
+
+# Colunas textuais codificadas por dicionário (coluna colunar -> coluna de corridas)
+DICIONARIOS = {
+    'municipio': 'municipio',
+    'motorista': 'motorista_nome',
+    'usuario': 'usuario_nome',
+    'motivo': 'motivo_cancelamento'
+}
+
+STATUS = list(StatusCorrida)
+CONCLUIDA = STATUS.index(StatusCorrida.CONCLUIDA)
+CANCELADA = STATUS.index(StatusCorrida.CANCELADA)
+PERDIDA = STATUS.index(StatusCorrida.PERDIDA)
+
+SEGUNDOS_DIA = 86400
+
+# Linhas com os mesmos atributos das queries SQL equivalentes
+HoraRow = namedtuple('HoraRow', 'hora total_corridas corridas_concluidas receita_total')
+RankingRow = namedtuple('RankingRow', 'municipio total_corridas corridas_concluidas receita_total '
+                                      'taxa_conversao_media avaliacao_media motoristas_ativos_media')
+MotivoRow = namedtuple('MotivoRow', 'motivo_cancelamento quantidade')
+CancelamentoHoraRow = namedtuple('CancelamentoHoraRow', 'hora cancelamentos')
+CancelamentoMunicipioRow = namedtuple('CancelamentoMunicipioRow', 'municipio cancelamentos percentual')
+
+
+def _epoch(momento: datetime) -> int:
+    return int(np.datetime64(momento, 's').astype(np.int64))
+
+
+class ColumnarService:
+    """Cópia colunar de corridas com refresh incremental por id"""
+
+    def __init__(self):
+        self.enabled = os.getenv('COLUMNAR_ENGINE', '').lower() in ('1', 'true', 'yes')
+        self.data_dir = os.getenv('COLUMNAR_DATA_DIR', os.path.join('data', 'columnar'))
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._meta = None
+        self._meta_mtime = None
+        self._arrays = {}
+        self._codigos = {}
+
+    # ------------------------------------------------------------------
+    # Armazenamento
+    # ------------------------------------------------------------------
+
+    @property
+    def _meta_path(self) -> str:
+        return os.path.join(self.data_dir, 'meta.json')
+
+    def is_ready(self) -> bool:
+        """True quando o motor está ativo e há um snapshot carregado"""
+        if not self.enabled:
+            return False
+        self._reload_if_changed()
+        return self._meta is not None
+
+    def _reload_if_changed(self) -> None:
+        """Recarrega o snapshot se outro worker publicou uma versão nova"""
+        try:
+            mtime = os.path.getmtime(self._meta_path)
+        except OSError:
+            return
+        if mtime == self._meta_mtime:
+            return
+
+        with self._lock:
+            with open(self._meta_path, encoding='utf-8') as f:
+                meta = json.load(f)
+            versao_dir = os.path.join(self.data_dir, f"v{meta['version']}")
+            self._arrays = {
+                nome: np.load(os.path.join(versao_dir, f'{nome}.npy'), mmap_mode='r')
+                for nome in COLUNAS
+            }
+            self._codigos = {
+                nome: {valor: codigo for codigo, valor in enumerate(valores)}
+                for nome, valores in meta['dicionarios'].items()
+            }
+            self._meta = meta
+            self._meta_mtime = mtime
+
+    def _next_version(self) -> int:
+        """Próxima versão livre (considera diretórios deixados por execuções anteriores)"""
+        versoes = [self._meta['version']] if self._meta else []
+        if os.path.isdir(self.data_dir):
+            versoes += [int(nome[1:]) for nome in os.listdir(self.data_dir)
+                        if nome.startswith('v') and nome[1:].isdigit()]
+        return max(versoes, default=0) + 1
+
+    def _publish(self, arrays: Dict[str, np.ndarray], meta: Dict) -> None:
+        """Grava uma nova versão do snapshot e aponta meta.json para ela"""
+        os.makedirs(self.data_dir, exist_ok=True)
+        versao_dir = os.path.join(self.data_dir, f"v{meta['version']}")
+        tmp_dir = f'{versao_dir}.tmp{os.getpid()}'
+        os.makedirs(tmp_dir, exist_ok=True)
+        for nome, array in arrays.items():
+            np.save(os.path.join(tmp_dir, f'{nome}.npy'), np.ascontiguousarray(array, dtype=COLUNAS[nome]))
+        try:
+            os.replace(tmp_dir, versao_dir)
+        except OSError:
+            # Outro worker publicou a mesma versão
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return
+
+        tmp_meta = f'{self._meta_path}.tmp{os.getpid()}'
+        with open(tmp_meta, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_meta, self._meta_path)
+
+        # Mantém a versão anterior (ainda mapeada por outros workers) e remove as mais antigas
+        for nome in os.listdir(self.data_dir):
+            if nome.startswith('v') and nome[1:].isdigit() and int(nome[1:]) < meta['version'] - 1:
+                shutil.rmtree(os.path.join(self.data_dir, nome), ignore_errors=True)
+
+    # ------------------------------------------------------------------
+    # Refresh
+    # ------------------------------------------------------------------
+
+    def refresh(self) -> Dict:
+        """
+        Atualiza o snapshot: anexa corridas com id maior que o último
+        carregado ou reconstrói tudo se linhas antigas foram alteradas
+        ou removidas
+        """
+        if not self.enabled:
+            return {'success': False, 'error': 'Motor colunar desativado'}
+
+        with self._refresh_lock:
+            self._reload_if_changed()
+            return self._refresh(self._meta)
+
+    def _refresh(self, meta: Optional[Dict]) -> Dict:
+        """Escolhe entre anexar linhas novas e reconstruir o snapshot"""
+        if meta is not None:
+            watermark = datetime.fromisoformat(meta['watermark']) if meta['watermark'] else None
+            antigas = db.session.query(
+                func.count(Corrida.id),
+                func.max(Corrida.updated_at)
+            ).filter(Corrida.id <= meta['max_id']).one()
+            alteradas = watermark is not None and antigas[1] is not None and antigas[1] > watermark
+            if antigas[0] != meta['rows'] or alteradas:
+                meta = None
+
+        if meta is None:
+            return self._rebuild()
+        return self._append(meta)
+
+    def _rebuild(self) -> Dict:
+        dicionarios = {nome: [] for nome in DICIONARIOS}
+        novas, watermark = self._load_rows(0, dicionarios)
+        versao = self._next_version()
+        meta = {
+            'version': versao,
+            'rows': len(novas['id']),
+            'max_id': int(novas['id'].max()) if len(novas['id']) else 0,
+            'watermark': watermark.isoformat() if watermark else None,
+            'dicionarios': dicionarios,
+            'updated_at': datetime.utcnow().isoformat()
+        }
+        self._publish(novas, meta)
+        self._reload_if_changed()
+        return {'success': True, 'mode': 'rebuild', 'rows': meta['rows'], 'version': versao}
+
+    def _append(self, meta: Dict) -> Dict:
+        dicionarios = {nome: list(valores) for nome, valores in meta['dicionarios'].items()}
+        novas, watermark = self._load_rows(meta['max_id'], dicionarios)
+        if not len(novas['id']):
+            return {'success': True, 'mode': 'noop', 'rows': meta['rows'], 'version': meta['version']}
+
+        arrays = {nome: np.concatenate([self._arrays[nome], novas[nome]]) for nome in COLUNAS}
+        anterior = datetime.fromisoformat(meta['watermark']) if meta['watermark'] else None
+        watermark = max(filter(None, [anterior, watermark]), default=None)
+        meta = {
+            'version': self._next_version(),
+            'rows': len(arrays['id']),
+            'max_id': int(novas['id'].max()),
+            'watermark': watermark.isoformat() if watermark else None,
+            'dicionarios': dicionarios,
+            'updated_at': datetime.utcnow().isoformat()
+        }
+        self._publish(arrays, meta)
+        self._reload_if_changed()
+        return {'success': True, 'mode': 'append', 'rows': meta['rows'],
+                'appended': len(novas['id']), 'version': meta['version']}
+
+    def _load_rows(self, after_id: int, dicionarios: Dict[str, List[str]]):
+        """Lê corridas com id > after_id e as codifica nas colunas (estende os dicionários)"""
+        rows = db.session.query(
+            Corrida.id, Corrida.data, Corrida.municipio, Corrida.motorista_nome,
+            Corrida.usuario_nome, Corrida.status, Corrida.motivo_cancelamento,
+            Corrida.valor, Corrida.avaliacao, Corrida.updated_at
+        ).filter(Corrida.id > after_id).order_by(Corrida.id).all()
+
+        codigos = {nome: {valor: codigo for codigo, valor in enumerate(valores)}
+                   for nome, valores in dicionarios.items()}
+
+        def codificar(nome, valores):
+            tabela, lista = codigos[nome], dicionarios[nome]
+            saida = np.empty(len(valores), dtype=COLUNAS[nome])
+            for i, valor in enumerate(valores):
+                if valor is None:
+                    saida[i] = -1
+                    continue
+                codigo = tabela.get(valor)
+                if codigo is None:
+                    codigo = tabela[valor] = len(lista)
+                    lista.append(valor)
+                saida[i] = codigo
+            return saida
+
+        n = len(rows)
+        colunas = list(zip(*rows)) if n else [()] * 10
+        arrays = {
+            'id': np.array(colunas[0], dtype=np.int64),
+            'ts': np.array(colunas[1], dtype='datetime64[s]').astype(np.int64) if n else np.empty(0, np.int64),
+            'municipio': codificar('municipio', colunas[2]),
+            'motorista': codificar('motorista', colunas[3]),
+            'usuario': codificar('usuario', colunas[4]),
+            'status': np.array([STATUS.index(s) for s in colunas[5]], dtype=np.int8),
+            'motivo': codificar('motivo', colunas[6]),
+            'valor': np.array([np.nan if v is None else float(v) for v in colunas[7]], dtype=np.float64),
+            'avaliacao': np.array([np.nan if v is None else v for v in colunas[8]], dtype=np.float32)
+        }
+        watermark = max(filter(None, colunas[9]), default=None)
+        return arrays, watermark
+
+    # ------------------------------------------------------------------
+    # Consultas
+    # ------------------------------------------------------------------
+
+    def _mask(self, periodo: Periodo, municipio=None) -> np.ndarray:
+        """Máscara de linhas no intervalo [início, fim) e, opcionalmente, no(s) município(s)"""
+        ts = self._arrays['ts']
+        mask = (ts >= _epoch(periodo.start)) & (ts < _epoch(periodo.end))
+        if municipio:
+            nomes = municipio if isinstance(municipio, (list, tuple, set)) else [municipio]
+            codigos = [self._codigos['municipio'][nome] for nome in nomes if nome in self._codigos['municipio']]
+            mask &= np.isin(self._arrays['municipio'], codigos)
+        return mask
+
+    def _nomes(self, coluna: str) -> List[str]:
+        return self._meta['dicionarios'][coluna]
+
+    def get_overview_metrics(self, periodo: Periodo, municipio=None) -> Dict:
+        """
+        Mesmo resultado de AggregationService.get_overview_metrics (contagens
+        distintas exatas); `municipio` pode ser um nome ou uma lista de nomes
+        """
+        atual = self._mask(periodo, municipio)
+        anterior = self._mask(periodo.previous(), municipio)
+        status = self._arrays['status']
+        valor = self._arrays['valor']
+        avaliacao = self._arrays['avaliacao']
+
+        por_status = np.bincount(status[atual], minlength=len(STATUS))
+        concluidas = atual & (status == CONCLUIDA)
+        avaliacoes = avaliacao[concluidas]
+        avaliacoes = avaliacoes[~np.isnan(avaliacoes)]
+
+        return {
+            'total_corridas': int(atual.sum()),
+            'corridas_concluidas': int(por_status[CONCLUIDA]),
+            'corridas_canceladas': int(por_status[CANCELADA]),
+            'corridas_perdidas': int(por_status[PERDIDA]),
+            'receita_total': round(float(np.nansum(valor[concluidas])), 2),
+            'motoristas_ativos': int(np.unique(self._arrays['motorista'][atual]).size),
+            'usuarios_unicos': int(np.unique(self._arrays['usuario'][atual]).size),
+            'aproximado': False,
+            'avaliacao_media': float(avaliacoes.astype(np.float64).mean()) if avaliacoes.size else 0.0,
+            'previous_corridas': int(anterior.sum()),
+            'previous_receita': round(float(np.nansum(valor[anterior & (status == CONCLUIDA)])), 2)
+        }
+
+    def get_hourly_distribution(self, periodo: Periodo, municipio: Optional[str] = None) -> List[HoraRow]:
+        """Corridas, concluídas e receita por hora do dia (horas sem corridas omitidas)"""
+        mask = self._mask(periodo, municipio)
+        horas = (self._arrays['ts'][mask] // 3600) % 24
+        concluida = self._arrays['status'][mask] == CONCLUIDA
+        valor = np.nan_to_num(self._arrays['valor'][mask])
+
+        total = np.bincount(horas, minlength=24)
+        concluidas = np.bincount(horas, weights=concluida, minlength=24)
+        receita = np.bincount(horas, weights=np.where(concluida, valor, 0), minlength=24)
+
+        return [
+            HoraRow(hora, int(total[hora]), int(concluidas[hora]), round(float(receita[hora]), 2))
+            for hora in np.flatnonzero(total).tolist()
+        ]
+
+    def get_municipio_ranking(self, periodo: Periodo) -> List[RankingRow]:
+        """Ranking de municípios por receita com médias diárias (como em metricas_diarias)"""
+        mask = self._mask(periodo)
+        municipio = self._arrays['municipio'][mask].astype(np.int64)
+        dia = self._arrays['ts'][mask] // SEGUNDOS_DIA
+        status = self._arrays['status'][mask]
+        valor = np.nan_to_num(self._arrays['valor'][mask])
+        avaliacao = self._arrays['avaliacao'][mask]
+        nomes = self._nomes('municipio')
+        if not municipio.size:
+            return []
+
+        # Grupos (município, dia), equivalentes às linhas de metricas_diarias
+        dia = dia - dia.min()
+        chave = municipio * (int(dia.max()) + 1) + dia
+        grupos, grupo = np.unique(chave, return_inverse=True)
+        grupo_municipio = grupos // (int(dia.max()) + 1)
+
+        concluida = status == CONCLUIDA
+        total_dia = np.bincount(grupo)
+        concluidas_dia = np.bincount(grupo, weights=concluida)
+        com_avaliacao = ~np.isnan(avaliacao)
+        soma_avaliacao = np.bincount(grupo[com_avaliacao], weights=avaliacao[com_avaliacao], minlength=len(grupos))
+        qtd_avaliacao = np.bincount(grupo[com_avaliacao], minlength=len(grupos))
+        avaliacao_dia = np.divide(soma_avaliacao, qtd_avaliacao, out=np.zeros(len(grupos)), where=qtd_avaliacao > 0)
+        motoristas_dia = np.bincount(
+            np.unique(grupo.astype(np.int64) * (len(self._nomes('motorista')) + 1) + self._arrays['motorista'][mask])
+            // (len(self._nomes('motorista')) + 1),
+            minlength=len(grupos)
+        )
+
+        n = len(nomes)
+        dias = np.bincount(grupo_municipio, minlength=n)
+        total = np.bincount(municipio, minlength=n)
+        concluidas = np.bincount(municipio, weights=concluida, minlength=n)
+        receita = np.bincount(municipio, weights=np.where(concluida, valor, 0), minlength=n)
+        taxa_media = np.bincount(grupo_municipio, weights=concluidas_dia / total_dia * 100, minlength=n)
+        avaliacao_media = np.bincount(grupo_municipio, weights=avaliacao_dia, minlength=n)
+        motoristas_media = np.bincount(grupo_municipio, weights=motoristas_dia, minlength=n)
+
+        ranking = [
+            RankingRow(nomes[i], int(total[i]), int(concluidas[i]), round(float(receita[i]), 2),
+                       taxa_media[i] / dias[i], avaliacao_media[i] / dias[i], motoristas_media[i] / dias[i])
+            for i in np.flatnonzero(dias).tolist()
+        ]
+        return sorted(ranking, key=lambda item: item.receita_total, reverse=True)
+
+    def get_cancellation_analysis(self, periodo: Periodo, municipio: Optional[str] = None) -> Dict:
+        """Totais, motivos, horários e municípios das corridas canceladas"""
+        mask = self._mask(periodo, municipio)
+        canceladas = mask & (self._arrays['status'] == CANCELADA)
+        total_cancelamentos = int(canceladas.sum())
+
+        motivos_codigo = self._arrays['motivo'][canceladas]
+        motivos_codigo = motivos_codigo[motivos_codigo >= 0]
+        qtd_motivos = np.bincount(motivos_codigo, minlength=len(self._nomes('motivo')))
+        nomes_motivos = self._nomes('motivo')
+        motivos = sorted(
+            (MotivoRow(nomes_motivos[i], int(qtd_motivos[i])) for i in np.flatnonzero(qtd_motivos).tolist()),
+            key=lambda item: item.quantidade, reverse=True
+        )
+
+        horas = np.bincount((self._arrays['ts'][canceladas] // 3600) % 24, minlength=24)
+        por_horario = [CancelamentoHoraRow(h, int(horas[h])) for h in np.flatnonzero(horas).tolist()]
+
+        por_municipio = []
+        if not municipio and total_cancelamentos:
+            nomes = self._nomes('municipio')
+            qtd = np.bincount(self._arrays['municipio'][canceladas], minlength=len(nomes))
+            por_municipio = sorted(
+                (CancelamentoMunicipioRow(nomes[i], int(qtd[i]), qtd[i] * 100.0 / total_cancelamentos)
+                 for i in np.flatnonzero(qtd).tolist()),
+                key=lambda item: item.cancelamentos, reverse=True
+            )
+
+        return {
+            'total_cancelamentos': total_cancelamentos,
+            'total_corridas': int(mask.sum()),
+            'motivos': motivos,
+            'por_horario': por_horario,
+            'por_municipio': por_municipio
+        }
+
+    def get_status(self) -> Dict:
+        """Resumo do snapshot carregado"""
+        if not self.is_ready():
+            return {'enabled': self.enabled, 'ready': False}
+        return {
+            'enabled': True,
+            'ready': True,
+            'version': self._meta['version'],
+            'rows': self._meta['rows'],
+            'max_id': self._meta['max_id'],
+            'updated_at': self._meta['updated_at']
+        }
+
+
+# Instância global do motor colunar
+columnar_service = ColumnarService()
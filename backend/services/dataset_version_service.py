@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Versão do Dataset - Contador monotônico das mudanças nos dados
+Incrementado após importações, sincronizações e recálculos; a versão
+persiste em versao_dataset e é espelhada no Redis para que a leitura
+(base dos ETags) não toque o banco a cada requisição
+"""
+
+import os
+import threading
+import time
+import logging
+from datetime import datetime
+from typing import Optional
+from sqlalchemy.exc import IntegrityError
+from backend.models import db, VersaoDataset
+from backend.services.cache_service import cache_service
+
+logger = logging.getLogger(__name__)
+
+REDIS_KEY = 'dataset:version'
+
+# Grava ARGV[1] apenas se for maior que o valor atual (a versão nunca retrocede)
+SET_IF_GREATER = (
+    "local atual = tonumber(redis.call('get', KEYS[1]) or '0') "
+    "if atual < tonumber(ARGV[1]) then redis.call('set', KEYS[1], ARGV[1]) return tonumber(ARGV[1]) end "
+    "return atual"
+)
+
+
+class DatasetVersionService:
+    """Lê e incrementa a versão do dataset"""
+
+    def __init__(self):
+        # Leituras memorizadas no processo por DATASET_VERSION_TTL segundos;
+        # incrementos feitos neste processo são vistos na hora
+        self.memo_ttl = float(os.getenv('DATASET_VERSION_TTL', '2'))
+        self._memo = (None, 0.0)
+        self._lock = threading.Lock()
+
+    def current(self) -> Optional[int]:
+        """Versão atual (None se não puder ser lida)"""
+        versao, lida_em = self._memo
+        if versao is not None and time.monotonic() - lida_em < self.memo_ttl:
+            return versao
+
+        try:
+            versao = None
+            redis_client = cache_service.redis_client
+            if redis_client:
+                valor = redis_client.get(REDIS_KEY)
+                versao = int(valor) if valor is not None else None
+            if versao is None:
+                versao = db.session.query(VersaoDataset.versao).filter_by(id=1).scalar() or 0
+                if redis_client:
+                    versao = int(redis_client.eval(SET_IF_GREATER, 1, REDIS_KEY, versao))
+        except Exception as e:
+            logger.warning(f"Erro ao ler versão do dataset: {e}")
+            return None
+
+        self._remember(versao)
+        return versao
+
+    def bump(self, motivo: str) -> int:
+        """Incrementa a versão (commit próprio; chamar após gravar os dados)"""
+        for tentativa in range(2):
+            try:
+                atualizadas = db.session.query(VersaoDataset).filter_by(id=1).update({
+                    VersaoDataset.versao: VersaoDataset.versao + 1,
+                    VersaoDataset.motivo: motivo,
+                    VersaoDataset.updated_at: datetime.utcnow()
+                }, synchronize_session=False)
+                if not atualizadas:
+                    db.session.add(VersaoDataset(id=1, versao=1, motivo=motivo))
+                    db.session.flush()
+                versao = db.session.query(VersaoDataset.versao).filter_by(id=1).scalar()
+                db.session.commit()
+                break
+            except IntegrityError:
+                # Outro processo criou a linha ao mesmo tempo: repetir como UPDATE
+                db.session.rollback()
+                if tentativa:
+                    raise
+
+        if cache_service.redis_client:
+            try:
+                versao = int(cache_service.redis_client.eval(SET_IF_GREATER, 1, REDIS_KEY, versao))
+            except Exception as e:
+                logger.warning(f"Erro ao publicar versão do dataset no Redis: {e}")
+
+        self._remember(versao)
+        logger.info(f"📦 Versão do dataset: {versao} ({motivo})")
+        return versao
+
+    def _remember(self, versao: int) -> None:
+        with self._lock:
+            atual = self._memo[0]
+            self._memo = (max(versao, atual or 0), time.monotonic())
+
+
+# Instância global da versão do dataset
+dataset_version_service = DatasetVersionService()
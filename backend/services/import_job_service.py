@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Jobs de Importação - Importações executadas fora da requisição HTTP
+POST /api/import/execute registra o ImportLog como 'queued' e responde na
+hora; a importação (leitura em blocos, gravação, recálculo das métricas e
+publicação da versão) roda em um pool de threads do processo, e a interface
+acompanha o andamento pelo ImportLog em GET /api/import/status/<id>
+
+Os workers do gunicorn são reciclados (--max-requests) e podem morrer
+(SIGKILL, OOM) com jobs em andamento. Cada processo grava heartbeat_at dos
+seus jobs a cada IMPORT_HEARTBEAT_SECONDS; jobs não finalizados sem
+heartbeat há IMPORT_STALE_SECONDS são marcados como 'failed' (reap_stale).
+A importação é uma única transação, então um job interrompido não deixa
+corridas gravadas. No PostgreSQL o limite IMPORT_WORKERS vale para todos
+os processos (advisory locks de sessão, liberados pelo banco se o processo
+morrer)
+"""
+
+import os
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, Set
+from flask import current_app
+from sqlalchemy import and_, func, text
+from backend.models import db, ImportLog
+
+logger = logging.getLogger(__name__)
+
+# Status finais de um ImportLog
+FINAL_STATUSES = ('completed', 'completed_with_errors', 'failed')
+
+# Primeira chave dos advisory locks das vagas de importação (uma por vaga)
+IMPORT_LOCK_KEY = 0x1A9_0000
+
+INTERRUPTED_MESSAGE = 'Importação interrompida (processo encerrado); envie o arquivo novamente'
+
+
+class ImportJobService:
+    """Executa importações em um pool de threads e detecta jobs órfãos"""
+
+    def __init__(self):
+        # Importações simultâneas (IMPORT_WORKERS); o padrão 1 enfileira os
+        # jobs e limita a memória ao bloco de uma importação
+        self.max_workers = max(1, int(os.getenv('IMPORT_WORKERS', '1')))
+        self.heartbeat_seconds = float(os.getenv('IMPORT_HEARTBEAT_SECONDS', '15'))
+        self.stale_seconds = float(os.getenv('IMPORT_STALE_SECONDS', '120'))
+        self.slot_poll_seconds = 2.0
+        self._executor = None
+        self._heartbeat = None
+        self._lock = threading.Lock()
+        # Jobs na fila ou em execução neste processo
+        self._active: Set[int] = set()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix='import-job')
+            return self._executor
+
+    def submit(self, import_log_id: int, job: Callable[[], Dict]) -> None:
+        """
+        Agenda `job` (requer contexto da aplicação; o job roda em um novo
+        contexto, com sessão própria). Exceções não tratadas pelo job
+        marcam o ImportLog como 'failed'
+        """
+        app = current_app._get_current_object()
+
+        def executar():
+            with app.app_context():
+                try:
+                    with self._slot():
+                        job()
+                except Exception as e:
+                    logger.error(f"Erro no job de importação {import_log_id}: {e}")
+                    db.session.rollback()
+                    self._mark_failed(import_log_id, str(e))
+                finally:
+                    with self._lock:
+                        self._active.discard(import_log_id)
+                    db.session.remove()
+
+        with self._lock:
+            self._active.add(import_log_id)
+            if self._heartbeat is None:
+                self._heartbeat = threading.Thread(target=self._heartbeat_loop, args=(app,),
+                                                   name='import-heartbeat', daemon=True)
+                self._heartbeat.start()
+        self._get_executor().submit(executar)
+
+    @contextmanager
+    def _slot(self):
+        """
+        Vaga de importação. No PostgreSQL, advisory lock de sessão em uma
+        conexão dedicada (vale entre processos); enquanto não há vaga o job
+        continua 'queued'. Nos demais bancos vale apenas o pool do processo
+        """
+        engine = db.engine
+        if engine.dialect.name != 'postgresql':
+            yield
+            return
+
+        conexao = engine.connect()
+        try:
+            while True:
+                for vaga in range(self.max_workers):
+                    chave = IMPORT_LOCK_KEY + vaga
+                    obtida = conexao.execute(text('SELECT pg_try_advisory_lock(:chave)'), {'chave': chave}).scalar()
+                    conexao.commit()
+                    if obtida:
+                        try:
+                            yield
+                        finally:
+                            try:
+                                conexao.execute(text('SELECT pg_advisory_unlock(:chave)'), {'chave': chave})
+                                conexao.commit()
+                            except Exception:
+                                # A conexão não volta ao pool com o lock preso
+                                conexao.invalidate()
+                        return
+                time.sleep(self.slot_poll_seconds)
+        finally:
+            conexao.close()
+
+    def _heartbeat_loop(self, app) -> None:
+        """Grava heartbeat_at dos jobs do processo enquanto houver algum"""
+        while True:
+            with self._lock:
+                ids = sorted(self._active)
+                if not ids:
+                    self._heartbeat = None
+                    return
+            with app.app_context():
+                self.touch(ids)
+            time.sleep(self.heartbeat_seconds)
+
+    @staticmethod
+    def touch(import_log_ids: Iterable[int]) -> None:
+        """
+        Atualiza heartbeat_at em transação própria. No SQLite a escrita
+        esperaria o lock da importação em andamento; lá os jobs do próprio
+        processo nunca são considerados órfãos (ver reap_stale)
+        """
+        engine = db.engine
+        if engine.dialect.name == 'sqlite':
+            return
+        tabela = ImportLog.__table__
+        try:
+            with engine.begin() as conexao:
+                conexao.execute(tabela.update().where(
+                    tabela.c.id.in_(list(import_log_ids)),
+                    tabela.c.status.notin_(FINAL_STATUSES)
+                ).values(heartbeat_at=datetime.utcnow()))
+        except Exception as e:
+            logger.warning(f"Erro ao gravar heartbeat das importações: {e}")
+
+    def reap_stale(self, startup: bool = False) -> int:
+        """
+        Marca como 'failed' os jobs não finalizados cujo heartbeat (ou
+        início) é mais antigo que stale_seconds, exceto os deste processo.
+        No SQLite só roda na inicialização (startup=True): durante uma
+        importação a escrita esperaria o lock da própria importação
+        """
+        if db.engine.dialect.name == 'sqlite' and not startup:
+            return 0
+
+        limite = datetime.utcnow() - timedelta(seconds=self.stale_seconds)
+        with self._lock:
+            ativos = set(self._active)
+
+        tabela = ImportLog.__table__
+        condicao = and_(
+            tabela.c.status.notin_(FINAL_STATUSES),
+            func.coalesce(tabela.c.heartbeat_at, tabela.c.started_at) < limite
+        )
+        if ativos:
+            condicao = and_(condicao, tabela.c.id.notin_(ativos))
+
+        try:
+            resultado = db.session.execute(tabela.update().where(condicao).values(
+                status='failed',
+                error_message=INTERRUPTED_MESSAGE,
+                completed_at=datetime.utcnow()
+            ))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.warning(f"Erro ao encerrar importações órfãs: {e}")
+            return 0
+
+        if resultado.rowcount:
+            logger.warning(f"{resultado.rowcount} importação(ões) órfã(s) marcada(s) como 'failed'")
+        return resultado.rowcount
+
+    @staticmethod
+    def _mark_failed(import_log_id: int, mensagem: str) -> None:
+        try:
+            import_log = db.session.get(ImportLog, import_log_id)
+            if import_log and import_log.status not in FINAL_STATUSES:
+                import_log.status = 'failed'
+                import_log.error_message = mensagem
+                import_log.completed_at = datetime.utcnow()
+                db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Erro ao registrar falha do job de importação {import_log_id}: {e}")
+
+
+# Instância global dos jobs de importação
+import_job_service = ImportJobService()
@@ -1,18 +1,61 @@
 import pandas as pd
+import numpy as np
+import codecs
+import io
 import os
-from typing import Dict, List, Optional, Tuple
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
 from datetime import datetime, timedelta
+from openpyxl import load_workbook
 from werkzeug.utils import secure_filename
 from backend.models import db, Corrida, Motorista, Meta, ImportLog, StatusCorrida, StatusMotorista, OrigemDado
+from backend.services.partitions import PartitionSet
 
 class ImportService:
     """Serviço para importação de planilhas locais"""
     
     SUPPORTED_FORMATS = ['.xlsx', '.xls', '.csv']
-    MAX_FILE_SIZE = 16 * 1024 * 1024  # 16MB
+    # CSV é lido em blocos (memória limitada pelo bloco, não pelo arquivo);
+    # Excel não tem leitura incremental e continua limitado
+    MAX_FILE_SIZE = int(os.getenv('IMPORT_MAX_FILE_SIZE', str(512 * 1024 * 1024)))  # 512MB
+    MAX_EXCEL_FILE_SIZE = int(os.getenv('IMPORT_MAX_EXCEL_FILE_SIZE', str(16 * 1024 * 1024)))  # 16MB
+    
+    # Encodings de CSV, na ordem de tentativa
+    CSV_ENCODINGS = ['utf-8', 'latin-1', 'iso-8859-1', 'cp1252']
+    
+    # Início do arquivo usado para detectar o encoding do CSV
+    ENCODING_SAMPLE_BYTES = 1024 * 1024
+    
+    # Linhas lidas para o preview
+    PREVIEW_ROWS = 100
+    
+    # Formatos de data aceitos, na ordem de tentativa
+    DATE_FORMATS = [
+        '%Y-%m-%d %H:%M:%S',
+        '%Y-%m-%d',
+        '%d/%m/%Y %H:%M:%S',
+        '%d/%m/%Y',
+        '%m/%d/%Y',
+        '%d-%m-%Y'
+    ]
+    
+    # Valores da coluna de status (minúsculos); os demais contam como concluída
+    STATUS_CORRIDA = {
+        'concluida': StatusCorrida.CONCLUIDA,
+        'concluída': StatusCorrida.CONCLUIDA,
+        'completed': StatusCorrida.CONCLUIDA,
+        'cancelada': StatusCorrida.CANCELADA,
+        'cancelled': StatusCorrida.CANCELADA,
+        'perdida': StatusCorrida.PERDIDA,
+        'lost': StatusCorrida.PERDIDA
+    }
     
     def __init__(self, upload_folder: str = 'uploads'):
         self.upload_folder = upload_folder
+        # Linhas por lote na gravação em massa (IMPORT_BATCH_SIZE)
+        self.batch_size = max(1, int(os.getenv('IMPORT_BATCH_SIZE', '5000')))
+        # Linhas por bloco na leitura do arquivo (IMPORT_CHUNK_SIZE)
+        self.chunk_size = max(1, int(os.getenv('IMPORT_CHUNK_SIZE', '50000')))
         self.ensure_upload_folder()
     
     def ensure_upload_folder(self):
@@ -43,10 +86,11 @@ class ImportService:
         file_size = file.tell()
         file.seek(0)
         
-        if file_size > self.MAX_FILE_SIZE:
+        max_size = self.MAX_FILE_SIZE if file_ext == '.csv' else self.MAX_EXCEL_FILE_SIZE
+        if file_size > max_size:
             return {
                 'valid': False,
-                'error': f'Arquivo muito grande. Máximo: {self.MAX_FILE_SIZE // (1024*1024)}MB'
+                'error': f'Arquivo muito grande. Máximo: {max_size // (1024*1024)}MB'
             }
         
         return {
@@ -62,28 +106,15 @@ class ImportService:
         file.save(filepath)
         return filepath
     
-    def read_file_data(self, filepath: str) -> Tuple[pd.DataFrame, Dict]:
-        """Lê dados do arquivo"""
+    def read_file_data(self, filepath: str, nrows: Optional[int] = None) -> Tuple[pd.DataFrame, Dict]:
+        """Lê dados do arquivo (apenas as primeiras nrows linhas, se informado)"""
         try:
             file_ext = os.path.splitext(filepath)[1].lower()
             
             if file_ext == '.csv':
-                # Tentar diferentes encodings para CSV
-                encodings = ['utf-8', 'latin-1', 'iso-8859-1', 'cp1252']
-                df = None
-                
-                for encoding in encodings:
-                    try:
-                        df = pd.read_csv(filepath, encoding=encoding)
-                        break
-                    except UnicodeDecodeError:
-                        continue
-                
-                if df is None:
-                    raise Exception("Não foi possível decodificar o arquivo CSV")
-                    
+                df = pd.read_csv(filepath, encoding=self.detect_csv_encoding(filepath), nrows=nrows)
             elif file_ext in ['.xlsx', '.xls']:
-                df = pd.read_excel(filepath)
+                df = pd.read_excel(filepath, nrows=nrows)
             else:
                 raise Exception(f"Formato não suportado: {file_ext}")
             
@@ -99,9 +130,98 @@ class ImportService:
                 'error': str(e)
             }
     
+    def detect_csv_encoding(self, filepath: str) -> str:
+        """
+        Primeiro encoding de CSV_ENCODINGS que decodifica os primeiros
+        ENCODING_SAMPLE_BYTES do arquivo (um caractere cortado no fim da
+        amostra não conta como erro). Bytes inválidos depois da amostra
+        aparecem na leitura: ver import_corridas
+        """
+        with open(filepath, 'rb') as arquivo:
+            amostra = arquivo.read(self.ENCODING_SAMPLE_BYTES)
+            completa = not arquivo.read(1)
+        for encoding in self.CSV_ENCODINGS:
+            try:
+                codecs.getincrementaldecoder(encoding)().decode(amostra, final=completa)
+                return encoding
+            except UnicodeDecodeError:
+                continue
+        raise Exception("Não foi possível decodificar o arquivo CSV")
+    
+    def csv_encoding_candidates(self, filepath: str) -> List[str]:
+        """Encoding detectado na amostra seguido dos próximos de CSV_ENCODINGS (para nova tentativa)"""
+        detectado = self.detect_csv_encoding(filepath)
+        return self.CSV_ENCODINGS[self.CSV_ENCODINGS.index(detectado):]
+    
+    def read_file_chunks(self, filepath: str, column_mapping: Optional[Dict] = None,
+                         encoding: Optional[str] = None) -> Iterator[pd.DataFrame]:
+        """
+        Lê o arquivo em blocos de chunk_size linhas (o índice segue a
+        numeração das linhas do arquivo). CSV é lido em streaming, só com as
+        colunas mapeadas e com os tipos de csv_dtypes (encoding detectado se
+        não informado); Excel é lido inteiro e fatiado
+        """
+        file_ext = os.path.splitext(filepath)[1].lower()
+        
+        if file_ext == '.csv':
+            encoding = encoding or self.detect_csv_encoding(filepath)
+            opcoes = {}
+            if column_mapping:
+                # Sem nenhuma coluna mapeada no arquivo o read_csv não teria
+                # linhas; lê todas para que cada linha seja reportada como erro
+                cabecalho = pd.read_csv(filepath, encoding=encoding, nrows=0).columns
+                colunas = [nome for nome in cabecalho if nome in set(column_mapping.values())]
+                if colunas:
+                    opcoes['usecols'] = colunas
+                opcoes['dtype'] = self.csv_dtypes(column_mapping)
+            with pd.read_csv(filepath, encoding=encoding, chunksize=self.chunk_size, **opcoes) as leitor:
+                yield from leitor
+        elif file_ext in ['.xlsx', '.xls']:
+            df = pd.read_excel(filepath)
+            for inicio in range(0, len(df), self.chunk_size):
+                yield df.iloc[inicio:inicio + self.chunk_size]
+        else:
+            raise Exception(f"Formato não suportado: {file_ext}")
+    
+    @staticmethod
+    def csv_dtypes(column_mapping: Dict) -> Dict[str, str]:
+        """
+        Tipos das colunas mapeadas na leitura do CSV: category para
+        município e status (poucos valores distintos) e string para os
+        demais textos (telefones não viram números). Colunas numéricas
+        aceitam "R$" e vírgula decimal e são convertidas no mapeamento
+        """
+        textos = ['data', 'usuario_nome', 'motorista_nome', 'usuario_telefone', 'motivo_cancelamento']
+        dtypes = {column_mapping[campo]: 'string' for campo in textos if campo in column_mapping}
+        for campo in ('municipio', 'status'):
+            if campo in column_mapping:
+                dtypes[column_mapping[campo]] = 'category'
+        return dtypes
+    
+    def count_rows(self, filepath: str, encoding: Optional[str] = None) -> int:
+        """
+        Total de linhas de dados do arquivo. CSV é contado em blocos; .xlsx
+        usa a dimensão gravada na primeira planilha, sem carregar as células
+        (a leitura em read_file_chunks dá o total exato)
+        """
+        file_ext = os.path.splitext(filepath)[1].lower()
+        if file_ext == '.csv':
+            with pd.read_csv(filepath, encoding=encoding or self.detect_csv_encoding(filepath), usecols=[0],
+                             chunksize=self.chunk_size) as leitor:
+                return sum(len(bloco) for bloco in leitor)
+        if file_ext == '.xlsx':
+            workbook = load_workbook(filepath, read_only=True)
+            try:
+                linhas = workbook.worksheets[0].max_row
+            finally:
+                workbook.close()
+            if linhas:
+                return max(linhas - 1, 0)
+        return len(pd.read_excel(filepath))
+    
     def preview_import(self, filepath: str, import_type: str) -> Dict:
         """Gera preview dos dados antes da importação"""
-        df, read_result = self.read_file_data(filepath)
+        df, read_result = self.read_file_data(filepath, nrows=self.PREVIEW_ROWS)
         
         if not read_result['success']:
             return read_result
@@ -115,9 +235,17 @@ class ImportService:
         # Amostra dos dados (primeiras 5 linhas)
         sample_data = df.head(5).to_dict('records')
         
+        try:
+            total_rows = self.count_rows(filepath)
+        except Exception as e:
+            return {
+                'success': False,
+                'error': str(e)
+            }
+        
         return {
             'success': True,
-            'total_rows': len(df),
+            'total_rows': total_rows,
             'columns': list(df.columns),
             'sample_data': sample_data,
             'detected_mapping': detected_mapping,
@@ -183,89 +311,126 @@ class ImportService:
         
         return detected
     
-    def import_corridas(self, filepath: str, column_mapping: Dict) -> Dict:
-        """Importa corridas do arquivo"""
-        # Criar log de importação
+    def create_import_log(self, filepath: str, import_type: str, status: str = 'processing') -> ImportLog:
+        """Registra uma importação (status 'queued' para jobs em background)"""
         import_log = ImportLog(
             filename=os.path.basename(filepath),
             file_size=os.path.getsize(filepath),
-            import_type='corridas',
-            status='processing'
+            import_type=import_type,
+            status=status,
+            processed_rows=0
         )
         db.session.add(import_log)
         db.session.commit()
+        return import_log
+    
+    def import_corridas(self, filepath: str, column_mapping: Dict, import_log_id: Optional[int] = None,
+                        remove_file: bool = False) -> Dict:
+        """
+        Importa corridas do arquivo (continuando o log import_log_id, se informado)
+        
+        Com remove_file=True o arquivo é removido assim que lido, antes de o
+        status final ser gravado: quem acompanha o ImportLog nunca vê a
+        importação finalizada com o upload ainda em disco
+        """
+        # Criar log de importação
+        if import_log_id is not None:
+            import_log = db.session.get(ImportLog, import_log_id)
+        else:
+            import_log = self.create_import_log(filepath, 'corridas')
         
         try:
-            df, read_result = self.read_file_data(filepath)
-            
-            if not read_result['success']:
-                import_log.status = 'failed'
-                import_log.error_message = read_result['error']
-                import_log.completed_at = datetime.utcnow()
-                db.session.commit()
-                return read_result
-            
-            import_log.total_rows = len(df)
+            import_log.status = 'processing'
             db.session.commit()
             
-            success_count = 0
-            error_count = 0
-            errors = []
-            
-            for index, row in df.iterrows():
+            # O encoding do CSV vem do início do arquivo; um byte inválido
+            # depois dele só aparece na leitura, que então é desfeita e
+            # refeita com o próximo encoding
+            candidatos = [None]
+            if os.path.splitext(filepath)[1].lower() == '.csv':
+                candidatos = self.csv_encoding_candidates(filepath)
+            for tentativa, encoding in enumerate(candidatos):
                 try:
-                    # Mapear dados da linha
-                    corrida_data = self.map_row_to_corrida(row, column_mapping)
-                    
-                    # Criar corrida
-                    corrida = Corrida(**corrida_data)
-                    db.session.add(corrida)
-                    
-                    success_count += 1
-                    
-                except Exception as e:
-                    error_count += 1
-                    errors.append(f"Linha {index + 2}: {str(e)}")
-                    
-                    # Limitar número de erros reportados
-                    if len(errors) > 10:
-                        errors.append(f"... e mais {error_count - 10} erros")
-                        break
+                    # Total conhecido antes de gravar, para o progresso (CSV contado em blocos)
+                    import_log.total_rows = self.count_rows(filepath, encoding)
+                    db.session.commit()
+                    gravacao = self.write_chunks(filepath, column_mapping, encoding, import_log.id)
+                    break
+                except UnicodeDecodeError:
+                    db.session.rollback()
+                    if tentativa == len(candidatos) - 1:
+                        raise Exception("Não foi possível decodificar o arquivo CSV")
+            
+            if remove_file:
+                self.remove_file(filepath)
+            
+            total_rows = gravacao['total_rows']
+            success_count = gravacao['success_count']
+            error_count = gravacao['error_count']
+            errors = gravacao['errors']
+            changes = gravacao['changes']
+            batch_timings = gravacao['batch_timings']
+            insert_seconds = gravacao['insert_seconds']
             
-            # Commit das corridas
+            inicio_commit = time.perf_counter()
             db.session.commit()
+            insert_seconds += time.perf_counter() - inicio_commit
+            
+            if error_count > 10:
+                errors.append(f"... e mais {error_count - 10} erros")
             
             # Atualizar log
+            import_log.total_rows = total_rows
+            import_log.insert_seconds = round(insert_seconds, 3)
+            import_log.rows_per_second = round(success_count / insert_seconds, 1) if insert_seconds > 0 else None
+            import_log.batch_timings = batch_timings
+            import_log.processed_rows = total_rows
             import_log.success_rows = success_count
             import_log.error_rows = error_count
-            import_log.status = 'completed' if error_count == 0 else 'completed_with_errors'
-            import_log.completed_at = datetime.utcnow()
             
             if errors:
                 import_log.error_message = '\n'.join(errors[:10])
             
             db.session.commit()
             
-            # Recalcular métricas após importação bem-sucedida
+            # Recalcular só as métricas das partições (data, município) gravadas
+            publicacao = {}
             if success_count > 0:
+                from backend.services.sync_service import DataSyncService
+                sync_service = DataSyncService()
                 try:
-                    from backend.services.sync_service import DataSyncService
-                    sync_service = DataSyncService()
-                    sync_service.recalculate_daily_metrics()
+                    sync_service.recalculate_partitions(changes)
                     print(f"✅ Métricas recalculadas após importação de {success_count} corridas")
                 except Exception as sync_error:
                     print(f"⚠️ Erro ao recalcular métricas: {sync_error}")
             
+            # Concluída quando dados e métricas estão gravados; o warm-up do
+            # cache não segura o job
+            import_log.status = 'completed' if error_count == 0 else 'completed_with_errors'
+            import_log.completed_at = datetime.utcnow()
+            db.session.commit()
+            
+            if success_count > 0:
+                # Invalida na hora o cache das partições alteradas; o warm-up e
+                # a nova versão dos dados são publicados em background
+                try:
+                    publicacao = sync_service.publish_data_change('import', changes, background=True)
+                except Exception as publish_error:
+                    print(f"⚠️ Erro ao publicar a importação: {publish_error}")
+            
             return {
                 'success': True,
                 'imported': success_count,
                 'errors': error_count,
                 'error_details': errors[:10],
-                'import_log_id': import_log.id
+                'import_log_id': import_log.id,
+                **publicacao
             }
             
         except Exception as e:
             db.session.rollback()
+            if remove_file:
+                self.remove_file(filepath)
             import_log.status = 'failed'
             import_log.error_message = str(e)
             import_log.completed_at = datetime.utcnow()
@@ -277,110 +442,257 @@ class ImportService:
                 'import_log_id': import_log.id
             }
     
-    def map_row_to_corrida(self, row: pd.Series, column_mapping: Dict) -> Dict:
-        """Mapeia uma linha do DataFrame para dados de Corrida"""
-        data = {}
-        
-        # Campos obrigatórios
-        data['data'] = self.parse_datetime(row.get(column_mapping.get('data')))
-        data['usuario_nome'] = str(row.get(column_mapping.get('usuario_nome', ''), '')).strip()
-        data['motorista_nome'] = str(row.get(column_mapping.get('motorista_nome', ''), '')).strip()
-        data['municipio'] = str(row.get(column_mapping.get('municipio', ''), '')).strip()
-        
-        # Status
-        status_value = str(row.get(column_mapping.get('status', ''), '')).strip().lower()
-        if status_value in ['concluida', 'concluída', 'completed']:
-            data['status'] = StatusCorrida.CONCLUIDA
-        elif status_value in ['cancelada', 'cancelled']:
-            data['status'] = StatusCorrida.CANCELADA
-        elif status_value in ['perdida', 'lost']:
-            data['status'] = StatusCorrida.PERDIDA
-        else:
-            data['status'] = StatusCorrida.CONCLUIDA  # Default
+    def write_chunks(self, filepath: str, column_mapping: Dict, encoding: Optional[str],
+                     import_log_id: int) -> Dict:
+        """
+        Mapeia (operações por coluna) e grava cada bloco do arquivo antes de
+        ler o próximo, sem commit: o commit único de import_corridas mantém
+        a importação atômica
+        """
+        total_rows = success_count = error_count = 0
+        errors = []
+        changes = PartitionSet()
+        batch_timings = []
+        insert_seconds = 0.0
+        
+        for bloco in self.read_file_chunks(filepath, column_mapping, encoding):
+            corridas, row_errors = self.map_corridas_frame(bloco, column_mapping)
+            invalid = row_errors.notna()
+            total_rows += len(bloco)
+            
+            error_count += int(invalid.sum())
+            errors.extend(f"Linha {index + 2}: {mensagem}"
+                          for index, mensagem in row_errors[invalid].head(10 - len(errors)).items())
+            
+            corridas = corridas[~invalid]
+            success_count += len(corridas)
+            
+            # Partições (data, município) que recebem corridas novas
+            changes.update(self.frame_partitions(corridas))
+            
+            # Gravação em lotes fora do ORM
+            inicio_gravacao = time.perf_counter()
+            batch_timings.extend(self.bulk_insert_corridas(corridas))
+            insert_seconds += time.perf_counter() - inicio_gravacao
+            
+            self.report_progress(import_log_id, total_rows)
+        
+        return {
+            'total_rows': total_rows,
+            'success_count': success_count,
+            'error_count': error_count,
+            'errors': errors,
+            'changes': changes,
+            'batch_timings': batch_timings,
+            'insert_seconds': insert_seconds
+        }
+    
+    @staticmethod
+    def report_progress(import_log_id: int, processed_rows: int) -> None:
+        """
+        Grava processed_rows em conexão própria, fora da transação da
+        importação (que só faz commit no final), para que /status acompanhe
+        o andamento. No SQLite a escrita esperaria o lock da própria
+        importação: o progresso só aparece ao final
+        """
+        engine = db.engine
+        if engine.dialect.name == 'sqlite':
+            return
+        tabela = ImportLog.__table__
+        try:
+            with engine.begin() as conexao:
+                conexao.execute(tabela.update().where(tabela.c.id == import_log_id)
+                                .values(processed_rows=processed_rows, heartbeat_at=datetime.utcnow()))
+        except Exception as e:
+            print(f"⚠️ Erro ao gravar progresso da importação {import_log_id}: {e}")
+    
+    def map_corridas_frame(self, df: pd.DataFrame, column_mapping: Dict) -> Tuple[pd.DataFrame, pd.Series]:
+        """
+        Mapeia o DataFrame para as colunas de Corrida com operações por coluna
+        
+        Retorna (corridas, erros): erros tem a mensagem das linhas inválidas
+        (data ausente ou em formato não reconhecido) e None nas demais.
+        Textos ausentes viram '' nos campos obrigatórios e None nos opcionais
+        """
+        def coluna(campo: str) -> pd.Series:
+            nome = column_mapping.get(campo)
+            if nome is not None and nome in df.columns:
+                return df[nome]
+            return pd.Series(None, index=df.index, dtype=object)
+        
+        def texto(campo: str, vazio: Optional[str] = '') -> pd.Series:
+            serie = coluna(campo)
+            limpo = serie.astype('string').str.strip().astype(object)
+            return limpo.where(serie.notna(), vazio)
+        
+        corridas = pd.DataFrame(index=df.index)
+        corridas['data'], erros = self.parse_datetime_column(coluna('data'))
+        corridas['usuario_nome'] = texto('usuario_nome')
+        corridas['motorista_nome'] = texto('motorista_nome')
+        # Poucos valores distintos: category mantém o bloco compacto
+        corridas['municipio'] = texto('municipio').astype('category')
+        
+        status = texto('status').str.lower().map(self.STATUS_CORRIDA)
+        corridas['status'] = status.where(status.notna(), StatusCorrida.CONCLUIDA).astype('category')
         
         # Campos opcionais
         if 'usuario_telefone' in column_mapping:
-            data['usuario_telefone'] = str(row.get(column_mapping['usuario_telefone'], '')).strip()
+            corridas['usuario_telefone'] = texto('usuario_telefone', None)
         
         if 'valor' in column_mapping:
-            data['valor'] = self.parse_decimal(row.get(column_mapping['valor']))
+            corridas['valor'] = self.parse_number_column(coluna('valor'), remove=('R$', ' '))
         
         if 'distancia' in column_mapping:
-            data['distancia'] = self.parse_float(row.get(column_mapping['distancia']))
+            corridas['distancia'] = self.parse_number_column(coluna('distancia'))
         
         if 'tempo_corrida' in column_mapping:
-            data['tempo_corrida'] = self.parse_int(row.get(column_mapping['tempo_corrida']))
+            corridas['tempo_corrida'] = self.parse_number_column(coluna('tempo_corrida'), decimal_comma=False, integer=True)
         
         if 'avaliacao' in column_mapping:
-            data['avaliacao'] = self.parse_int(row.get(column_mapping['avaliacao']))
+            corridas['avaliacao'] = self.parse_number_column(coluna('avaliacao'), decimal_comma=False, integer=True)
         
         if 'motivo_cancelamento' in column_mapping:
-            data['motivo_cancelamento'] = str(row.get(column_mapping['motivo_cancelamento'], '')).strip()
+            corridas['motivo_cancelamento'] = texto('motivo_cancelamento', None)
         
         # Origem do dado
-        data['origem_dado'] = OrigemDado.IMPORT
+        corridas['origem_dado'] = OrigemDado.IMPORT
         
-        return data
+        return corridas, erros
     
-    def parse_datetime(self, value) -> datetime:
-        """Converte valor para datetime"""
-        if pd.isna(value):
-            raise ValueError("Data é obrigatória")
-        
-        if isinstance(value, datetime):
-            return value
-        
-        # Tentar diferentes formatos
-        formats = [
-            '%Y-%m-%d %H:%M:%S',
-            '%Y-%m-%d',
-            '%d/%m/%Y %H:%M:%S',
-            '%d/%m/%Y',
-            '%m/%d/%Y',
-            '%d-%m-%Y'
-        ]
-        
-        value_str = str(value).strip()
-        
-        for fmt in formats:
-            try:
-                return datetime.strptime(value_str, fmt)
-            except ValueError:
-                continue
-        
-        raise ValueError(f"Formato de data inválido: {value}")
+    def parse_datetime_column(self, serie: pd.Series) -> Tuple[pd.Series, pd.Series]:
+        """
+        Converte a coluna em datas (células datetime ou texto em um dos
+        DATE_FORMATS, na ordem): (datas, mensagens de erro por linha)
+        """
+        vazias = serie.isna()
+        if pd.api.types.is_datetime64_any_dtype(serie):
+            datas = serie.astype('datetime64[ns]')
+        else:
+            datas = pd.Series(pd.NaT, index=serie.index, dtype='datetime64[ns]')
+            # Células que já são datas (ex.: planilhas Excel)
+            ja_datas = serie.map(lambda valor: isinstance(valor, datetime)).astype(bool)
+            if ja_datas.any():
+                datas[ja_datas] = pd.to_datetime(serie[ja_datas])
+            
+            texto = serie.astype('string').str.strip()
+            for fmt in self.DATE_FORMATS:
+                pendentes = datas.isna() & ~vazias
+                if not pendentes.any():
+                    break
+                datas[pendentes] = pd.to_datetime(texto[pendentes], format=fmt, errors='coerce')
+        
+        erros = pd.Series(None, index=serie.index, dtype=object)
+        erros[vazias] = 'Data é obrigatória'
+        invalidas = datas.isna() & ~vazias
+        if invalidas.any():
+            erros[invalidas] = 'Formato de data inválido: ' + serie[invalidas].astype('string')
+        return datas, erros
     
-    def parse_decimal(self, value) -> Optional[float]:
-        """Converte valor para decimal"""
-        if pd.isna(value) or value == '':
-            return None
-        
-        try:
-            # Remover caracteres não numéricos (exceto . e ,)
-            clean_value = str(value).replace('R$', '').replace(' ', '').replace(',', '.')
-            return float(clean_value)
-        except (ValueError, TypeError):
-            return None
+    @staticmethod
+    def parse_number_column(serie: pd.Series, remove: Tuple[str, ...] = (), decimal_comma: bool = True,
+                            integer: bool = False) -> pd.Series:
+        """
+        Converte a coluna em números: remove os trechos de `remove` (ex.:
+        'R$'), aceita vírgula decimal e, com integer=True, trunca em
+        inteiros. Valores inválidos viram nulos
+        """
+        if pd.api.types.is_numeric_dtype(serie):
+            numeros = pd.to_numeric(serie, errors='coerce').astype(float)
+        else:
+            texto = serie.astype('string').str.strip()
+            for trecho in remove:
+                texto = texto.str.replace(trecho, '', regex=False)
+            if decimal_comma:
+                texto = texto.str.replace(',', '.', regex=False)
+            numeros = pd.to_numeric(texto, errors='coerce').astype(float)
+        
+        if integer:
+            # int(float(valor)): trunca em direção a zero
+            numeros = np.trunc(numeros.where(np.isfinite(numeros))).astype('Int64')
+            # Menor inteiro que comporta os valores (ex.: notas em Int8)
+            numeros = pd.to_numeric(numeros, downcast='integer')
+        return numeros
     
-    def parse_float(self, value) -> Optional[float]:
-        """Converte valor para float"""
-        if pd.isna(value) or value == '':
-            return None
-        
+    @staticmethod
+    def frame_records(frame: pd.DataFrame) -> List[Dict]:
+        """Linhas do DataFrame como dicionários de tipos Python (nulos como None)"""
+        colunas = {}
+        for nome, serie in frame.items():
+            if pd.api.types.is_datetime64_any_dtype(serie):
+                valores = [None if pd.isna(v) else v for v in serie.dt.to_pydatetime()]
+            else:
+                valores = serie.astype(object).where(serie.notna(), None).tolist()
+                if pd.api.types.is_float_dtype(serie) or pd.api.types.is_integer_dtype(serie):
+                    valores = [None if v is None else v.item() if hasattr(v, 'item') else v for v in valores]
+            colunas[nome] = valores
+        nomes = list(colunas)
+        return [dict(zip(nomes, linha)) for linha in zip(*colunas.values())]
+    
+    def bulk_insert_corridas(self, corridas: pd.DataFrame) -> List[Dict]:
+        """
+        Grava as corridas mapeadas em lotes de batch_size sem passar pelo
+        ORM (nada fica no identity map): COPY FROM STDIN no PostgreSQL com
+        psycopg2 e INSERT em executemany nos demais bancos. Usa a transação
+        da sessão (sem commit) e retorna o tempo de cada lote
+        """
+        conexao = db.session.connection()
+        tabela = Corrida.__table__
+        usar_copy = conexao.dialect.name == 'postgresql' and conexao.dialect.driver == 'psycopg2'
+        agora = datetime.utcnow()
+        
+        lotes = []
+        for inicio in range(0, len(corridas), self.batch_size):
+            t0 = time.perf_counter()
+            registros = self.frame_records(corridas.iloc[inicio:inicio + self.batch_size])
+            for registro in registros:
+                registro['created_at'] = registro['updated_at'] = agora
+            
+            if usar_copy:
+                self._copy_rows(conexao, tabela, registros)
+            else:
+                conexao.execute(tabela.insert(), registros)
+            lotes.append({'rows': len(registros), 'seconds': round(time.perf_counter() - t0, 4)})
+        return lotes
+    
+    @staticmethod
+    def _copy_rows(conexao, tabela, registros: List[Dict]) -> None:
+        """COPY ... FROM STDIN (formato texto) de um lote de registros"""
+        colunas = list(registros[0])
+        # Mesma conversão do INSERT do SQLAlchemy (ex.: enums para o valor gravado)
+        conversores = [tabela.c[nome].type.bind_processor(conexao.dialect) for nome in colunas]
+        
+        buffer = io.StringIO()
+        for registro in registros:
+            valores = []
+            for nome, converter in zip(colunas, conversores):
+                valor = registro[nome]
+                if converter is not None and valor is not None:
+                    valor = converter(valor)
+                valores.append(_copy_text(valor))
+            buffer.write('\t'.join(valores))
+            buffer.write('\n')
+        buffer.seek(0)
+        
+        cursor = conexao.connection.cursor()
         try:
-            return float(str(value).replace(',', '.'))
-        except (ValueError, TypeError):
-            return None
+            cursor.copy_expert(f"COPY {tabela.name} ({', '.join(colunas)}) FROM STDIN", buffer)
+        finally:
+            cursor.close()
     
-    def parse_int(self, value) -> Optional[int]:
-        """Converte valor para int"""
-        if pd.isna(value) or value == '':
-            return None
-        
+    @staticmethod
+    def frame_partitions(frame: pd.DataFrame) -> List[Tuple]:
+        """Pares (data, município) distintos das corridas mapeadas"""
+        pares = pd.DataFrame({'data': frame['data'].dt.date, 'municipio': frame['municipio']}).drop_duplicates()
+        return list(pares.itertuples(index=False, name=None))
+    
+    @staticmethod
+    def remove_file(filepath: str) -> None:
+        """Remove o arquivo importado (upload temporário)"""
         try:
-            return int(float(str(value)))
-        except (ValueError, TypeError):
-            return None
+            if os.path.exists(filepath):
+                os.remove(filepath)
+        except OSError as e:
+            print(f"⚠️ Não foi possível remover arquivo temporário {filepath}: {e}")
     
     def get_import_history(self, limit: int = 50) -> List[Dict]:
         """Retorna histórico de importações"""
@@ -403,3 +715,13 @@ class ImportService:
                         print(f"Arquivo removido: {filename}")
                     except Exception as e:
                         print(f"Erro ao remover {filename}: {e}")
+
+
+def _copy_text(valor) -> str:
+    """Valor no formato texto do COPY (\\N para nulos, com escapes de controle)"""
+    if valor is None:
+        return '\\N'
+    if isinstance(valor, datetime):
+        return valor.isoformat(sep=' ')
+    texto = str(valor)
+    return texto.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Cache Local - Camada LRU/TTL em processo
+Mantém os valores mais usados na memória do worker, limitada por número
+de itens e por bytes em cada prefixo, para servir chaves quentes sem
+ida ao Redis (e como único nível quando o Redis está indisponível)
+"""
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+# Limites por prefixo (max_items, max_bytes). Prefixos sem limite próprio
+# usam 'default'. Sobrescrevíveis por CACHE_LOCAL_<PREFIXO>_MAX_ITEMS e
+# CACHE_LOCAL_<PREFIXO>_MAX_BYTES
+DEFAULT_LOCAL_LIMITS = {
+    'overview': {'max_items': 256, 'max_bytes': 8 * 1024 * 1024},
+    'metricas': {'max_items': 128, 'max_bytes': 16 * 1024 * 1024},
+    'municipios': {'max_items': 4, 'max_bytes': 1024 * 1024},
+    'report': {'max_items': 16, 'max_bytes': 2 * 1024 * 1024},
+    'chat': {'max_items': 256, 'max_bytes': 4 * 1024 * 1024},
+    'default': {'max_items': 256, 'max_bytes': 4 * 1024 * 1024},
+}
+
+
+def load_local_limits() -> Dict[str, Dict[str, int]]:
+    """Limites padrão com os overrides de variáveis de ambiente"""
+    limits = {}
+    for prefix, limit in DEFAULT_LOCAL_LIMITS.items():
+        env = f'CACHE_LOCAL_{prefix.upper()}'
+        limits[prefix] = {
+            'max_items': int(os.getenv(f'{env}_MAX_ITEMS', limit['max_items'])),
+            'max_bytes': int(os.getenv(f'{env}_MAX_BYTES', limit['max_bytes']))
+        }
+    return limits
+
+
+def key_prefix(key: str) -> str:
+    """Prefixo de política de uma chave: 'dashboard:overview:ab12#3.0' -> 'overview', 'chat:ab12' -> 'chat'"""
+    partes = key.split('#', 1)[0].split(':')
+    if partes[0] == 'dashboard' and len(partes) > 1:
+        return partes[1]
+    return partes[0]
+
+
+def estimate_size(value: Any) -> int:
+    """Tamanho aproximado em bytes (JSON serializado) de um valor"""
+    if isinstance(value, (bytes, str)):
+        return len(value)
+    try:
+        return len(json.dumps(value, default=str))
+    except (TypeError, ValueError):
+        return 1024
+
+
+class LocalCache:
+    """LRU com TTL segmentado por prefixo; cada segmento tem seus próprios limites"""
+
+    def __init__(self, limits: Optional[Dict[str, Dict[str, int]]] = None,
+                 on_evict: Optional[Callable[[str], None]] = None):
+        self.limits = limits or load_local_limits()
+        # Chamado com o prefixo a cada evicção por limite (telemetria)
+        self.on_evict = on_evict
+        # prefixo -> OrderedDict(chave -> (valor, expira_em, bytes)), do menos ao mais recente
+        self._segments: Dict[str, OrderedDict] = {}
+        self._bytes: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def _limit(self, prefix: str) -> Dict[str, int]:
+        return self.limits.get(prefix, self.limits['default'])
+
+    def get(self, key: str) -> Optional[Any]:
+        prefix = key_prefix(key)
+        with self._lock:
+            segment = self._segments.get(prefix)
+            item = segment.get(key) if segment else None
+            if item is None:
+                return None
+            value, expires_at, _ = item
+            if expires_at <= time.monotonic():
+                self._remove(prefix, key)
+                self.expirations += 1
+                return None
+            segment.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: float, size: Optional[int] = None) -> bool:
+        """Armazena valor por ttl segundos; evita os menos usados do prefixo se exceder os limites"""
+        if ttl <= 0:
+            return False
+        prefix = key_prefix(key)
+        limit = self._limit(prefix)
+        size = estimate_size(value) if size is None else size
+        if size > limit['max_bytes'] or limit['max_items'] <= 0:
+            # Valor maior que o segmento inteiro: não fica no nível local
+            self.delete(key)
+            return False
+
+        with self._lock:
+            self._remove(prefix, key)
+            segment = self._segments.setdefault(prefix, OrderedDict())
+            segment[key] = (value, time.monotonic() + ttl, size)
+            self._bytes[prefix] = self._bytes.get(prefix, 0) + size
+
+            while len(segment) > limit['max_items'] or self._bytes[prefix] > limit['max_bytes']:
+                oldest = next(iter(segment))
+                self._remove(prefix, oldest)
+                self.evictions += 1
+                if self.on_evict:
+                    self.on_evict(prefix)
+        return True
+
+    def delete(self, key: str) -> bool:
+        prefix = key_prefix(key)
+        with self._lock:
+            return self._remove(prefix, key)
+
+    def delete_matching(self, fragment: str) -> int:
+        """Remove as chaves que contêm o fragmento (padrão glob sem '*')"""
+        with self._lock:
+            chaves = [(prefix, key) for prefix, segment in self._segments.items()
+                      for key in segment if fragment in key]
+            for prefix, key in chaves:
+                self._remove(prefix, key)
+        return len(chaves)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._segments.clear()
+            self._bytes.clear()
+
+    def _remove(self, prefix: str, key: str) -> bool:
+        """Remove uma chave (chamar com o lock)"""
+        segment = self._segments.get(prefix)
+        if not segment or key not in segment:
+            return False
+        _, _, size = segment.pop(key)
+        self._bytes[prefix] -= size
+        return True
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(len(segment) for segment in self._segments.values())
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'keys': sum(len(segment) for segment in self._segments.values()),
+                'bytes': sum(self._bytes.values()),
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'segments': {
+                    prefix: {
+                        'keys': len(segment),
+                        'bytes': self._bytes.get(prefix, 0),
+                        'max_items': self._limit(prefix)['max_items'],
+                        'max_bytes': self._limit(prefix)['max_bytes']
+                    }
+                    for prefix, segment in self._segments.items()
+                }
+            }
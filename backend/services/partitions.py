@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Partições de Dados - Pares (data, município) alterados e escopos de cache
+Importações, sincronizações e recálculos informam quais partições
+(data, município) alteraram; cada valor do cache do dashboard registra o
+escopo (período e municípios) do qual depende, e só as entradas cujo
+escopo cruza as partições alteradas precisam ser invalidadas
+"""
+
+import json
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import date
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from backend.services.period_service import parse_date
+
+
+class PartitionSet:
+    """Conjunto de partições (data, município)"""
+
+    def __init__(self, partitions: Iterable[Tuple[date, str]] = ()):
+        self._partitions = set()
+        self._by_municipio: Optional[Dict[str, List[date]]] = None
+        self.update(partitions)
+
+    def add(self, data, municipio: str) -> None:
+        self._partitions.add((parse_date(data), municipio))
+        self._by_municipio = None
+
+    def update(self, partitions: Iterable[Tuple[date, str]]) -> None:
+        for data, municipio in partitions:
+            self.add(data, municipio)
+
+    def __len__(self) -> int:
+        return len(self._partitions)
+
+    def __iter__(self) -> Iterator[Tuple[date, str]]:
+        return iter(self._partitions)
+
+    def __contains__(self, partition) -> bool:
+        return partition in self._partitions
+
+    @property
+    def municipios(self) -> List[str]:
+        return sorted(self.by_municipio())
+
+    @property
+    def start_date(self) -> Optional[date]:
+        return min((data for data, _ in self._partitions), default=None)
+
+    @property
+    def end_date(self) -> Optional[date]:
+        return max((data for data, _ in self._partitions), default=None)
+
+    def by_municipio(self) -> Dict[str, List[date]]:
+        """Datas alteradas (ordenadas) por município"""
+        if self._by_municipio is None:
+            datas = defaultdict(list)
+            for data, municipio in self._partitions:
+                datas[municipio].append(data)
+            self._by_municipio = {municipio: sorted(lista) for municipio, lista in datas.items()}
+        return self._by_municipio
+
+    def date_runs(self) -> Dict[str, List[Tuple[date, date]]]:
+        """Intervalos de datas alteradas consecutivas (início, fim inclusive) por município"""
+        intervalos = {}
+        for municipio, datas in self.by_municipio().items():
+            lista = [[datas[0], datas[0]]]
+            for data in datas[1:]:
+                if (data - lista[-1][1]).days == 1:
+                    lista[-1][1] = data
+                else:
+                    lista.append([data, data])
+            intervalos[municipio] = [tuple(intervalo) for intervalo in lista]
+        return intervalos
+
+    def to_dict(self) -> Dict:
+        """Resumo para as respostas da API"""
+        return {
+            'count': len(self),
+            'start_date': self.start_date.isoformat() if self.start_date else None,
+            'end_date': self.end_date.isoformat() if self.end_date else None,
+            'municipios': self.municipios
+        }
+
+
+class PartitionScope:
+    """Período e municípios dos quais um valor em cache depende (None = sem limite)"""
+
+    __slots__ = ('start_date', 'end_date', 'municipios')
+
+    def __init__(self, start_date=None, end_date=None, municipios: Optional[Iterable[str]] = None):
+        self.start_date = parse_date(start_date)
+        self.end_date = parse_date(end_date)
+        self.municipios = frozenset(municipios) if municipios is not None else None
+
+    def overlaps(self, partitions: PartitionSet) -> bool:
+        """True se alguma partição alterada cai dentro do escopo"""
+        por_municipio = partitions.by_municipio()
+        candidatos = por_municipio.keys() if self.municipios is None else self.municipios
+        for municipio in candidatos:
+            datas = por_municipio.get(municipio)
+            if not datas:
+                continue
+            i = 0 if self.start_date is None else bisect_left(datas, self.start_date)
+            if i < len(datas) and (self.end_date is None or datas[i] <= self.end_date):
+                return True
+        return False
+
+    def encode(self) -> str:
+        return json.dumps([
+            self.start_date.isoformat() if self.start_date else None,
+            self.end_date.isoformat() if self.end_date else None,
+            sorted(self.municipios) if self.municipios is not None else None
+        ])
+
+    @classmethod
+    def decode(cls, value) -> 'PartitionScope':
+        if isinstance(value, bytes):
+            value = value.decode()
+        start_date, end_date, municipios = json.loads(value)
+        return cls(start_date, end_date, municipios)
+
+
+# Escopo de valores que dependem de todos os dados (sempre invalidados)
+GLOBAL_SCOPE = PartitionScope()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Resolução de Períodos - Filtros de data compatíveis com índices
+Converte os parâmetros start_date/end_date em intervalos semiabertos
+de timestamps [início, fim) para que o banco use idx_corridas_data
+e idx_corridas_data_municipio em vez de func.date(coluna)
+"""
+
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, Mapping, Optional
+from sqlalchemy import and_
+
+
+def parse_date(value) -> Optional[date]:
+    """Converte string ISO (data ou data/hora), date ou datetime para date"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.fromisoformat(str(value).strip()).date()
+
+
+class Periodo:
+    """Período de consulta com datas inclusivas e timestamps semiabertos"""
+
+    def __init__(self, start_date: date, end_date: date):
+        if end_date < start_date:
+            raise ValueError('end_date deve ser maior ou igual a start_date')
+        self.start_date = start_date
+        self.end_date = end_date
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Periodo) and \
+            (self.start_date, self.end_date) == (other.start_date, other.end_date)
+
+    def __repr__(self) -> str:
+        return f'<Periodo {self.start_date} - {self.end_date}>'
+
+    @property
+    def start(self) -> datetime:
+        """Primeiro instante do período (inclusivo)"""
+        return datetime.combine(self.start_date, datetime.min.time())
+
+    @property
+    def end(self) -> datetime:
+        """Primeiro instante após o período (exclusivo)"""
+        return datetime.combine(self.end_date + timedelta(days=1), datetime.min.time())
+
+    @property
+    def dias(self) -> int:
+        return (self.end_date - self.start_date).days + 1
+
+    def filter(self, column):
+        """Condição sargável `início <= coluna < fim` para colunas timestamp"""
+        return and_(column >= self.start, column < self.end)
+
+    def filter_dates(self, column):
+        """Condição `início <= coluna <= fim` para colunas do tipo date"""
+        return column.between(self.start_date, self.end_date)
+
+    def previous(self) -> 'Periodo':
+        """Período imediatamente anterior com a mesma duração"""
+        previous_end = self.start_date - timedelta(days=1)
+        return Periodo(previous_end - timedelta(days=self.dias - 1), previous_end)
+
+    def extend_to(self, other: 'Periodo') -> 'Periodo':
+        """Menor período que cobre este e `other`"""
+        return Periodo(min(self.start_date, other.start_date), max(self.end_date, other.end_date))
+
+    def to_dict(self) -> Dict[str, str]:
+        return {
+            'start_date': self.start_date.isoformat(),
+            'end_date': self.end_date.isoformat()
+        }
+
+    @classmethod
+    def from_month(cls, mes) -> 'Periodo':
+        """Período que cobre o mês inteiro de `mes`"""
+        mes = parse_date(mes).replace(day=1)
+        if mes.month == 12:
+            next_month = mes.replace(year=mes.year + 1, month=1)
+        else:
+            next_month = mes.replace(month=mes.month + 1)
+        return cls(mes, next_month - timedelta(days=1))
+
+    @classmethod
+    def last_days(cls, days: int, end_date: Optional[date] = None) -> 'Periodo':
+        """Últimos `days` dias até `end_date` (hoje por padrão)"""
+        end_date = end_date or datetime.utcnow().date()
+        return cls(end_date - timedelta(days=days), end_date)
+
+
+def resolve_period(args: Mapping, default_days: int = 30,
+                   default_start: Optional[Callable[[], Optional[date]]] = None) -> Periodo:
+    """
+    Resolve start_date/end_date dos parâmetros da requisição
+
+    Sem end_date usa hoje; sem start_date usa `default_start()` (ex.: data
+    mais antiga disponível) ou, se não houver, `default_days` dias atrás.
+    """
+    end_date = parse_date(args.get('end_date')) or datetime.utcnow().date()
+    start_date = parse_date(args.get('start_date'))
+
+    if start_date is None and default_start is not None:
+        start_date = parse_date(default_start())
+    if start_date is None:
+        start_date = end_date - timedelta(days=default_days)
+
+    return Periodo(start_date, end_date)
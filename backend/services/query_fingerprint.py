@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Impressão Digital de Consultas - Parâmetros canônicos das chaves de cache
+Resolve os padrões de período para datas concretas, normaliza nomes de
+municípios e ordena as listas, de modo que requisições equivalentes
+(formatação, ordem dos parâmetros, grafia do município) compartilhem a
+mesma entrada de cache em todos os endpoints. Padrões que dependem dos
+dados (data mais antiga, municípios conhecidos) são memorizados por
+versão do dataset
+"""
+
+import re
+import threading
+import unicodedata
+from datetime import date
+from typing import Any, Callable, Dict, List, Mapping, Optional
+from sqlalchemy import func
+from backend.models import db, Corrida
+from backend.services.dataset_version_service import dataset_version_service
+from backend.services.period_service import Periodo, resolve_period
+
+_memo: Dict[Any, Any] = {}
+_memo_lock = threading.Lock()
+
+
+def _per_version(nome: str, calcular: Callable[[], Any]) -> Any:
+    """Valor derivado dos dados, recalculado quando a versão do dataset muda"""
+    versao = dataset_version_service.current()
+    if versao is None:
+        return calcular()
+    chave = (nome, versao)
+    with _memo_lock:
+        if chave in _memo:
+            return _memo[chave]
+    valor = calcular()
+    with _memo_lock:
+        for antiga in [k for k in _memo if k[0] == nome]:
+            del _memo[antiga]
+        _memo[chave] = valor
+    return valor
+
+
+def reset_defaults() -> None:
+    """Descarta os padrões memorizados (ex.: antes de aquecer o cache com dados novos)"""
+    with _memo_lock:
+        _memo.clear()
+
+
+def earliest_date(column) -> Callable[[], Optional[date]]:
+    """Padrão de start_date: a data mais antiga da coluna (memorizada por versão)"""
+    return lambda: _per_version(f'min:{column}', lambda: db.session.query(func.min(column)).scalar())
+
+
+def _fold(nome: str) -> str:
+    sem_acento = unicodedata.normalize('NFKD', nome)
+    sem_acento = ''.join(c for c in sem_acento if not unicodedata.combining(c))
+    return sem_acento.casefold()
+
+
+def _known_municipios() -> Dict[str, str]:
+    """Grafia de cada município cadastrado, indexada pela forma sem acentos/caixa"""
+    def carregar():
+        nomes = [m[0] for m in db.session.query(Corrida.municipio).distinct().all() if m[0]]
+        return {_fold(nome): nome for nome in nomes}
+    return _per_version('municipios', carregar)
+
+
+def normalize_municipio(nome: Optional[str]) -> Optional[str]:
+    """Nome canônico do município: espaços colapsados e grafia do cadastro (sem diferenciar caixa/acentos)"""
+    if nome is None:
+        return None
+    nome = re.sub(r'\s+', ' ', str(nome)).strip()
+    if not nome:
+        return None
+    return _known_municipios().get(_fold(nome), nome)
+
+
+def parse_municipios(args) -> List[str]:
+    """Lista de municípios de `municipios` (repetido ou separado por vírgula), sem duplicatas"""
+    municipios = []
+    for valor in args.getlist('municipios'):
+        for nome in valor.split(','):
+            nome = nome.strip()
+            if nome and nome not in municipios:
+                municipios.append(nome)
+    return municipios
+
+
+class QueryFingerprint:
+    """Período concreto e municípios canônicos de uma consulta do dashboard"""
+
+    def __init__(self, periodo: Periodo, municipio: Optional[str] = None,
+                 municipios: Optional[List[str]] = None):
+        self.periodo = periodo
+        self.municipio = municipio
+        self.municipios = municipios or []
+
+    def cache_params(self) -> Dict[str, Any]:
+        """Parâmetros da chave de cache (apenas valores canônicos)"""
+        params = {**self.periodo.to_dict(), 'municipio': self.municipio}
+        if self.municipios:
+            params['municipios'] = self.municipios
+        return params
+
+    def scope_municipios(self) -> Optional[List[str]]:
+        """Municípios dos quais a consulta depende (None = todos)"""
+        return self.municipios or ([self.municipio] if self.municipio else None)
+
+
+def canonical_query(args: Mapping, default_days: int = 30,
+                    default_start: Optional[Callable[[], Optional[date]]] = None) -> QueryFingerprint:
+    """
+    Impressão digital dos parâmetros da requisição: mesmo contrato de
+    resolve_period, com municipio/municipios normalizados e ordenados
+    """
+    periodo = resolve_period(args, default_days=default_days, default_start=default_start)
+    municipios = sorted({normalize_municipio(nome) for nome in parse_municipios(args)})
+    return QueryFingerprint(periodo, normalize_municipio(args.get('municipio')), municipios)
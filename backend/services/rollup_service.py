@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Serviço de Rollups - Métricas semanais e mensais
+Deriva metricas_semanais e metricas_mensais de metricas_diarias e as
+atualiza apenas para as semanas/meses cujos dias mudaram, sem depender
+de date_trunc (funciona em PostgreSQL e SQLite)
+"""
+
+import logging
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Set, Tuple
+from sqlalchemy import func
+from backend.models import db, MetricaDiaria, MetricaSemanal, MetricaMensal
+from backend.services.hll import merge_sketches
+from backend.services.period_service import Periodo
+
+logger = logging.getLogger(__name__)
+
+
+def week_start(dia: date) -> date:
+    """Segunda-feira da semana de `dia` (mesma convenção de date_trunc('week'))"""
+    return dia - timedelta(days=dia.weekday())
+
+
+def month_start(dia: date) -> date:
+    return dia.replace(day=1)
+
+
+def next_month(dia: date) -> date:
+    """Primeiro dia do mês seguinte ao de `dia`"""
+    return (month_start(dia) + timedelta(days=32)).replace(day=1)
+
+
+def split_period(periodo: Periodo) -> Tuple[List[date], List[date], List[date]]:
+    """
+    Decompõe o período em meses inteiros, semanas inteiras (segunda a
+    domingo) fora desses meses e dias avulsos, para que um período longo
+    seja lido de metricas_mensais/semanais com poucas linhas
+    """
+    inicio, fim = periodo.start_date, periodo.end_date
+    meses, semanas, dias = [], [], []
+
+    mes = inicio if inicio.day == 1 else next_month(inicio)
+    while next_month(mes) - timedelta(days=1) <= fim:
+        meses.append(mes)
+        mes = next_month(mes)
+
+    trechos = [(inicio, meses[0] - timedelta(days=1)), (mes, fim)] if meses else [(inicio, fim)]
+    for trecho_inicio, trecho_fim in trechos:
+        dia = trecho_inicio
+        while dia <= trecho_fim:
+            if dia.weekday() == 0 and dia + timedelta(days=6) <= trecho_fim:
+                semanas.append(dia)
+                dia += timedelta(days=7)
+            else:
+                dias.append(dia)
+                dia += timedelta(days=1)
+    return meses, semanas, dias
+
+
+class RollupService:
+    """Mantém os rollups semanal e mensal a partir das métricas diárias"""
+
+    def refresh_for_days(self, dias: Iterable[date]) -> Dict[str, int]:
+        """Reconstrói as semanas e meses que contêm algum dos dias informados (sem commit)"""
+        dias = set(dias)
+        semanas = {week_start(d) for d in dias}
+        meses = {month_start(d) for d in dias}
+
+        return {
+            'weeks_refreshed': self._refresh(MetricaSemanal, MetricaSemanal.semana, 'semana', semanas,
+                                             lambda inicio: Periodo(inicio, inicio + timedelta(days=6))),
+            'months_refreshed': self._refresh(MetricaMensal, MetricaMensal.mes, 'mes', meses,
+                                              Periodo.from_month)
+        }
+
+    def refresh_since(self, start_date: date, end_date: date = None) -> Dict[str, int]:
+        """Reconstrói semanas e meses de start_date até end_date (último dia com métricas por padrão)"""
+        if end_date is None:
+            ultima = db.session.query(func.max(MetricaDiaria.data)).scalar()
+            end_date = max(ultima, date.today()) if ultima else date.today()
+        dias = {start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)}
+        return self.refresh_for_days(dias)
+
+    def _refresh(self, model, key_column, key_name: str, inicios: Set[date], periodo_de) -> int:
+        """Apaga e recria as linhas do rollup para os períodos que começam em `inicios`"""
+        if not inicios:
+            return 0
+
+        db.session.query(model).filter(key_column.in_(inicios)).delete(synchronize_session=False)
+
+        # Uma única leitura de metricas_diarias cobrindo todos os períodos afetados
+        periodos = {inicio: periodo_de(inicio) for inicio in inicios}
+        cobertura = Periodo(min(p.start_date for p in periodos.values()),
+                            max(p.end_date for p in periodos.values()))
+        diarias = db.session.query(MetricaDiaria).filter(
+            cobertura.filter_dates(MetricaDiaria.data)
+        ).all()
+
+        grupos = {}
+        for metrica in diarias:
+            inicio = week_start(metrica.data) if model is MetricaSemanal else month_start(metrica.data)
+            if inicio in periodos:
+                grupos.setdefault((inicio, metrica.municipio), []).append(metrica)
+
+        for (inicio, municipio), metricas in grupos.items():
+            valores = self._aggregate(metricas)
+            if valores['motoristas_hll'] is None:
+                # A linha fica sem sketch, e os distintos, subestimados
+                logger.warning(f"{model.__tablename__} {inicio} {municipio}: dias sem sketch HyperLogLog; "
+                               f"motoristas e usuários distintos usam o maior valor diário")
+            db.session.add(model(**{key_name: inicio, 'municipio': municipio}, **valores))
+
+        return len(grupos)
+
+    @staticmethod
+    def _aggregate(metricas) -> Dict:
+        """Soma contagens e mescla sketches de um grupo de métricas diárias"""
+        total = sum(m.total_corridas or 0 for m in metricas)
+        concluidas = sum(m.corridas_concluidas or 0 for m in metricas)
+
+        # Média das avaliações ponderada pelas corridas avaliadas de cada dia.
+        # Dias gravados antes de avaliacoes_quantidade existir não têm o peso:
+        # com algum deles, média simples das médias diárias
+        avaliados = [m for m in metricas if m.avaliacao_media]
+        avaliacoes_quantidade = sum(m.avaliacoes_quantidade or 0 for m in avaliados)
+        if any(m.avaliacoes_quantidade is None for m in avaliados):
+            logger.warning("Métricas diárias sem avaliacoes_quantidade: avaliação do rollup sem ponderação")
+            avaliacao_media = sum(m.avaliacao_media for m in avaliados) / len(avaliados)
+        elif avaliacoes_quantidade:
+            avaliacao_media = sum(m.avaliacao_media * m.avaliacoes_quantidade for m in avaliados) / avaliacoes_quantidade
+        else:
+            avaliacao_media = None
+
+        sketches_completos = all(m.motoristas_hll and m.usuarios_hll for m in metricas)
+        motoristas_hll = usuarios_hll = None
+        if sketches_completos:
+            # Sketches mesclados ficam no rollup: períodos longos mesclam
+            # semanas e meses em vez de cada dia
+            motoristas_sketch = merge_sketches(m.motoristas_hll for m in metricas)
+            usuarios_sketch = merge_sketches(m.usuarios_hll for m in metricas)
+            motoristas, usuarios = motoristas_sketch.count(), usuarios_sketch.count()
+            motoristas_hll, usuarios_hll = motoristas_sketch.to_bytes(), usuarios_sketch.to_bytes()
+        else:
+            # Sem sketches o melhor limite disponível é o maior valor diário
+            motoristas = max(m.motoristas_ativos or 0 for m in metricas)
+            usuarios = max(m.usuarios_unicos or 0 for m in metricas)
+
+        return {
+            'total_corridas': total,
+            'corridas_concluidas': concluidas,
+            'corridas_canceladas': sum(m.corridas_canceladas or 0 for m in metricas),
+            'corridas_perdidas': sum(m.corridas_perdidas or 0 for m in metricas),
+            'receita_total': sum(float(m.receita_total or 0) for m in metricas),
+            'avaliacao_media': avaliacao_media,
+            'avaliacoes_quantidade': avaliacoes_quantidade,
+            'taxa_conclusao': (concluidas / total * 100) if total else 0,
+            'motoristas_ativos': motoristas,
+            'motoristas_ativos_media': sum(m.motoristas_ativos or 0 for m in metricas) / len(metricas),
+            'usuarios_unicos': usuarios,
+            'dias_com_dados': len(metricas),
+            'motoristas_hll': motoristas_hll,
+            'usuarios_hll': usuarios_hll
+        }
+
+
+# Instância global do serviço de rollups
+rollup_service = RollupService()
@@ -1,14 +1,28 @@
 from typing import Dict, List, Optional, Tuple
 from datetime import datetime, timedelta
 import datetime as dt
-from sqlalchemy import func, and_, case
-from backend.models import db, Corrida, Motorista, Meta, MetricaDiaria, OrigemDado, StatusCorrida
+import threading
+from flask import current_app
+from sqlalchemy import func, and_, or_, case
+from backend.models import db, Corrida, Motorista, Meta, MetricaDiaria, MetricaHoraria, MetricaMotoristaDiaria, OrigemDado, StatusCorrida
 from backend.services.google_sheets_service import GoogleSheetsService
 from backend.services.import_service import ImportService
+from backend.services.hll import HyperLogLog
+from backend.services.rollup_service import rollup_service
+from backend.services.columnar_service import columnar_service
+from backend.services.warmup_service import warmup_service
+from backend.services.cache_service import cache_service
+from backend.services.dataset_version_service import dataset_version_service
+from backend.services.partitions import PartitionSet
+from backend.services.query_fingerprint import reset_defaults
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Publicações (warm-up + versão do dataset) não se sobrepõem, inclusive as
+# que rodam em background
+_publish_lock = threading.Lock()
+
 class DataSyncService:
     """Serviço para sincronização de dados entre múltiplas fontes"""
     
@@ -38,22 +52,32 @@ class DataSyncService:
         }
         
         try:
+            # Partições (data, município) alteradas pelas etapas abaixo
+            changes = PartitionSet()
+            
             # 1. Sincronizar do Google Sheets
             logger.info("Iniciando sincronização do Google Sheets")
-            sheets_result = self.sync_from_google_sheets(force)
+            sheets_result = self.sync_from_google_sheets(force, changes)
             sync_results['google_sheets'] = sheets_result
             
-            # 2. Recalcular métricas
+            # 2. Resolver duplicatas (antes das métricas, que devem contar
+            # apenas as corridas que permanecem)
+            logger.info("Resolvendo duplicatas")
+            duplicates_result = self.resolve_duplicates(changes)
+            sync_results['duplicates_resolution'] = duplicates_result
+            
+            # 3. Recalcular métricas
             logger.info("Recalculando métricas diárias")
-            metrics_result = self.recalculate_daily_metrics()
+            metrics_result = self.recalculate_daily_metrics(changes=changes)
             sync_results['metrics_calculation'] = metrics_result
             
-            # 3. Resolver duplicatas
-            logger.info("Resolvendo duplicatas")
-            duplicates_result = self.resolve_duplicates()
-            sync_results['duplicates_resolution'] = duplicates_result
+            # 4. Invalidar/aquecer o cache e publicar a nova versão dos dados.
+            # Motoristas e metas não têm partição: se mudaram, tudo é republicado
+            logger.info("Aquecendo cache do dashboard")
+            outros = sum(sheets_result.get(tipo, {}).get('imported', 0) for tipo in ('motoristas', 'metas'))
+            sync_results.update(self.publish_data_change('sync', None if outros else changes))
             
-            # 4. Gerar resumo
+            # 5. Gerar resumo
             sync_results['summary'] = self.generate_sync_summary()
             sync_results['completed_at'] = datetime.utcnow()
             sync_results['success'] = True
@@ -68,8 +92,80 @@ class DataSyncService:
         
         return sync_results
     
-    def sync_from_google_sheets(self, force: bool = False) -> Dict:
-        """Sincroniza dados do Google Sheets"""
+    def publish_data_change(self, motivo: str, partitions: Optional[PartitionSet] = None,
+                            background: bool = False) -> Dict:
+        """
+        Torna uma mudança nos dados visível: aquece o cache em uma nova
+        geração (ou, sem warm-up, invalida o cache do dashboard) e só então
+        incrementa a versão do dataset, para que um ETag novo nunca
+        acompanhe um payload antigo
+        
+        Com as partições alteradas, só as entradas do cache que as cruzam
+        são marcadas como invalidadas (na hora) e recalculadas pelo warm-up;
+        até lá continuam servidas obsoletas, e as que o warm-up não regravou
+        são removidas antes do incremento da versão. Sem partições nada é
+        publicado
+        
+        Com background=True o warm-up e o incremento da versão rodam em uma
+        thread (requer contexto da aplicação) e cache_warmup volta como
+        {'scheduled': True}
+        """
+        result = {'cache_warmup': None, 'dataset_version': None}
+        if partitions is not None:
+            result['changed_partitions'] = partitions.to_dict()
+            if not partitions:
+                # Nada mudou: cache e versão do dataset continuam válidos
+                return result
+            result['cache_invalidation'] = cache_service.invalidate_partitions(partitions)
+        
+        # O warm-up roda antes do incremento da versão: descarta já os padrões
+        # memorizados (data mais antiga, municípios) da versão anterior
+        reset_defaults()
+        
+        if background:
+            app = current_app._get_current_object()
+            
+            def publicar():
+                with app.app_context():
+                    try:
+                        self._warm_and_bump(motivo, partitions)
+                    finally:
+                        db.session.remove()
+            
+            threading.Thread(target=publicar, name=f'publish-{motivo}', daemon=True).start()
+            result['cache_warmup'] = {'success': True, 'scheduled': True}
+            return result
+        
+        result.update(self._warm_and_bump(motivo, partitions))
+        return result
+    
+    def _warm_and_bump(self, motivo: str, partitions: Optional[PartitionSet]) -> Dict:
+        """Warm-up do cache seguido do incremento da versão (uma publicação por vez)"""
+        result = {}
+        with _publish_lock:
+            try:
+                result['cache_warmup'] = warmup_service.warm_up(partitions)
+                if result['cache_warmup'].get('skipped') and partitions is None:
+                    cache_service.invalidate_dashboard_cache()
+            except Exception as e:
+                logger.error(f"Erro ao aquecer cache: {e}")
+                result['cache_warmup'] = {'success': False, 'error': str(e)}
+                if partitions is None:
+                    cache_service.invalidate_dashboard_cache()
+            
+            if partitions is not None:
+                # Nenhum valor anterior à mudança é servido com o ETag da nova versão
+                result['cache_purged'] = cache_service.purge_invalidated(partitions)
+            
+            try:
+                result['dataset_version'] = dataset_version_service.bump(motivo)
+            except Exception as e:
+                logger.error(f"Erro ao incrementar versão do dataset: {e}")
+                result['dataset_version'] = None
+        return result
+    
+    def sync_from_google_sheets(self, force: bool = False, changes: Optional[PartitionSet] = None) -> Dict:
+        """Sincroniza dados do Google Sheets (partições das corridas gravadas vão para `changes`)"""
         result = {
             'corridas': {'imported': 0, 'errors': 0},
             'motoristas': {'imported': 0, 'errors': 0},
@@ -87,7 +183,7 @@ class DataSyncService:
             # Sincronizar corridas
             corridas_result = self.google_sheets.get_corridas()
             if corridas_result['success']:
-                imported, errors = self.import_google_sheets_corridas(corridas_result['data'])
+                imported, errors = self.import_google_sheets_corridas(corridas_result['data'], changes)
                 result['corridas']['imported'] = imported
                 result['corridas']['errors'] = errors
             
@@ -127,7 +223,8 @@ class DataSyncService:
         
         return recent_data is None
     
-    def import_google_sheets_corridas(self, corridas_data: List[Dict]) -> Tuple[int, int]:
+    def import_google_sheets_corridas(self, corridas_data: List[Dict],
+                                      changes: Optional[PartitionSet] = None) -> Tuple[int, int]:
         """Importa corridas do Google Sheets"""
         imported = 0
         errors = 0
@@ -144,12 +241,15 @@ class DataSyncService:
                 if existing:
                     # Atualizar existente do Google Sheets
                     self.update_corrida_from_dict(existing, corrida_data)
+                    corrida = existing
                 else:
                     # Criar nova
                     corrida = self.create_corrida_from_dict(corrida_data)
                     corrida.origem_dado = OrigemDado.SHEETS
                     db.session.add(corrida)
                 
+                if changes is not None:
+                    changes.add(corrida.data, corrida.municipio)
                 imported += 1
                 
             except Exception as e:
@@ -299,18 +399,149 @@ class DataSyncService:
         meta.meta_motoristas = data.get('meta_motoristas') or meta.meta_motoristas
         meta.data_atualizacao = datetime.utcnow()
     
-    def recalculate_daily_metrics(self, start_date: Optional[datetime] = None) -> Dict:
-        """Recalcula métricas diárias"""
+    def recalculate_daily_metrics(self, start_date: Optional[datetime] = None,
+                                  changes: Optional[PartitionSet] = None) -> Dict:
+        """
+        Recalcula métricas diárias
+        
+        As partições (data, município) cujas métricas mudaram são
+        acrescentadas a `changes`, quando informado
+        """
         if start_date is None:
             # Recalcular últimos 30 dias
             start_date = datetime.utcnow() - timedelta(days=30)
         
+        # Recalcular sempre a partir do início do dia (as linhas removidas são por data)
+        start_date = datetime.combine(start_date.date(), datetime.min.time())
+        
+        # Métricas atuais do período, para comparar com as recalculadas
+        anteriores = self.daily_metrics_snapshot(MetricaDiaria.data >= start_date.date())
+        recalculadas = {}
+        
         # Limpar métricas existentes do período
         db.session.query(MetricaDiaria).filter(
             MetricaDiaria.data >= start_date.date()
         ).delete()
         
-        # Buscar corridas por dia e município
+        # Métricas por dia e município
+        registros = self.daily_metric_rows(Corrida.data >= start_date)
+        
+        for registro in registros:
+            db.session.add(MetricaDiaria(**registro))
+            recalculadas[(registro['data'], registro['municipio'])] = self._metrics_signature(registro)
+        
+        alteradas = PartitionSet(
+            chave for chave in anteriores.keys() | recalculadas.keys()
+            if anteriores.get(chave) != recalculadas.get(chave)
+        )
+        if changes is not None:
+            changes.update(alteradas)
+        
+        # Rollup por hora do dia no mesmo ciclo de recálculo
+        hourly_created = self.recalculate_hourly_metrics(start_date)
+        
+        # Rollup diário por motorista (ranking)
+        driver_created = self.recalculate_driver_metrics(start_date)
+        
+        # Semanas e meses que contêm os dias recalculados
+        rollups = rollup_service.refresh_since(start_date.date())
+        
+        db.session.commit()
+        self._refresh_columnar()
+        
+        return {
+            'success': True,
+            'metrics_created': len(registros),
+            'hourly_metrics_created': hourly_created,
+            'driver_metrics_created': driver_created,
+            'weekly_metrics_refreshed': rollups['weeks_refreshed'],
+            'monthly_metrics_refreshed': rollups['months_refreshed'],
+            'start_date': start_date.date().isoformat(),
+            'changed_partitions': alteradas.to_dict()
+        }
+    
+    def recalculate_partitions(self, partitions: PartitionSet,
+                               changes: Optional[PartitionSet] = None) -> Dict:
+        """
+        Recalcula apenas as partições (data, município) informadas, como as
+        que uma importação gravou, em qualquer data: métricas diárias por
+        upsert, rollups por hora e por motorista apagados e recriados dentro
+        das partições, e as semanas/meses que contêm as datas. O custo
+        acompanha o tamanho da mudança, não uma janela fixa
+        
+        As partições cujas métricas mudaram vão para `changes`, quando informado
+        """
+        if not len(partitions):
+            return {'success': True, 'partitions_recalculated': 0, 'metrics_upserted': 0,
+                    'changed_partitions': PartitionSet().to_dict()}
+        
+        filtro_metricas = self.partition_filter(MetricaDiaria.data, MetricaDiaria.municipio, partitions)
+        anteriores = self.daily_metrics_snapshot(filtro_metricas)
+        
+        registros = self.daily_metric_rows(self.partition_filter(Corrida.data, Corrida.municipio, partitions))
+        recalculadas = {(registro['data'], registro['municipio']): self._metrics_signature(registro)
+                        for registro in registros}
+        self.upsert_daily_metrics(registros)
+        
+        # Partições que ficaram sem corridas (ex.: duplicatas removidas)
+        vazias = PartitionSet(chave for chave in partitions if chave not in recalculadas)
+        if len(vazias):
+            db.session.query(MetricaDiaria).filter(
+                self.partition_filter(MetricaDiaria.data, MetricaDiaria.municipio, vazias)
+            ).delete(synchronize_session=False)
+        
+        alteradas = PartitionSet(
+            chave for chave in anteriores.keys() | recalculadas.keys()
+            if anteriores.get(chave) != recalculadas.get(chave)
+        )
+        if changes is not None:
+            changes.update(alteradas)
+        
+        hourly_created = self.recalculate_hourly_metrics(partitions=partitions)
+        driver_created = self.recalculate_driver_metrics(partitions=partitions)
+        rollups = rollup_service.refresh_for_days({data for data, _ in partitions})
+        
+        db.session.commit()
+        self._refresh_columnar()
+        
+        return {
+            'success': True,
+            'partitions_recalculated': len(partitions),
+            'metrics_upserted': len(registros),
+            'hourly_metrics_created': hourly_created,
+            'driver_metrics_created': driver_created,
+            'weekly_metrics_refreshed': rollups['weeks_refreshed'],
+            'monthly_metrics_refreshed': rollups['months_refreshed'],
+            'changed_partitions': alteradas.to_dict()
+        }
+    
+    def _refresh_columnar(self) -> None:
+        """Snapshot colunar (opcional) recebe as corridas novas"""
+        if columnar_service.enabled:
+            try:
+                columnar_service.refresh()
+            except Exception as e:
+                logger.error(f"Erro ao atualizar motor colunar: {e}")
+    
+    @staticmethod
+    def partition_filter(data_column, municipio_column, partitions: PartitionSet):
+        """
+        Condição SQL das partições (data, município): um intervalo por
+        sequência de datas consecutivas de cada município (partitions não vazio)
+        """
+        timestamp = isinstance(data_column.type, db.DateTime)
+        condicoes = []
+        for municipio, intervalos in partitions.date_runs().items():
+            for inicio, fim in intervalos:
+                fim = fim + timedelta(days=1)
+                if timestamp:
+                    inicio = datetime.combine(inicio, datetime.min.time())
+                    fim = datetime.combine(fim, datetime.min.time())
+                condicoes.append(and_(municipio_column == municipio, data_column >= inicio, data_column < fim))
+        return or_(*condicoes)
+    
+    def daily_metric_rows(self, filtro) -> List[Dict]:
+        """Valores de metricas_diarias por (data, município) das corridas que atendem `filtro`"""
         corridas_query = db.session.query(
             func.date(Corrida.data).label('data'),
             Corrida.municipio,
@@ -322,23 +553,21 @@ class DataSyncService:
             func.coalesce(func.avg(Corrida.distancia), 0).label('distancia_media'),
             func.coalesce(func.avg(Corrida.tempo_corrida), 0).label('tempo_medio'),
             func.coalesce(func.avg(Corrida.avaliacao), 0).label('avaliacao_media'),
+            func.count(Corrida.avaliacao).label('avaliacoes_quantidade'),
             func.count(func.distinct(Corrida.motorista_nome)).label('motoristas_ativos'),
             func.count(func.distinct(Corrida.usuario_nome)).label('usuarios_unicos')
         ).filter(
-            Corrida.data >= start_date
+            filtro
         ).group_by(
             func.date(Corrida.data),
             Corrida.municipio
         ).all()
         
-        metrics_created = 0
+        # Sketches de contagem distinta por (data, município)
+        sketches = self.build_distinct_sketches(filtro)
         
+        registros = []
         for corrida_stats in corridas_query:
-            # Calcular taxa de conversão
-            taxa_conversao = 0
-            if corrida_stats.total_corridas > 0:
-                taxa_conversao = (corrida_stats.corridas_concluidas / corrida_stats.total_corridas) * 100
-            
             # Calcular métricas derivadas
             taxa_conclusao = 0
             if corrida_stats.total_corridas > 0:
@@ -348,35 +577,202 @@ class DataSyncService:
             if corrida_stats.corridas_concluidas > 0:
                 ticket_medio = corrida_stats.receita_total / corrida_stats.corridas_concluidas
             
-            metrica = MetricaDiaria(
-                data=corrida_stats.data if isinstance(corrida_stats.data, dt.date) else datetime.strptime(str(corrida_stats.data), '%Y-%m-%d').date(),
-                municipio=corrida_stats.municipio,
-                total_corridas=corrida_stats.total_corridas,
-                corridas_concluidas=corrida_stats.corridas_concluidas,
-                corridas_canceladas=corrida_stats.corridas_canceladas,
-                corridas_perdidas=corrida_stats.corridas_perdidas,
-                receita_total=float(corrida_stats.receita_total),
-                distancia_media=float(corrida_stats.distancia_media or 0),
-                tempo_medio_corrida=float(corrida_stats.tempo_medio or 0),
-                avaliacao_media=float(corrida_stats.avaliacao_media or 0),
-                taxa_conclusao=float(taxa_conclusao),
-                ticket_medio=float(ticket_medio),
-                motoristas_ativos=corrida_stats.motoristas_ativos
-            )
+            data_metrica = self._to_date(corrida_stats.data)
+            motoristas_hll, usuarios_hll = sketches.get((data_metrica, corrida_stats.municipio), (None, None))
             
-            db.session.add(metrica)
-            metrics_created += 1
+            registros.append({
+                'data': data_metrica,
+                'municipio': corrida_stats.municipio,
+                'total_corridas': corrida_stats.total_corridas,
+                'corridas_concluidas': corrida_stats.corridas_concluidas,
+                'corridas_canceladas': corrida_stats.corridas_canceladas,
+                'corridas_perdidas': corrida_stats.corridas_perdidas,
+                'receita_total': float(corrida_stats.receita_total),
+                'distancia_media': float(corrida_stats.distancia_media or 0),
+                'tempo_medio_corrida': float(corrida_stats.tempo_medio or 0),
+                'avaliacao_media': float(corrida_stats.avaliacao_media or 0),
+                'avaliacoes_quantidade': corrida_stats.avaliacoes_quantidade,
+                'taxa_conclusao': float(taxa_conclusao),
+                'ticket_medio': float(ticket_medio),
+                'motoristas_ativos': corrida_stats.motoristas_ativos,
+                'usuarios_unicos': corrida_stats.usuarios_unicos,
+                'motoristas_hll': motoristas_hll.to_bytes() if motoristas_hll else None,
+                'usuarios_hll': usuarios_hll.to_bytes() if usuarios_hll else None
+            })
         
-        db.session.commit()
+        return registros
+    
+    # Linhas por comando no upsert de metricas_diarias
+    UPSERT_BATCH_SIZE = 500
+    
+    def upsert_daily_metrics(self, registros: List[Dict]) -> None:
+        """INSERT ... ON CONFLICT (data, municipio) DO UPDATE das métricas diárias (sem commit)"""
+        if not registros:
+            return
         
-        return {
-            'success': True,
-            'metrics_created': metrics_created,
-            'start_date': start_date.date().isoformat()
-        }
+        dialeto = db.session.get_bind().dialect.name
+        if dialeto == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        elif dialeto == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            # Sem upsert no dialeto: substituir as linhas das mesmas partições
+            chaves = PartitionSet((registro['data'], registro['municipio']) for registro in registros)
+            db.session.query(MetricaDiaria).filter(
+                self.partition_filter(MetricaDiaria.data, MetricaDiaria.municipio, chaves)
+            ).delete(synchronize_session=False)
+            db.session.bulk_insert_mappings(MetricaDiaria, registros)
+            return
+        
+        agora = datetime.utcnow()
+        for inicio in range(0, len(registros), self.UPSERT_BATCH_SIZE):
+            lote = [{**registro, 'created_at': agora, 'updated_at': agora}
+                    for registro in registros[inicio:inicio + self.UPSERT_BATCH_SIZE]]
+            comando = insert(MetricaDiaria.__table__).values(lote)
+            comando = comando.on_conflict_do_update(
+                index_elements=['data', 'municipio'],
+                set_={nome: comando.excluded[nome] for nome in lote[0]
+                      if nome not in ('data', 'municipio', 'created_at')}
+            )
+            db.session.execute(comando)
+    
+    # Colunas de metricas_diarias comparadas para detectar partições alteradas
+    SIGNATURE_COLUMNS = (
+        'total_corridas', 'corridas_concluidas', 'corridas_canceladas', 'corridas_perdidas',
+        'receita_total', 'distancia_media', 'tempo_medio_corrida', 'avaliacao_media',
+        'avaliacoes_quantidade', 'motoristas_ativos', 'usuarios_unicos'
+    )
+    
+    def daily_metrics_snapshot(self, filtro) -> Dict[Tuple[dt.date, str], Tuple]:
+        """Assinatura das métricas diárias por (data, município) das linhas que atendem `filtro`"""
+        colunas = [getattr(MetricaDiaria, nome) for nome in self.SIGNATURE_COLUMNS]
+        linhas = db.session.query(MetricaDiaria.data, MetricaDiaria.municipio, *colunas).filter(
+            filtro
+        ).all()
+        return {(self._to_date(linha[0]), linha[1]): self._metrics_signature(tuple(linha[2:])) for linha in linhas}
+    
+    @classmethod
+    def _metrics_signature(cls, metrica) -> Tuple:
+        """Assinatura de uma linha (tupla na ordem de SIGNATURE_COLUMNS ou dicionário)"""
+        valores = metrica if isinstance(metrica, tuple) else \
+            [metrica[nome] for nome in cls.SIGNATURE_COLUMNS]
+        return tuple(round(float(valor or 0), 2) for valor in valores)
+    
+    def _rollup_filters(self, model, start_date: Optional[datetime], partitions: Optional[PartitionSet]):
+        """(linhas do rollup a apagar, corridas a reagregar): desde start_date ou só nas partições"""
+        if partitions is None:
+            return model.data >= start_date.date(), Corrida.data >= start_date
+        return (self.partition_filter(model.data, model.municipio, partitions),
+                self.partition_filter(Corrida.data, Corrida.municipio, partitions))
+    
+    def recalculate_hourly_metrics(self, start_date: Optional[datetime] = None,
+                                   partitions: Optional[PartitionSet] = None) -> int:
+        """Recalcula o rollup metricas_horarias a partir de start_date ou nas partições (sem commit)"""
+        apagar, filtro = self._rollup_filters(MetricaHoraria, start_date, partitions)
+        db.session.query(MetricaHoraria).filter(apagar).delete(synchronize_session=False)
+        
+        hora = func.extract('hour', Corrida.data)
+        horarias_query = db.session.query(
+            func.date(Corrida.data).label('data'),
+            hora.label('hora'),
+            Corrida.municipio,
+            Corrida.status,
+            func.count(Corrida.id).label('total_corridas'),
+            func.coalesce(func.sum(Corrida.valor), 0).label('receita_total')
+        ).filter(
+            filtro
+        ).group_by(
+            func.date(Corrida.data),
+            hora,
+            Corrida.municipio,
+            Corrida.status
+        ).all()
+        
+        db.session.bulk_insert_mappings(MetricaHoraria, [
+            {
+                'data': self._to_date(item.data),
+                'hora': int(item.hora),
+                'municipio': item.municipio,
+                'status': item.status,
+                'total_corridas': item.total_corridas,
+                'receita_total': float(item.receita_total)
+            }
+            for item in horarias_query
+        ])
+        
+        return len(horarias_query)
+    
+    def recalculate_driver_metrics(self, start_date: Optional[datetime] = None,
+                                   partitions: Optional[PartitionSet] = None) -> int:
+        """Recalcula o rollup metricas_motorista_diarias a partir de start_date ou nas partições (sem commit)"""
+        apagar, filtro = self._rollup_filters(MetricaMotoristaDiaria, start_date, partitions)
+        db.session.query(MetricaMotoristaDiaria).filter(apagar).delete(synchronize_session=False)
+        
+        motoristas_query = db.session.query(
+            func.date(Corrida.data).label('data'),
+            Corrida.motorista_nome,
+            Corrida.municipio,
+            func.count(Corrida.id).label('total_corridas'),
+            func.sum(case((Corrida.status == StatusCorrida.CONCLUIDA, 1), else_=0)).label('corridas_concluidas'),
+            func.sum(case((Corrida.status == StatusCorrida.CANCELADA, 1), else_=0)).label('corridas_canceladas'),
+            func.coalesce(func.sum(case((Corrida.status == StatusCorrida.CONCLUIDA, Corrida.valor), else_=0)), 0).label('receita_total'),
+            func.coalesce(func.sum(Corrida.avaliacao), 0).label('avaliacao_soma'),
+            func.count(Corrida.avaliacao).label('avaliacao_quantidade')
+        ).filter(
+            filtro
+        ).group_by(
+            func.date(Corrida.data),
+            Corrida.motorista_nome,
+            Corrida.municipio
+        ).all()
+        
+        db.session.bulk_insert_mappings(MetricaMotoristaDiaria, [
+            {
+                'data': self._to_date(item.data),
+                'motorista_nome': item.motorista_nome,
+                'municipio': item.municipio,
+                'total_corridas': item.total_corridas,
+                'corridas_concluidas': item.corridas_concluidas,
+                'corridas_canceladas': item.corridas_canceladas,
+                'receita_total': float(item.receita_total),
+                'avaliacao_soma': int(item.avaliacao_soma),
+                'avaliacao_quantidade': item.avaliacao_quantidade
+            }
+            for item in motoristas_query
+        ])
+        
+        return len(motoristas_query)
+    
+    @staticmethod
+    def _to_date(value) -> dt.date:
+        """Normaliza o resultado de func.date (date no PostgreSQL, str no SQLite)"""
+        if isinstance(value, dt.date):
+            return value
+        return datetime.strptime(str(value), '%Y-%m-%d').date()
+    
+    def build_distinct_sketches(self, filtro) -> Dict:
+        """Constrói sketches HyperLogLog de motoristas e usuários por (data, município) das corridas de `filtro`"""
+        sketches = {}
+        
+        for coluna, posicao in ((Corrida.motorista_nome, 0), (Corrida.usuario_nome, 1)):
+            distintos = db.session.query(
+                func.date(Corrida.data).label('data'),
+                Corrida.municipio,
+                coluna
+            ).filter(
+                filtro
+            ).distinct().all()
+            
+            for data, municipio, nome in distintos:
+                chave = (self._to_date(data), municipio)
+                if chave not in sketches:
+                    sketches[chave] = (HyperLogLog(), HyperLogLog())
+                sketches[chave][posicao].add(nome)
+        
+        return sketches
     
-    def resolve_duplicates(self) -> Dict:
-        """Resolve duplicatas baseado na prioridade das fontes"""
+    def resolve_duplicates(self, changes: Optional[PartitionSet] = None) -> Dict:
+        """Resolve duplicatas baseado na prioridade das fontes (partições afetadas vão para `changes`)"""
         # Encontrar possíveis duplicatas de corridas
         duplicates_query = db.session.query(
             Corrida.data,
@@ -421,6 +817,8 @@ class DataSyncService:
                 # Remover duplicatas
                 for corrida in to_remove:
                     db.session.delete(corrida)
+                if changes is not None:
+                    changes.add(to_keep.data, to_keep.municipio)
                 
                 resolved_count += len(to_remove)
         
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Serviço de Warm-up do Cache - Pré-cálculo após importações e sincronizações
+Recalcula overview, métricas diárias, ranking e lista de municípios para
+todos os municípios e os períodos padrão em uma geração de cache ainda não
+publicada; só ao final a nova geração passa a ser servida, de modo que
+ninguém encontra o cache frio depois de uma mudança nos dados
+"""
+
+import os
+import time
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from flask import current_app
+from sqlalchemy import func
+from backend.models import db, Corrida, MetricaDiaria
+from backend.services.cache_service import cache_service
+from backend.services.partitions import PartitionSet
+
+logger = logging.getLogger(__name__)
+
+# Endpoints aquecidos: (endpoint Flask, caminho, varia por município)
+WARMUP_ENDPOINTS = (
+    ('dashboard.get_overview', '/api/dashboard/overview', True),
+    ('dashboard.get_metricas_diarias', '/api/dashboard/metricas-diarias', True),
+    ('dashboard.get_ranking_municipios', '/api/dashboard/ranking-municipios', False),
+    ('dashboard.get_municipios', '/api/dashboard/municipios', None),
+)
+
+
+def warmup_enabled() -> bool:
+    return os.getenv('CACHE_WARMUP', '1').lower() not in ('0', 'false', 'no')
+
+
+def warmup_days() -> List[int]:
+    """Períodos padrão em dias (CACHE_WARMUP_DAYS, ex.: '7,30,90')"""
+    return [int(d) for d in os.getenv('CACHE_WARMUP_DAYS', '7,30,90').split(',') if d.strip()]
+
+
+class CacheWarmupService:
+    """Aquece o cache do dashboard em uma nova geração e a publica"""
+
+    def warm_up(self, partitions: Optional[PartitionSet] = None) -> Dict:
+        """
+        Pré-calcula os payloads padrão (requer contexto da aplicação)
+
+        Com `partitions`, recalcula e regrava na geração atual apenas o que
+        a invalidação por partições marcou: os payloads sem filtro de
+        município e os dos municípios alterados (os demais são acertos).
+        Enquanto isso, as outras requisições recebem os valores antigos
+        """
+        if not warmup_enabled():
+            return {'success': True, 'skipped': True}
+
+        inicio = time.perf_counter()
+        municipios = [m[0] for m in db.session.query(Corrida.municipio).distinct().all() if m[0]]
+        if partitions is not None:
+            alterados = set(partitions.municipios)
+            municipios = [m for m in municipios if m in alterados]
+        periodos = self.standard_periods()
+
+        aquecidos, erros = 0, []
+        if partitions is None:
+            preparo = cache_service.staged_generation('dashboard')
+        else:
+            preparo = cache_service.recompute_invalidated()
+        with preparo as geracao:
+            for endpoint, caminho, por_municipio in WARMUP_ENDPOINTS:
+                for params in self._params_for(por_municipio, municipios, periodos):
+                    erro = self._warm(endpoint, caminho, params)
+                    if erro:
+                        erros.append({'endpoint': caminho, 'params': params, 'error': erro})
+                    else:
+                        aquecidos += 1
+
+        if geracao is not None:
+            publicada = cache_service.publish_generation('dashboard', geracao)
+        else:
+            publicada = cache_service.current_generation('dashboard')
+        duracao = time.perf_counter() - inicio
+        logger.info(f"🔥 Cache aquecido: {aquecidos} payloads em {duracao:.2f}s (geração {publicada})")
+
+        return {
+            'success': not erros,
+            'payloads_warmed': aquecidos,
+            'municipios': len(municipios),
+            'periods': len(periodos),
+            'generation': publicada,
+            'duration_seconds': round(duracao, 3),
+            'errors': erros[:10]
+        }
+
+    @staticmethod
+    def standard_periods() -> List[Dict[str, Optional[str]]]:
+        """Sem filtro (padrão de cada endpoint), últimos 7/30/90 dias e todo o histórico"""
+        hoje = datetime.utcnow().date()
+        periodos = [{}]
+        for dias in warmup_days():
+            periodos.append({
+                'start_date': (hoje - timedelta(days=dias)).isoformat(),
+                'end_date': hoje.isoformat()
+            })
+        primeiro = db.session.query(func.min(MetricaDiaria.data)).scalar()
+        if primeiro:
+            periodos.append({'start_date': primeiro.isoformat(), 'end_date': hoje.isoformat()})
+        return periodos
+
+    @staticmethod
+    def _params_for(por_municipio: Optional[bool], municipios: List[str],
+                    periodos: List[Dict]) -> List[Dict]:
+        if por_municipio is None:
+            return [{}]
+        if not por_municipio:
+            return list(periodos)
+        return [{**periodo, **({'municipio': m} if m else {})}
+                for m in [None] + municipios for periodo in periodos]
+
+    @staticmethod
+    def _warm(endpoint: str, caminho: str, params: Dict) -> Optional[str]:
+        """Executa o endpoint como uma requisição GET; o próprio endpoint grava o cache"""
+        view = current_app.view_functions.get(endpoint)
+        if view is None:
+            return 'endpoint não registrado'
+        try:
+            with current_app.test_request_context(caminho, query_string=params):
+                resposta = current_app.make_response(view())
+            return None if resposta.status_code == 200 else f'HTTP {resposta.status_code}'
+        except Exception as e:
+            return str(e)
+
+
+# Instância global do serviço de warm-up
+warmup_service = CacheWarmupService()
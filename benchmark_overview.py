@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Benchmark do overview - compara o caminho antigo (uma query por métrica)
+com a agregação em passada única do AggregationService
+
+Uso:
+    python benchmark_overview.py                 - 200 mil corridas sintéticas (SQLite temporário)
+    python benchmark_overview.py --rows 1000000  - volume customizado
+    python benchmark_overview.py --database-url postgresql://...  - banco existente (sem gerar dados)
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from flask import Flask
+from sqlalchemy import func, and_
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from backend.models import db, Corrida, StatusCorrida, OrigemDado
+from backend.services.aggregation_service import aggregation_service
+from backend.services.period_service import Periodo
+
+MUNICIPIOS = ['São Paulo', 'Rio de Janeiro', 'Belo Horizonte', 'Curitiba', 'Salvador']
+
+
+def legacy_overview_metrics(start_date, end_date, municipio=None):
+    """Caminho antigo de get_overview: uma ida ao banco por métrica"""
+    corridas_query = db.session.query(Corrida).filter(
+        func.date(Corrida.data).between(start_date, end_date)
+    )
+    if municipio:
+        corridas_query = corridas_query.filter(Corrida.municipio == municipio)
+
+    total_corridas = corridas_query.count()
+    corridas_concluidas = corridas_query.filter(Corrida.status == StatusCorrida.CONCLUIDA).count()
+    corridas_canceladas = corridas_query.filter(Corrida.status == StatusCorrida.CANCELADA).count()
+    corridas_perdidas = corridas_query.filter(Corrida.status == StatusCorrida.PERDIDA).count()
+
+    filtro_municipio = Corrida.municipio == municipio if municipio else True
+    receita_total = db.session.query(func.coalesce(func.sum(Corrida.valor), 0)).filter(and_(
+        func.date(Corrida.data).between(start_date, end_date),
+        Corrida.status == StatusCorrida.CONCLUIDA, filtro_municipio
+    )).scalar() or 0
+    motoristas_ativos = db.session.query(func.count(func.distinct(Corrida.motorista_nome))).filter(and_(
+        func.date(Corrida.data).between(start_date, end_date), filtro_municipio
+    )).scalar() or 0
+    usuarios_unicos = db.session.query(func.count(func.distinct(Corrida.usuario_nome))).filter(and_(
+        func.date(Corrida.data).between(start_date, end_date), filtro_municipio
+    )).scalar() or 0
+    avaliacao_media = db.session.query(func.avg(Corrida.avaliacao)).filter(and_(
+        func.date(Corrida.data).between(start_date, end_date),
+        Corrida.status == StatusCorrida.CONCLUIDA, Corrida.avaliacao.isnot(None), filtro_municipio
+    )).scalar() or 0
+
+    anterior = Periodo(start_date, end_date).previous()
+    previous_start, previous_end = anterior.start_date, anterior.end_date
+    previous_corridas = db.session.query(func.count(Corrida.id)).filter(and_(
+        func.date(Corrida.data).between(previous_start, previous_end), filtro_municipio
+    )).scalar() or 0
+    previous_receita = db.session.query(func.coalesce(func.sum(Corrida.valor), 0)).filter(and_(
+        func.date(Corrida.data).between(previous_start, previous_end),
+        Corrida.status == StatusCorrida.CONCLUIDA, filtro_municipio
+    )).scalar() or 0
+
+    return {
+        'total_corridas': total_corridas,
+        'corridas_concluidas': corridas_concluidas,
+        'corridas_canceladas': corridas_canceladas,
+        'corridas_perdidas': corridas_perdidas,
+        'receita_total': float(receita_total),
+        'motoristas_ativos': motoristas_ativos,
+        'usuarios_unicos': usuarios_unicos,
+        'avaliacao_media': float(avaliacao_media),
+        'previous_corridas': previous_corridas,
+        'previous_receita': float(previous_receita)
+    }
+
+
+def seed_corridas(rows: int, days: int = 180):
+    """Gera corridas sintéticas distribuídas nos últimos `days` dias"""
+    rnd = random.Random(42)
+    status = [StatusCorrida.CONCLUIDA] * 7 + [StatusCorrida.CANCELADA] * 2 + [StatusCorrida.PERDIDA]
+    now = datetime.utcnow()
+    batch = []
+    for i in range(rows):
+        st = rnd.choice(status)
+        batch.append({
+            'data': now - timedelta(minutes=rnd.randint(0, days * 1440)),
+            'usuario_nome': f'Cliente {rnd.randint(1, 20000)}',
+            'motorista_nome': f'Motorista {rnd.randint(1, 500)}',
+            'municipio': rnd.choice(MUNICIPIOS),
+            'status': st,
+            'valor': round(rnd.uniform(8, 60), 2) if st == StatusCorrida.CONCLUIDA else None,
+            'avaliacao': rnd.choice([None, 3, 4, 5]) if st == StatusCorrida.CONCLUIDA else None,
+            'origem_dado': OrigemDado.IMPORT
+        })
+        if len(batch) >= 10000:
+            db.session.execute(Corrida.__table__.insert(), batch)
+            batch = []
+    if batch:
+        db.session.execute(Corrida.__table__.insert(), batch)
+    db.session.commit()
+
+
+def timed(fn, repeat, *args):
+    """Executa `fn` `repeat` vezes e retorna (melhor tempo, último resultado)"""
+    best = None
+    result = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn(*args)
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark do overview do dashboard')
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--days', type=int, default=30, help='tamanho do período consultado')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    tmp_dir = None
+    if args.database_url:
+        app.config['SQLALCHEMY_DATABASE_URI'] = args.database_url
+    else:
+        tmp_dir = tempfile.mkdtemp()
+        app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(tmp_dir, 'benchmark.db')}"
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+
+    with app.app_context():
+        if tmp_dir:
+            db.create_all()
+            print(f"Gerando {args.rows} corridas sintéticas...")
+            seed_corridas(args.rows)
+
+        end_date = datetime.utcnow().date()
+        start_date = end_date - timedelta(days=args.days - 1)
+
+        print(f"Período: {start_date} a {end_date} (+ período anterior)")
+        for municipio in [None, MUNICIPIOS[0]]:
+            legacy_time, legacy = timed(legacy_overview_metrics, args.repeat, start_date, end_date, municipio)
+            single_time, single = timed(aggregation_service.get_overview_metrics, args.repeat,
+                                        Periodo(start_date, end_date), municipio)
+
+            divergentes = [k for k in legacy if abs(float(legacy[k]) - float(single[k])) > 0.01]
+
+            print(f"\nMunicípio: {municipio or 'todos'}")
+            print(f"  Caminho antigo (10 queries): {legacy_time * 1000:.1f} ms")
+            print(f"  Passada única (1 query):     {single_time * 1000:.1f} ms")
+            print(f"  Speedup: {legacy_time / single_time:.2f}x")
+            print(f"  Resultados idênticos: {'sim' if not divergentes else 'não ' + str(divergentes)}")
+
+
+if __name__ == '__main__':
+    main()
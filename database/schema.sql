@@ -75,17 +75,113 @@ CREATE TABLE metricas_diarias (
     corridas_perdidas INTEGER DEFAULT 0,
     receita_total DECIMAL(10,2) DEFAULT 0,
     motoristas_ativos INTEGER DEFAULT 0,
+    usuarios_unicos INTEGER DEFAULT 0,
     avaliacao_media FLOAT,
+    avaliacoes_quantidade INTEGER,  -- corridas avaliadas (peso de avaliacao_media nos rollups)
     tempo_medio_corrida FLOAT,
     distancia_media FLOAT,
     total_corridas INTEGER DEFAULT 0,
     taxa_conclusao FLOAT,
     ticket_medio DECIMAL(10,2),
+    motoristas_hll BYTEA,  -- sketch HyperLogLog de motorista_nome
+    usuarios_hll BYTEA,    -- sketch HyperLogLog de usuario_nome
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     UNIQUE(data, municipio)
 );
 
+-- Bancos existentes: colunas de contagem distinta adicionadas depois
+ALTER TABLE metricas_diarias ADD COLUMN IF NOT EXISTS usuarios_unicos INTEGER DEFAULT 0;
+ALTER TABLE metricas_diarias ADD COLUMN IF NOT EXISTS motoristas_hll BYTEA;
+ALTER TABLE metricas_diarias ADD COLUMN IF NOT EXISTS usuarios_hll BYTEA;
+ALTER TABLE metricas_diarias ADD COLUMN IF NOT EXISTS avaliacoes_quantidade INTEGER;
+
+-- Tabela de métricas por hora do dia (data, hora, município, status)
+CREATE TABLE IF NOT EXISTS metricas_horarias (
+    id SERIAL PRIMARY KEY,
+    data DATE NOT NULL,
+    hora INTEGER NOT NULL CHECK (hora >= 0 AND hora <= 23),
+    municipio VARCHAR(50) NOT NULL,
+    status status_corrida NOT NULL,
+    total_corridas INTEGER DEFAULT 0,
+    receita_total DECIMAL(12,2) DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE(data, hora, municipio, status)
+);
+
+-- Rollup diário por motorista (base do ranking de motoristas)
+CREATE TABLE IF NOT EXISTS metricas_motorista_diarias (
+    id SERIAL PRIMARY KEY,
+    data DATE NOT NULL,
+    motorista_nome VARCHAR(100) NOT NULL,
+    municipio VARCHAR(50) NOT NULL,
+    total_corridas INTEGER DEFAULT 0,
+    corridas_concluidas INTEGER DEFAULT 0,
+    corridas_canceladas INTEGER DEFAULT 0,
+    receita_total DECIMAL(12,2) DEFAULT 0,
+    avaliacao_soma INTEGER DEFAULT 0,
+    avaliacao_quantidade INTEGER DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT unique_metrica_motorista_diaria UNIQUE(data, motorista_nome, municipio)
+);
+
+-- Rollups semanal (semana = segunda-feira) e mensal (mes = dia 1), derivados de metricas_diarias
+CREATE TABLE IF NOT EXISTS metricas_semanais (
+    id SERIAL PRIMARY KEY,
+    semana DATE NOT NULL,
+    municipio VARCHAR(50) NOT NULL,
+    total_corridas INTEGER DEFAULT 0,
+    corridas_concluidas INTEGER DEFAULT 0,
+    corridas_canceladas INTEGER DEFAULT 0,
+    corridas_perdidas INTEGER DEFAULT 0,
+    receita_total DECIMAL(12,2) DEFAULT 0,
+    avaliacao_media FLOAT,  -- média ponderada pelas corridas avaliadas
+    avaliacoes_quantidade INTEGER DEFAULT 0,
+    taxa_conclusao FLOAT,
+    motoristas_ativos INTEGER DEFAULT 0,
+    motoristas_ativos_media FLOAT,
+    usuarios_unicos INTEGER DEFAULT 0,
+    dias_com_dados INTEGER DEFAULT 0,
+    motoristas_hll BYTEA,  -- sketches mesclados dos dias (NULL se algum dia não tem sketch)
+    usuarios_hll BYTEA,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT unique_metrica_semana_municipio UNIQUE(semana, municipio)
+);
+
+CREATE TABLE IF NOT EXISTS metricas_mensais (
+    id SERIAL PRIMARY KEY,
+    mes DATE NOT NULL,
+    municipio VARCHAR(50) NOT NULL,
+    total_corridas INTEGER DEFAULT 0,
+    corridas_concluidas INTEGER DEFAULT 0,
+    corridas_canceladas INTEGER DEFAULT 0,
+    corridas_perdidas INTEGER DEFAULT 0,
+    receita_total DECIMAL(12,2) DEFAULT 0,
+    avaliacao_media FLOAT,  -- média ponderada pelas corridas avaliadas
+    avaliacoes_quantidade INTEGER DEFAULT 0,
+    taxa_conclusao FLOAT,
+    motoristas_ativos INTEGER DEFAULT 0,
+    motoristas_ativos_media FLOAT,
+    usuarios_unicos INTEGER DEFAULT 0,
+    dias_com_dados INTEGER DEFAULT 0,
+    motoristas_hll BYTEA,  -- sketches mesclados dos dias (NULL se algum dia não tem sketch)
+    usuarios_hll BYTEA,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT unique_metrica_mes_municipio UNIQUE(mes, municipio)
+);
+
+-- Bancos existentes: sketches e peso das avaliações dos rollups (preenchidos no próximo recálculo)
+ALTER TABLE metricas_semanais ADD COLUMN IF NOT EXISTS avaliacoes_quantidade INTEGER DEFAULT 0;
+ALTER TABLE metricas_mensais ADD COLUMN IF NOT EXISTS avaliacoes_quantidade INTEGER DEFAULT 0;
+ALTER TABLE metricas_semanais ADD COLUMN IF NOT EXISTS motoristas_hll BYTEA;
+ALTER TABLE metricas_semanais ADD COLUMN IF NOT EXISTS usuarios_hll BYTEA;
+ALTER TABLE metricas_mensais ADD COLUMN IF NOT EXISTS motoristas_hll BYTEA;
+ALTER TABLE metricas_mensais ADD COLUMN IF NOT EXISTS usuarios_hll BYTEA;
+
 -- Tabela de log de importações
 CREATE TABLE import_logs (
     id SERIAL PRIMARY KEY,
@@ -95,10 +191,32 @@ CREATE TABLE import_logs (
     success_rows INTEGER,
     error_rows INTEGER,
     import_type VARCHAR(50),
-    status VARCHAR(20),
+    status VARCHAR(30),
     error_message TEXT,
+    processed_rows INTEGER DEFAULT 0,  -- progresso dos jobs de importação
+    rows_per_second FLOAT,
+    insert_seconds FLOAT,
+    batch_timings JSON,  -- tempo de cada lote gravado: [{"rows": n, "seconds": s}]
     started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    completed_at TIMESTAMP
+    completed_at TIMESTAMP,
+    heartbeat_at TIMESTAMP  -- último sinal do processo que executa o job (detecção de jobs órfãos)
+);
+
+-- Bancos existentes: métricas de gravação em lote e progresso adicionados depois
+-- ('completed_with_errors' não cabia em VARCHAR(20))
+ALTER TABLE import_logs ALTER COLUMN status TYPE VARCHAR(30);
+ALTER TABLE import_logs ADD COLUMN IF NOT EXISTS rows_per_second FLOAT;
+ALTER TABLE import_logs ADD COLUMN IF NOT EXISTS insert_seconds FLOAT;
+ALTER TABLE import_logs ADD COLUMN IF NOT EXISTS batch_timings JSON;
+ALTER TABLE import_logs ADD COLUMN IF NOT EXISTS processed_rows INTEGER DEFAULT 0;
+ALTER TABLE import_logs ADD COLUMN IF NOT EXISTS heartbeat_at TIMESTAMP;
+
+-- Versão monotônica dos dados (linha única; base dos ETags do dashboard)
+CREATE TABLE IF NOT EXISTS versao_dataset (
+    id INTEGER PRIMARY KEY,
+    versao BIGINT NOT NULL DEFAULT 0,
+    motivo VARCHAR(50),
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
 -- Índices para performance
@@ -119,6 +237,9 @@ CREATE INDEX idx_metricas_data ON metricas_diarias(data);
 CREATE INDEX idx_metricas_municipio ON metricas_diarias(municipio);
 CREATE INDEX idx_metricas_data_municipio ON metricas_diarias(data, municipio);
 
+CREATE INDEX IF NOT EXISTS idx_metricas_horarias_data_municipio ON metricas_horarias(data, municipio);
+CREATE INDEX IF NOT EXISTS idx_metricas_motorista_diarias_data_municipio ON metricas_motorista_diarias(data, municipio);
+
 -- Índices de texto para busca
 CREATE INDEX idx_motoristas_nome_gin ON motoristas USING gin(nome gin_trgm_ops);
 CREATE INDEX idx_corridas_usuario_gin ON corridas USING gin(usuario_nome gin_trgm_ops);
@@ -149,61 +270,13 @@ CREATE TRIGGER update_metricas_updated_at
     BEFORE UPDATE ON metricas_diarias 
     FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
 
--- Function para calcular métricas diárias
-CREATE OR REPLACE FUNCTION calcular_metricas_diarias()
-RETURNS TRIGGER AS $$
-BEGIN
-    -- Recalcular métricas para a data e município da corrida inserida/atualizada
-    INSERT INTO metricas_diarias (
-        data, municipio, 
-        corridas_concluidas, corridas_canceladas, corridas_perdidas,
-        receita_total, avaliacao_media, tempo_medio_corrida, distancia_media,
-        total_corridas, taxa_conclusao, ticket_medio,
-        motoristas_ativos
-    )
-    SELECT 
-        DATE(NEW.data) as data,
-        NEW.municipio,
-        COUNT(*) FILTER (WHERE status = 'concluida') as corridas_concluidas,
-        COUNT(*) FILTER (WHERE status = 'cancelada') as corridas_canceladas,
-        COUNT(*) FILTER (WHERE status = 'perdida') as corridas_perdidas,
-        COALESCE(SUM(valor) FILTER (WHERE status = 'concluida'), 0) as receita_total,
-        AVG(avaliacao) FILTER (WHERE avaliacao IS NOT NULL) as avaliacao_media,
-        AVG(tempo_corrida) FILTER (WHERE tempo_corrida IS NOT NULL) as tempo_medio_corrida,
-        AVG(distancia) FILTER (WHERE distancia IS NOT NULL) as distancia_media,
-        COUNT(*) as total_corridas,
-        ROUND((COUNT(*) FILTER (WHERE status = 'concluida') * 100.0 / COUNT(*)), 2) as taxa_conclusao,
-        CASE 
-            WHEN COUNT(*) FILTER (WHERE status = 'concluida') > 0 
-            THEN SUM(valor) FILTER (WHERE status = 'concluida') / COUNT(*) FILTER (WHERE status = 'concluida')
-            ELSE 0 
-        END as ticket_medio,
-        COUNT(DISTINCT motorista_nome) as motoristas_ativos
-    FROM corridas 
-    WHERE DATE(data) = DATE(NEW.data) AND municipio = NEW.municipio
-    ON CONFLICT (data, municipio) 
-    DO UPDATE SET
-        corridas_concluidas = EXCLUDED.corridas_concluidas,
-        corridas_canceladas = EXCLUDED.corridas_canceladas,
-        corridas_perdidas = EXCLUDED.corridas_perdidas,
-        receita_total = EXCLUDED.receita_total,
-        avaliacao_media = EXCLUDED.avaliacao_media,
-        tempo_medio_corrida = EXCLUDED.tempo_medio_corrida,
-        distancia_media = EXCLUDED.distancia_media,
-        total_corridas = EXCLUDED.total_corridas,
-        taxa_conclusao = EXCLUDED.taxa_conclusao,
-        ticket_medio = EXCLUDED.ticket_medio,
-        motoristas_ativos = EXCLUDED.motoristas_ativos,
-        updated_at = CURRENT_TIMESTAMP;
-    
-    RETURN NEW;
-END;
-$$ language 'plpgsql';
-
--- Trigger para calcular métricas automaticamente
-CREATE TRIGGER trigger_calcular_metricas_diarias
-    AFTER INSERT OR UPDATE ON corridas
-    FOR EACH ROW EXECUTE FUNCTION calcular_metricas_diarias();
+-- Métricas diárias: mantidas pela aplicação (DataSyncService.recalculate_partitions
+-- após importações e recalculate_daily_metrics nas sincronizações), e não por
+-- trigger. O antigo trigger FOR EACH ROW recalculava o dia/município inteiro a
+-- cada corrida gravada, o que torna a carga em massa (COPY) quadrática.
+-- Bancos existentes: remover o trigger e a função
+DROP TRIGGER IF EXISTS trigger_calcular_metricas_diarias ON corridas;
+DROP FUNCTION IF EXISTS calcular_metricas_diarias();
 
 -- Inserir dados de exemplo para teste
 INSERT INTO motoristas (nome, telefone, municipio) VALUES
@@ -226,6 +299,27 @@ INSERT INTO corridas (data, usuario_nome, usuario_telefone, motorista_nome, muni
 ('2025-01-20 14:30:00', 'Cliente 4', '11456789012', 'Ana Costa', 'Belo Horizonte', 'concluida', 15.75, 8.3, 20, 5, 4),
 ('2025-01-20 16:45:00', 'Cliente 5', '11567890123', 'Carlos Ferreira', 'São Paulo', 'concluida', 28.90, 18.7, 35, 4, 5);
 
+-- Métricas diárias das corridas de exemplo (uma agregação por dia/município;
+-- a aplicação recalcula as demais)
+INSERT INTO metricas_diarias (
+    data, municipio, total_corridas,
+    corridas_concluidas, corridas_canceladas, corridas_perdidas,
+    receita_total, distancia_media, tempo_medio_corrida, avaliacao_media, avaliacoes_quantidade,
+    taxa_conclusao, ticket_medio, motoristas_ativos, usuarios_unicos
+)
+SELECT
+    DATE(data), municipio, COUNT(*),
+    COUNT(*) FILTER (WHERE status = 'concluida'),
+    COUNT(*) FILTER (WHERE status = 'cancelada'),
+    COUNT(*) FILTER (WHERE status = 'perdida'),
+    COALESCE(SUM(valor), 0), COALESCE(AVG(distancia), 0), COALESCE(AVG(tempo_corrida), 0), COALESCE(AVG(avaliacao), 0), COUNT(avaliacao),
+    COUNT(*) FILTER (WHERE status = 'concluida') * 100.0 / COUNT(*),
+    COALESCE(SUM(valor) / NULLIF(COUNT(*) FILTER (WHERE status = 'concluida'), 0), 0),
+    COUNT(DISTINCT motorista_nome), COUNT(DISTINCT usuario_nome)
+FROM corridas
+GROUP BY DATE(data), municipio
+ON CONFLICT (data, municipio) DO NOTHING;
+
 -- Verificar se os dados foram inseridos corretamente
 SELECT 'Motoristas' as tabela, COUNT(*) as registros FROM motoristas
 UNION ALL
@@ -1,4 +1,4 @@
-import React, { useState, useCallback } from 'react';
+import React, { useState, useCallback, useRef } from 'react';
 import { motion, AnimatePresence } from 'framer-motion';
 import { 
   Upload, 
@@ -26,10 +26,16 @@ const ImportacaoAvancada = () => {
   const [statusImportacao, setStatusImportacao] = useState(null);
   const [historicoImportacoes, setHistoricoImportacoes] = useState([]);
   const [loading, setLoading] = useState(false);
+  // Interrompe o acompanhamento da importação quando o componente é desmontado
+  const montadoRef = useRef(true);
 
   // Carregar histórico de importações
   React.useEffect(() => {
+    montadoRef.current = true;
     carregarHistorico();
+    return () => {
+      montadoRef.current = false;
+    };
   }, []);
 
   const carregarHistorico = async () => {
@@ -121,11 +127,22 @@ const ImportacaoAvancada = () => {
       const data = await response.json();
       
       if (data.success) {
-        setStatusImportacao({
-          status: 'success',
-          message: `Importação concluída! ${data.imported} registros importados`,
-          details: data
-        });
+        // A importação roda em background: acompanhar até o status final
+        const job = await acompanharImportacao(data.data.status_url);
+        if (!job) return;
+        if (job.status === 'failed') {
+          setStatusImportacao({
+            status: 'error',
+            message: `Erro na importação: ${job.error_message}`,
+            details: job
+          });
+        } else {
+          setStatusImportacao({
+            status: 'success',
+            message: `Importação concluída! ${job.success_rows} registros importados`,
+            details: job
+          });
+        }
         carregarHistorico();
       } else {
         setStatusImportacao({
@@ -135,14 +152,54 @@ const ImportacaoAvancada = () => {
         });
       }
     } catch (error) {
+      if (!montadoRef.current) return;
       setStatusImportacao({
         status: 'error',
         message: 'Erro ao executar importação',
         details: { error: error.message }
       });
     } finally {
-      setLoading(false);
+      if (montadoRef.current) setLoading(false);
+    }
+  };
+
+  // Consulta o status a cada 2s até o status final. Falhas de rede ou
+  // respostas que não são JSON (proxy reiniciando) são toleradas até
+  // MAX_FALHAS seguidas; desiste após TEMPO_MAXIMO_MS. Retorna null se o
+  // componente for desmontado
+  const acompanharImportacao = async (statusUrl) => {
+    const INTERVALO_MS = 2000;
+    const MAX_FALHAS = 5;
+    const TEMPO_MAXIMO_MS = 60 * 60 * 1000;
+    const limite = Date.now() + TEMPO_MAXIMO_MS;
+    let falhas = 0;
+
+    while (Date.now() < limite) {
+      await new Promise((resolve) => setTimeout(resolve, INTERVALO_MS));
+      if (!montadoRef.current) return null;
+
+      let data;
+      try {
+        const response = await fetch(statusUrl);
+        data = await response.json();
+      } catch (error) {
+        if (++falhas >= MAX_FALHAS) throw error;
+        continue;
+      }
+      if (!montadoRef.current) return null;
+      if (!data.success) throw new Error(data.error);
+      falhas = 0;
+
+      const job = data.data;
+      if (job.finished) return job;
+      setStatusImportacao({
+        status: 'processing',
+        message: job.status === 'queued'
+          ? 'Importação na fila...'
+          : `Processando importação... ${job.processed_rows || 0} de ${job.total_rows ?? '?'} linhas`
+      });
     }
+    throw new Error('Tempo limite excedido ao acompanhar a importação; consulte o histórico');
   };
 
   const resetarImportacao = () => {
@@ -304,7 +361,7 @@ const ImportacaoAvancada = () => {
                     Selecionar Arquivo
                   </label>
                   <p className="text-xs text-gray-500 mt-2">
-                    Formatos suportados: .xlsx, .xls, .csv (máx. 16MB)
+                    Formatos suportados: .csv (máx. 512MB), .xlsx, .xls (máx. 16MB)
                   </p>
                 </div>
               )}
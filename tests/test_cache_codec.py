@@ -0,0 +1,88 @@
+"""
+Testes do codec do cache: ida e volta em cada formato e leitura das
+entradas em JSON puro gravadas por versões anteriores
+"""
+import json
+import time
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+from backend.services import cache_codec
+from backend.services.cache_codec import MAGIC, CacheCodec
+
+VALOR = {'success': True, 'data': {'receita': Decimal('1234.50'), 'dia': date(2025, 2, 1), 'lista': [1, None, 'á']}}
+# Tipos fora do JSON voltam como texto, como no json.dumps(default=str)
+ESPERADO = {'success': True, 'data': {'receita': '1234.50', 'dia': '2025-02-01', 'lista': [1, None, 'á']}}
+
+
+@pytest.mark.parametrize('codec', ['json', 'orjson'])
+def test_ida_e_volta_preserva_valor_e_instante(codec):
+    if codec == 'orjson':
+        pytest.importorskip('orjson')
+    codificador = CacheCodec(codec, 'none')
+
+    payload = codificador.encode(VALOR, stamp=1700000000.5)
+    registro = codificador.decode(payload)
+
+    assert payload.startswith(MAGIC)
+    assert codificador.name == f'{codec}+none'
+    assert registro.value == ESPERADO
+    assert registro.stamp == 1700000000.5
+    # Corpo JSON guardado é devolvido sem reserializar
+    assert json.loads(registro.json()) == ESPERADO
+
+
+def test_sem_instante_decodifica_como_none():
+    assert CacheCodec('json', 'none').decode(CacheCodec('json', 'none').encode([1, 2])).stamp is None
+
+
+def test_invalidar_preserva_valor_e_instante():
+    codificador = CacheCodec('json', 'lz4')
+
+    registro = codificador.decode(codificador.invalidate(codificador.encode(VALOR, stamp=1700000000.5)))
+    antigo = codificador.decode(codificador.invalidate(json.dumps({'success': True})))
+
+    assert registro.invalidated and registro.value == ESPERADO and registro.stamp == 1700000000.5
+    assert antigo.invalidated and antigo.value == {'success': True} and antigo.stamp is not None
+    assert not codificador.decode(codificador.encode(VALOR, stamp=1.0)).invalidated
+
+
+def test_le_entradas_antigas_em_json_puro():
+    codificador = CacheCodec('json', 'none')
+
+    assert codificador.decode(json.dumps({'success': True})).value == {'success': True}
+    assert codificador.decode(b'[1, 2]').stamp is None
+
+    envelope = codificador.decode(json.dumps({'__swr__': 1, 'v': {'a': 1}, 't': 123.0}).encode())
+    assert (envelope.value, envelope.stamp) == ({'a': 1}, 123.0)
+
+
+def test_codec_e_compressao_ausentes_caem_para_json_sem_compressao(monkeypatch):
+    monkeypatch.setattr(cache_codec, 'msgpack', None)
+    monkeypatch.setattr(cache_codec, 'zstandard', None)
+    monkeypatch.setattr(cache_codec, 'lz4_frame', None)
+
+    assert CacheCodec('msgpack', 'zstd').name == 'json+none'
+    assert CacheCodec('json', 'auto').name == 'json+none'
+
+
+def test_compressao_acima_do_limite():
+    pytest.importorskip('zstandard')
+    codificador = CacheCodec('json', 'zstd', threshold=100)
+    grande = {'itens': ['corrida'] * 500}
+
+    pequeno_payload = codificador.encode({'a': 1})
+    grande_payload = codificador.encode(grande)
+
+    assert pequeno_payload[len(MAGIC) + 1:len(MAGIC) + 2] == b'-'
+    assert len(grande_payload) < len(json.dumps(grande))
+    assert codificador.decode(grande_payload).value == grande
+
+
+def test_cache_service_le_entrada_antiga_do_redis(redis_cache):
+    physical = redis_cache.versioned_key('dashboard:overview:antiga')
+    redis_cache.redis_client.set(physical, json.dumps({'__swr__': 1, 'v': {'n': 1}, 't': time.time()}))
+
+    assert redis_cache.get('dashboard:overview:antiga') == {'n': 1}
@@ -0,0 +1,397 @@
+"""
+Testes do CacheService sem Redis (nível local em memória) e, onde o
+comportamento entre workers importa, sobre fakeredis
+"""
+import threading
+import time
+
+import pytest
+
+from backend.services.cache_service import CacheService, load_cache_policies
+from backend.services.local_cache import LocalCache, key_prefix
+
+
+@pytest.fixture
+def cache():
+    """CacheService novo, apenas com o nível local"""
+    service = CacheService()
+    service.redis_client = None
+    return service
+
+
+def _aguardar_refresh():
+    for thread in threading.enumerate():
+        if thread.name.startswith('cache-refresh:'):
+            thread.join(timeout=5)
+
+
+class Contador:
+    """Cálculo que devolve quantas vezes já foi chamado"""
+
+    def __init__(self, espera=0.0):
+        self.chamadas = 0
+        self.espera = espera
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            self.chamadas += 1
+            valor = self.chamadas
+        time.sleep(self.espera)
+        return {'success': True, 'n': valor}
+
+
+def test_swr_serve_obsoleto_entre_soft_e_hard_ttl_e_renova_em_background(cache):
+    cache.policies['teste'] = {'soft_ttl': 0.2, 'hard_ttl': 0.6, 'swr': True}
+    calcular = Contador()
+
+    assert cache.get_or_refresh('teste', {'a': 1}, calcular) == ({'success': True, 'n': 1}, 'miss')
+    assert cache.get_or_refresh('teste', {'a': 1}, calcular) == ({'success': True, 'n': 1}, 'fresh')
+
+    time.sleep(0.25)
+    # Obsoleto: resposta imediata com o valor antigo e um único refresh em background
+    assert cache.get_or_refresh('teste', {'a': 1}, calcular) == ({'success': True, 'n': 1}, 'stale')
+    _aguardar_refresh()
+    assert calcular.chamadas == 2
+    assert cache.get_or_refresh('teste', {'a': 1}, calcular) == ({'success': True, 'n': 2}, 'fresh')
+
+    time.sleep(0.65)
+    # Além do hard_ttl a entrada expirou: calculado na hora
+    assert cache.get_or_refresh('teste', {'a': 1}, calcular) == ({'success': True, 'n': 3}, 'miss')
+
+
+def test_sem_swr_entrada_expira_no_soft_ttl(cache):
+    cache.policies['teste'] = {'soft_ttl': 0.2, 'hard_ttl': 0.6, 'swr': False}
+    calcular = Contador()
+
+    cache.get_or_refresh('teste', None, calcular)
+    time.sleep(0.25)
+
+    assert cache.get_or_refresh('teste', None, calcular) == ({'success': True, 'n': 2}, 'miss')
+
+
+def test_um_unico_refresh_por_chave_obsoleta(cache):
+    cache.policies['teste'] = {'soft_ttl': 0.1, 'hard_ttl': 5, 'swr': True}
+    calcular = Contador(espera=0.2)
+    cache.get_or_refresh('teste', None, calcular)
+    time.sleep(0.15)
+
+    estados = [cache.get_or_refresh('teste', None, calcular)[1] for _ in range(5)]
+    _aguardar_refresh()
+
+    assert estados == ['stale'] * 5
+    assert calcular.chamadas == 2
+
+
+def test_politicas_lidas_do_ambiente(monkeypatch):
+    monkeypatch.setenv('CACHE_OVERVIEW_SOFT_TTL', '60')
+    monkeypatch.setenv('CACHE_OVERVIEW_HARD_TTL', '30')
+    monkeypatch.setenv('CACHE_METRICAS_SWR', '0')
+
+    politicas = load_cache_policies()
+
+    # hard_ttl nunca menor que soft_ttl
+    assert politicas['overview'] == {'soft_ttl': 60, 'hard_ttl': 60, 'swr': True}
+    assert politicas['metricas']['swr'] is False
+
+
+LIMITES = {
+    'overview': {'max_items': 3, 'max_bytes': 1000},
+    'default': {'max_items': 100, 'max_bytes': 100},
+}
+
+
+def test_local_cache_evita_o_menos_usado_do_prefixo():
+    evitados = []
+    local = LocalCache(LIMITES, on_evict=evitados.append)
+    for nome in 'abc':
+        local.set(f'dashboard:overview:{nome}', nome, ttl=60)
+    local.get('dashboard:overview:a')
+
+    local.set('dashboard:overview:d', 'd', ttl=60)
+
+    assert local.get('dashboard:overview:b') is None
+    assert [local.get(f'dashboard:overview:{nome}') for nome in 'acd'] == ['a', 'c', 'd']
+    assert evitados == ['overview']
+    assert local.get_stats()['evictions'] == 1
+
+
+def test_local_cache_limita_bytes_por_prefixo():
+    local = LocalCache(LIMITES)
+    local.set('chat:a', 'x' * 60, ttl=60)
+    local.set('chat:b', 'y' * 60, ttl=60)
+
+    assert local.get('chat:a') is None
+    assert local.get('chat:b') == 'y' * 60
+    # Maior que o segmento inteiro: não fica no nível local
+    assert local.set('chat:c', 'z' * 200, ttl=60) is False
+    assert local.get_stats()['segments']['chat']['bytes'] == 60
+
+
+def test_local_cache_segmentos_independentes_e_ttl():
+    local = LocalCache(LIMITES)
+    for i in range(5):
+        local.set(f'dashboard:overview:{i}', i, ttl=60)
+    local.set('dashboard:metricas:x', 'x', ttl=0.05)
+
+    time.sleep(0.06)
+
+    assert local.get('dashboard:metricas:x') is None
+    assert local.get_stats()['expirations'] == 1
+    assert len(local) == 3
+
+
+def test_key_prefix():
+    assert key_prefix('dashboard:overview:ab12#3.0') == 'overview'
+    assert key_prefix('chat:ab12') == 'chat'
+
+
+def test_nivel_local_atende_sem_ir_ao_redis(redis_cache):
+    redis_cache.set('dashboard:overview:k', {'v': 1}, ttl=300)
+    redis_cache.redis_client.flushall()
+
+    # Cópia local (até CACHE_LOCAL_TTL) responde mesmo sem a chave no Redis
+    assert redis_cache.get('dashboard:overview:k') == {'v': 1}
+    redis_cache.local.clear()
+    assert redis_cache.get('dashboard:overview:k') is None
+
+
+def test_bump_generation_invalida_o_namespace(cache):
+    cache.set('dashboard:overview:k', 1)
+    cache.set('dashboard:report:k', 2)
+    chave_antiga = cache.versioned_key('dashboard:overview:k')
+
+    cache.bump_generation('dashboard:report')
+
+    assert cache.get('dashboard:overview:k') == 1
+    assert cache.get('dashboard:report:k') is None
+
+    assert cache.invalidate_pattern('dashboard:*') == 1
+    assert cache.get('dashboard:overview:k') is None
+    assert cache.versioned_key('dashboard:overview:k') != chave_antiga
+    # Memória local da geração anterior liberada na hora
+    assert len(cache.local) == 0
+
+
+def test_geracao_preparada_so_aparece_depois_de_publicada(cache):
+    cache.set('dashboard:overview:k', 'antigo')
+
+    with cache.staged_generation('dashboard') as geracao:
+        cache.set('dashboard:overview:k', 'novo')
+        assert cache.get('dashboard:overview:k') == 'novo'
+
+        leituras = []
+        outra = threading.Thread(target=lambda: leituras.append(cache.get('dashboard:overview:k')))
+        outra.start()
+        outra.join()
+        assert leituras == ['antigo']
+
+    assert cache.get('dashboard:overview:k') == 'antigo'
+    assert cache.publish_generation('dashboard', geracao) == geracao
+    assert cache.get('dashboard:overview:k') == 'novo'
+
+
+def test_geracao_compartilhada_entre_workers(redis_cache):
+    outro_worker = CacheService()
+    outro_worker.redis_client = redis_cache.redis_client
+    outro_worker.generation_ttl = 0
+    redis_cache.set('dashboard:overview:k', 1)
+    assert outro_worker.get('dashboard:overview:k') == 1
+
+    redis_cache.bump_generation('dashboard')
+
+    # Sem KEYS/SCAN: a chave antiga continua no Redis até expirar, mas não é mais lida
+    assert outro_worker.get('dashboard:overview:k') is None
+    assert redis_cache.redis_client.exists('dashboard:overview:k#0.0')
+    assert redis_cache.redis_client.get('cache:gen:dashboard') == b'1'
+    assert redis_cache.publish_generation('dashboard', 0) == 1
+
+
+def _em_paralelo(n, funcao):
+    resultados = []
+    threads = [threading.Thread(target=lambda: resultados.append(funcao())) for _ in range(n)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return resultados
+
+
+def test_single_flight_calcula_uma_vez_para_requisicoes_simultaneas(cache):
+    calcular = Contador(espera=0.2)
+
+    resultados = _em_paralelo(10, lambda: cache.get_or_compute('dashboard:insights', calcular, ttl=60))
+
+    assert calcular.chamadas == 1
+    assert sorted(estado for _, estado in resultados) == ['fresh'] * 9 + ['miss']
+    assert all(valor == {'success': True, 'n': 1} for valor, _ in resultados)
+    assert cache._filling == {}
+
+
+def test_single_flight_serve_obsoleto_enquanto_recalcula(cache):
+    calcular = Contador(espera=0.2)
+    cache.get_or_compute('dashboard:insights', calcular, ttl=0.1, stale_ttl=5)
+    time.sleep(0.15)
+
+    resultados = _em_paralelo(5, lambda: cache.get_or_compute('dashboard:insights', calcular, ttl=0.1, stale_ttl=5))
+
+    assert calcular.chamadas == 2
+    assert sorted(estado for _, estado in resultados) == ['miss'] + ['stale'] * 4
+
+
+def test_trava_liberada_quando_o_calculo_falha(cache):
+    def falhar():
+        raise RuntimeError('banco indisponível')
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_compute('dashboard:report:x', falhar)
+
+    assert cache._filling == {}
+    assert cache.get_or_compute('dashboard:report:x', Contador()) == ({'success': True, 'n': 1}, 'miss')
+
+
+def test_resultado_recusado_por_cache_if_nao_e_guardado(cache):
+    calcular = Contador()
+    sem_sucesso = lambda resultado: False
+
+    cache.get_or_compute('dashboard:report:x', calcular, cache_if=sem_sucesso)
+    cache.get_or_compute('dashboard:report:x', calcular, cache_if=sem_sucesso)
+
+    assert calcular.chamadas == 2
+
+
+def test_trava_no_redis_liberada_apos_o_calculo(redis_cache):
+    physical = redis_cache.versioned_key('dashboard:insights')
+
+    def calcular():
+        # Outro worker que tentar preencher a mesma chave agora não obtém a trava
+        assert redis_cache.redis_client.exists(f'{physical}:fill')
+        return {'success': True}
+
+    redis_cache.get_or_compute('dashboard:insights', calcular)
+    assert not redis_cache.redis_client.exists(f'{physical}:fill')
+
+    with pytest.raises(ZeroDivisionError):
+        redis_cache.get_or_compute('dashboard:report:y', lambda: 1 / 0)
+    assert not redis_cache.redis_client.keys('*:fill')
+
+
+def _contadores(resumo, prefixo):
+    return {campo: resumo[prefixo][campo] for campo in ('hits', 'local_hits', 'stale_hits', 'misses', 'fills')}
+
+
+def test_telemetria_conta_acertos_faltas_e_preenchimentos(cache):
+    cache.policies['teste'] = {'soft_ttl': 0.1, 'hard_ttl': 5, 'swr': True}
+    calcular = Contador()
+
+    cache.get_or_refresh('teste', None, calcular)
+    cache.get_or_refresh('teste', None, calcular)
+    time.sleep(0.15)
+    cache.get_or_refresh('teste', None, calcular)
+    _aguardar_refresh()
+
+    resumo = cache.metrics.snapshot()
+    assert _contadores(resumo, 'teste') == {'hits': 2, 'local_hits': 2, 'stale_hits': 1, 'misses': 1, 'fills': 2}
+    assert resumo['teste']['hit_rate'] == round(2 / 3 * 100, 2)
+    latencia = resumo['teste']['latency_ms']
+    assert latencia['get']['count'] >= 3
+    assert sum(latencia['get']['buckets'].values()) == latencia['get']['count']
+    assert latencia['set']['count'] == 2
+
+
+def test_telemetria_somada_entre_workers(redis_cache):
+    outro_worker = CacheService()
+    outro_worker.redis_client = redis_cache.redis_client
+    redis_cache.get_or_compute('dashboard:insights', Contador())
+    outro_worker.get_or_compute('dashboard:insights', Contador())
+    outro_worker.get_or_compute('dashboard:insights', Contador())
+
+    redis_cache.metrics.flush(redis_cache.redis_client)
+    cluster = outro_worker.get_prefix_stats()['cluster']
+
+    assert _contadores(cluster, 'insights') == {'hits': 2, 'local_hits': 1, 'stale_hits': 0, 'misses': 1, 'fills': 1}
+    assert outro_worker.get_prefix_stats()['process']['insights']['misses'] == 0
+
+
+def test_telemetria_mantem_deltas_quando_envio_falha(cache):
+    class RedisIndisponivel:
+        def pipeline(self, transaction=True):
+            raise ConnectionError('redis fora do ar')
+
+    cache.metrics.incr('overview', 'hits', 3)
+    cache.metrics.flush(RedisIndisponivel())
+
+    assert cache.metrics._pending['overview']['hits'] == 3
+
+
+def test_operacoes_em_lote(cache):
+    assert cache.set_many({'dashboard:overview:a': 1, 'dashboard:overview:b': [2]}, ttl=60)
+
+    assert cache.get_many(['dashboard:overview:a', 'dashboard:overview:b', 'dashboard:overview:c']) == \
+        {'dashboard:overview:a': 1, 'dashboard:overview:b': [2]}
+    assert cache.delete_many(['dashboard:overview:a', 'dashboard:overview:c']) == 1
+    assert cache.get_many(['dashboard:overview:a', 'dashboard:overview:b']) == {'dashboard:overview:b': [2]}
+
+
+class RedisEspiao:
+    """Repassa as chamadas ao cliente Redis e registra os comandos usados"""
+
+    def __init__(self, cliente):
+        self.cliente = cliente
+        self.chamadas = []
+
+    def __getattr__(self, nome):
+        atributo = getattr(self.cliente, nome)
+        if not callable(atributo):
+            return atributo
+
+        def registrar(*args, **kwargs):
+            self.chamadas.append((nome, args))
+            return atributo(*args, **kwargs)
+        return registrar
+
+    def comandos(self):
+        # Leituras de geração (cache:gen:*) ficam de fora
+        return [nome for nome, args in self.chamadas
+                if not (nome == 'mget' and all(str(k).startswith('cache:gen:') for k in args[0]))]
+
+
+def _fragmentos(calcular):
+    return [('overview', {'m': m}, calcular, None) for m in ('a', 'b', 'c')]
+
+
+def test_get_or_refresh_many_le_com_mget_e_grava_com_pipeline(redis_cache):
+    espiao = RedisEspiao(redis_cache.redis_client)
+    redis_cache.redis_client = espiao
+    redis_cache.versioned_key('dashboard:overview')
+    calcular = Contador()
+
+    primeira = redis_cache.get_or_refresh_many(_fragmentos(calcular))
+    assert [estado for _, estado in primeira] == ['miss'] * 3
+    assert espiao.comandos().count('mget') == 1
+    # Um pipeline com os valores e outro com o índice de escopo das chaves
+    assert espiao.comandos().count('pipeline') == 2
+    assert 'get' not in espiao.comandos() and 'setex' not in espiao.comandos()
+
+    redis_cache.local.clear()
+    espiao.chamadas.clear()
+    segunda = redis_cache.get_or_refresh_many(_fragmentos(calcular))
+
+    assert [registro.value for registro, _ in segunda] == [registro.value for registro, _ in primeira]
+    assert [estado for _, estado in segunda] == ['fresh'] * 3
+    assert espiao.comandos() == ['mget']
+    assert calcular.chamadas == 3
+
+
+def test_get_or_refresh_many_calcula_quando_redis_falha(redis_cache):
+    class RedisSemMget(RedisEspiao):
+        def mget(self, *args, **kwargs):
+            raise ConnectionError('redis fora do ar')
+
+    redis_cache.redis_client = RedisSemMget(redis_cache.redis_client)
+    calcular = Contador()
+
+    resultados = redis_cache.get_or_refresh_many(_fragmentos(calcular))
+
+    assert [registro.value['n'] for registro, _ in resultados] == [1, 2, 3]
+    assert [estado for _, estado in resultados] == ['miss'] * 3
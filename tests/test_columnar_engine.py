@@ -0,0 +1,101 @@
+"""
+Testes do motor colunar: com o snapshot ativo, os endpoints e o overview
+devem responder o mesmo que as consultas SQL
+"""
+from datetime import date, datetime
+
+import pytest
+
+from backend.models import db, Corrida
+from backend.services.aggregation_service import aggregation_service
+from backend.services.cache_service import cache_service
+from backend.services.columnar_service import columnar_service
+from backend.services.period_service import Periodo
+from backend.services.sync_service import DataSyncService
+
+URLS = [
+    '/api/dashboard/overview?start_date=2025-02-01&end_date=2025-02-20',
+    '/api/dashboard/overview?start_date=2025-02-01&end_date=2025-02-20&municipio=Rio de Janeiro',
+    '/api/dashboard/overview?start_date=2025-02-01&end_date=2025-02-20&municipios=São Paulo,Belo Horizonte',
+    '/api/metrics/distribuicao-horarios?start_date=2025-01-01&end_date=2025-03-31',
+    '/api/metrics/distribuicao-horarios?start_date=2025-01-01&end_date=2025-03-31&municipio=São Paulo',
+    '/api/dashboard/ranking-municipios?start_date=2025-01-01&end_date=2025-03-31',
+    '/api/metrics/analise-cancelamentos?start_date=2025-01-01&end_date=2025-03-31',
+    '/api/metrics/analise-cancelamentos?start_date=2025-01-01&end_date=2025-03-31&municipio=São Paulo',
+]
+
+
+def _assert_equivalentes(sql, colunar, caminho='resposta'):
+    """Mesma estrutura e valores; números com tolerância de centavos (somas em ordens diferentes)"""
+    if isinstance(sql, dict):
+        assert sql.keys() == colunar.keys(), caminho
+        for chave in sql:
+            _assert_equivalentes(sql[chave], colunar[chave], f'{caminho}.{chave}')
+    elif isinstance(sql, list):
+        assert len(sql) == len(colunar), caminho
+        for i, (a, b) in enumerate(zip(sql, colunar)):
+            _assert_equivalentes(a, b, f'{caminho}[{i}]')
+    elif isinstance(sql, float) or isinstance(colunar, float):
+        assert colunar == pytest.approx(sql, abs=0.011), caminho
+    else:
+        assert sql == colunar, caminho
+
+
+@pytest.fixture
+def colunar(app, seed_corridas, tmp_path, monkeypatch):
+    """Motor colunar em diretório temporário, desativado até o teste ligá-lo"""
+    monkeypatch.setattr(columnar_service, 'data_dir', str(tmp_path / 'columnar'))
+    monkeypatch.setattr(columnar_service, '_meta', None)
+    monkeypatch.setattr(columnar_service, '_meta_mtime', None)
+    monkeypatch.setattr(columnar_service, '_arrays', {})
+    monkeypatch.setattr(columnar_service, '_codigos', {})
+    seed_corridas(4000)
+    DataSyncService().recalculate_daily_metrics(start_date=datetime(2024, 1, 1))
+    return columnar_service
+
+
+def _respostas(client):
+    cache_service.invalidate_dashboard_cache()
+    return {url: client.get(url).get_json() for url in URLS}
+
+
+def test_endpoints_com_motor_colunar_respondem_como_sql(colunar, client):
+    sql = _respostas(client)
+
+    colunar.enabled = True
+    assert colunar.refresh()['mode'] == 'rebuild'
+    assert colunar.is_ready()
+    respostas = _respostas(client)
+
+    for url in URLS:
+        assert sql[url]['success'], url
+        _assert_equivalentes(sql[url]['data'], respostas[url]['data'], url)
+
+
+def test_refresh_incremental_anexa_corridas_novas(colunar, client, seed_corridas):
+    colunar.enabled = True
+    colunar.refresh()
+    seed_corridas(300, inicio=datetime(2025, 2, 10), dias=5, seed=7)
+
+    resultado = colunar.refresh()
+    periodo = Periodo(date(2025, 2, 1), date(2025, 2, 20))
+    obtido = colunar.get_overview_metrics(periodo, 'São Paulo')
+    colunar.enabled = False
+    esperado = aggregation_service.get_overview_metrics(periodo, 'São Paulo')
+
+    assert resultado['mode'] == 'append'
+    assert resultado['appended'] == 300
+    _assert_equivalentes(esperado, obtido)
+
+
+def test_refresh_reconstroi_quando_corrida_antiga_muda(colunar):
+    colunar.enabled = True
+    colunar.refresh()
+    corrida = db.session.get(Corrida, 10)
+    corrida.municipio = 'Curitiba'
+    corrida.updated_at = datetime.utcnow()
+    db.session.commit()
+
+    assert colunar.refresh()['mode'] == 'rebuild'
+    assert colunar.refresh()['mode'] == 'noop'
+    assert 'Curitiba' in colunar._nomes('municipio')
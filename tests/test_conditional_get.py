@@ -0,0 +1,65 @@
+"""
+Testes do GET condicional: ETag fraco derivado da versão do dataset e 304
+enquanto os dados não mudam
+"""
+from datetime import datetime
+
+import pytest
+
+from backend.services.dataset_version_service import dataset_version_service
+from backend.services.sync_service import DataSyncService
+
+URL = '/api/dashboard/overview?start_date=2025-02-01&end_date=2025-02-20'
+
+
+@pytest.fixture
+def metricas(app, seed_corridas):
+    seed_corridas(500)
+    DataSyncService().recalculate_daily_metrics(start_date=datetime(2024, 1, 1))
+
+
+def test_get_devolve_etag_fraco_e_revalidacao(metricas, client):
+    resposta = client.get(URL)
+
+    assert resposta.status_code == 200
+    etag, fraco = resposta.get_etag()
+    assert fraco
+    assert etag.startswith(f'{dataset_version_service.current()}-')
+    assert resposta.headers['Cache-Control'] == 'no-cache'
+
+
+def test_mesmo_etag_responde_304_sem_corpo(metricas, client):
+    etag = client.get(URL).headers['ETag']
+
+    resposta = client.get(URL, headers={'If-None-Match': etag})
+
+    assert resposta.status_code == 304
+    assert resposta.data == b''
+    assert resposta.headers['ETag'] == etag
+
+
+def test_parametros_diferentes_tem_outro_etag(metricas, client):
+    etag = client.get(URL).headers['ETag']
+
+    resposta = client.get(URL + '&municipio=São Paulo', headers={'If-None-Match': etag})
+
+    assert resposta.status_code == 200
+    assert resposta.headers['ETag'] != etag
+
+
+def test_mudanca_nos_dados_gera_novo_etag(metricas, client):
+    etag = client.get(URL).headers['ETag']
+
+    DataSyncService().publish_data_change('teste')
+    resposta = client.get(URL, headers={'If-None-Match': etag})
+
+    assert resposta.status_code == 200
+    assert resposta.get_json()['success']
+    assert resposta.headers['ETag'] != etag
+
+
+def test_metrics_tambem_responde_304(metricas, client):
+    url = '/api/metrics/distribuicao-horarios?start_date=2025-02-01&end_date=2025-02-20'
+    etag = client.get(url).headers['ETag']
+
+    assert client.get(url, headers={'If-None-Match': etag}).status_code == 304
@@ -0,0 +1,113 @@
+"""
+Testes dos sketches HyperLogLog e das contagens distintas aproximadas do overview
+"""
+from datetime import date, datetime
+
+import pytest
+
+from backend.services.aggregation_service import EXACT_DISTINCT_DAYS, aggregation_service
+from backend.services.hll import HyperLogLog, merge_sketches
+from backend.services.period_service import Periodo
+from backend.services.sync_service import DataSyncService
+
+# Erro padrão ~1,6% com 2^12 registradores; margem de 3 desvios
+TOLERANCIA = 0.05
+
+
+def _sketch(valores):
+    return HyperLogLog().update(valores)
+
+
+@pytest.mark.parametrize('n', [10, 1000, 50000])
+def test_count_estima_cardinalidade(n):
+    sketch = _sketch(f'usuario {i}' for i in range(n))
+
+    assert sketch.count() == pytest.approx(n, rel=TOLERANCIA)
+
+
+def test_count_ignora_repetidos_e_nulos():
+    sketch = _sketch(['a', 'b', 'a', None, 'b', 'c'])
+
+    assert sketch.count() == 3
+
+
+def test_merge_equivale_ao_sketch_da_uniao():
+    a = _sketch(f'motorista {i}' for i in range(0, 6000))
+    b = _sketch(f'motorista {i}' for i in range(4000, 10000))
+    uniao = _sketch(f'motorista {i}' for i in range(10000))
+
+    a.merge(b)
+
+    assert (a.registers == uniao.registers).all()
+    assert a.count() == pytest.approx(10000, rel=TOLERANCIA)
+
+
+def test_merge_rejeita_precisoes_diferentes():
+    with pytest.raises(ValueError):
+        HyperLogLog(12).merge(HyperLogLog(10))
+
+
+def test_to_bytes_from_bytes_preserva_registradores():
+    sketch = _sketch(f'usuario {i}' for i in range(2500))
+
+    restaurado = HyperLogLog.from_bytes(sketch.to_bytes())
+
+    assert restaurado.precision == sketch.precision
+    assert (restaurado.registers == sketch.registers).all()
+    assert restaurado.count() == sketch.count()
+    # Registradores restaurados continuam graváveis
+    restaurado.add('outro usuario')
+
+
+def test_merge_sketches_serializados():
+    partes = [_sketch(f'usuario {i}' for i in range(inicio, inicio + 1000)).to_bytes()
+              for inicio in (0, 500, 1000)]
+
+    assert merge_sketches(partes).count() == pytest.approx(2000, rel=TOLERANCIA)
+    assert merge_sketches([]).count() == 0
+
+
+@pytest.fixture
+def metricas(app, seed_corridas):
+    seed_corridas(4000)
+    DataSyncService().recalculate_daily_metrics(start_date=datetime(2024, 1, 1))
+
+
+def test_overview_de_periodo_longo_usa_sketches_aproximados(metricas):
+    periodo = Periodo(date(2025, 1, 1), date(2025, 3, 20))
+    assert periodo.dias > EXACT_DISTINCT_DAYS
+
+    overview = aggregation_service.get_overview_metrics(periodo)
+    exato = aggregation_service.get_unique_counts(periodo, use_sketches=False)
+
+    assert overview['aproximado'] is True
+    assert exato['aproximado'] is False
+    assert overview['motoristas_ativos'] == pytest.approx(exato['motoristas_ativos'], rel=TOLERANCIA)
+    assert overview['usuarios_unicos'] == pytest.approx(exato['usuarios_unicos'], rel=TOLERANCIA)
+
+
+def test_overview_de_periodo_curto_conta_distintos_exatos(metricas):
+    periodo = Periodo(date(2025, 2, 1), date(2025, 2, 10))
+
+    overview = aggregation_service.get_overview_metrics(periodo)
+    exato = aggregation_service.get_unique_counts(periodo, use_sketches=False)
+
+    assert overview['aproximado'] is False
+    assert overview['motoristas_ativos'] == exato['motoristas_ativos']
+    assert overview['usuarios_unicos'] == exato['usuarios_unicos']
+
+
+def test_overview_por_municipio_com_sketches(metricas):
+    periodo = Periodo(date(2025, 1, 1), date(2025, 3, 20))
+    municipios = ['São Paulo', 'Rio de Janeiro']
+
+    total, por_municipio = aggregation_service.get_overview_by_municipio(periodo, municipios)
+    exato = aggregation_service.get_unique_counts(periodo, municipios, use_sketches=False)
+
+    assert total['aproximado'] is True
+    assert total['usuarios_unicos'] == pytest.approx(exato['usuarios_unicos'], rel=TOLERANCIA)
+    for municipio in municipios:
+        exato_municipio = aggregation_service.get_unique_counts(periodo, municipio, use_sketches=False)
+        assert por_municipio[municipio]['aproximado'] is True
+        assert por_municipio[municipio]['motoristas_ativos'] == \
+            pytest.approx(exato_municipio['motoristas_ativos'], rel=TOLERANCIA)
@@ -0,0 +1,134 @@
+"""
+Testes dos jobs de importação: a importação roda fora da requisição e o
+ImportLog termina sempre em um status final, inclusive quando o job falha
+ou o processo que o executava morreu
+"""
+import os
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pytest
+from sqlalchemy import event
+
+from backend.api import data_import
+from backend.models import db, Corrida, ImportLog
+from backend.services.import_job_service import FINAL_STATUSES, INTERRUPTED_MESSAGE, import_job_service
+
+MAPEAMENTO = {'data': 'data', 'usuario_nome': 'cliente', 'motorista_nome': 'motorista', 'municipio': 'cidade',
+              'status': 'status', 'valor': 'valor'}
+
+
+@pytest.fixture
+def client(database_app):
+    return database_app.test_client()
+
+
+def _csv(tmp_path, conteudo, nome='corridas.csv'):
+    caminho = tmp_path / nome
+    if isinstance(conteudo, bytes):
+        caminho.write_bytes(conteudo)
+    else:
+        conteudo.to_csv(caminho, index=False)
+    return str(caminho)
+
+
+def _executar(client, filepath, mapeamento=MAPEAMENTO):
+    """Envia a importação e acompanha status_url até um status final"""
+    resposta = client.post('/api/import/execute', json={'filepath': filepath, 'column_mapping': mapeamento})
+    assert resposta.status_code == 202
+    dados = resposta.get_json()['data']
+    assert dados['status'] == 'queued'
+
+    limite = time.monotonic() + 30
+    while time.monotonic() < limite:
+        status = client.get(dados['status_url']).get_json()['data']
+        if status['finished']:
+            return status
+        time.sleep(0.05)
+    pytest.fail('importação não terminou')
+
+
+def test_job_importa_em_background(client, tmp_path):
+    df = pd.DataFrame({'data': ['2025-01-02 10:00:00', '2025-01-03 11:00:00', 'sem data'],
+                       'cliente': ['Ana', 'Bia', 'Caio'], 'motorista': ['M1', 'M2', 'M1'],
+                       'cidade': ['São Paulo'] * 3, 'status': ['concluida'] * 3, 'valor': ['10,00'] * 3})
+    filepath = _csv(tmp_path, df)
+
+    status = _executar(client, filepath)
+
+    assert (status['status'], status['success_rows'], status['error_rows']) == ('completed_with_errors', 2, 1)
+    assert Corrida.query.count() == 2
+    # Removido antes do status final: quem vê finished=True não encontra o upload
+    assert not (tmp_path / 'corridas.csv').exists()
+
+
+def test_arquivo_invalido_termina_como_failed(client, tmp_path):
+    filepath = _csv(tmp_path, b'PK\x03\x04 planilha corrompida', nome='corridas.xlsx')
+
+    status = _executar(client, filepath)
+
+    assert status['status'] == 'failed'
+    assert status['error_message']
+    assert Corrida.query.count() == 0
+    assert not (tmp_path / 'corridas.xlsx').exists()
+
+
+@pytest.mark.parametrize('conteudo, nome', [
+    (pd.DataFrame({'data': ['2025-01-02'], 'cidade': ['São Paulo']}), 'corridas.csv'),
+    (b'PK\x03\x04 planilha corrompida', 'corridas.xlsx'),
+])
+def test_upload_removido_antes_do_status_final(database_app, tmp_path, conteudo, nome):
+    filepath = _csv(tmp_path, conteudo, nome)
+    gravacoes = []
+
+    def registrar(mapper, connection, import_log):
+        gravacoes.append((import_log.status, os.path.exists(filepath)))
+
+    event.listen(ImportLog, 'before_update', registrar)
+    try:
+        data_import.import_service.import_corridas(filepath, MAPEAMENTO, remove_file=True)
+    finally:
+        event.remove(ImportLog, 'before_update', registrar)
+
+    finais = [existe for status, existe in gravacoes if status in FINAL_STATUSES]
+    assert finais == [False]
+
+
+def test_excecao_no_job_marca_failed(client, tmp_path, monkeypatch):
+    def falhar(*args, **kwargs):
+        raise MemoryError('sem memória')
+
+    monkeypatch.setattr(data_import.import_service, 'import_corridas', falhar)
+    filepath = _csv(tmp_path, pd.DataFrame({'data': ['2025-01-02']}))
+
+    status = _executar(client, filepath)
+
+    assert (status['status'], status['error_message']) == ('failed', 'sem memória')
+    assert not (tmp_path / 'corridas.csv').exists()
+
+
+def test_reap_stale_encerra_jobs_orfaos(database_app):
+    antigo = datetime.utcnow() - timedelta(seconds=import_job_service.stale_seconds + 60)
+    logs = {
+        'orfao': ImportLog(filename='a.csv', status='processing', started_at=antigo),
+        'na_fila': ImportLog(filename='b.csv', status='queued', started_at=antigo),
+        'com_heartbeat': ImportLog(filename='c.csv', status='processing', started_at=antigo,
+                                   heartbeat_at=datetime.utcnow()),
+        'recente': ImportLog(filename='d.csv', status='processing', started_at=datetime.utcnow()),
+        'concluido': ImportLog(filename='e.csv', status='completed', started_at=antigo),
+    }
+    db.session.add_all(logs.values())
+    db.session.commit()
+
+    # No SQLite o encerramento só roda na inicialização
+    encerrados = (import_job_service.reap_stale(), import_job_service.reap_stale(startup=True))
+    assert encerrados == ((0, 2) if db.engine.dialect.name == 'sqlite' else (2, 0))
+
+    db.session.expire_all()
+    assert {nome: log.status for nome, log in logs.items()} == {
+        'orfao': 'failed', 'na_fila': 'failed', 'com_heartbeat': 'processing', 'recente': 'processing',
+        'concluido': 'completed',
+    }
+    assert logs['orfao'].error_message == INTERRUPTED_MESSAGE
+    assert logs['orfao'].completed_at is not None
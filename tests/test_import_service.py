@@ -0,0 +1,173 @@
+"""
+Testes da importação de corridas: mapeamento por colunas, gravação em
+massa (executemany no SQLite, COPY no PostgreSQL) e relatório de erros
+"""
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from backend.models import db, Corrida, ImportLog, StatusCorrida
+from backend.services.import_service import ImportService
+
+MAPEAMENTO = {
+    'data': 'Data', 'usuario_nome': 'Cliente', 'motorista_nome': 'Motorista', 'municipio': 'Cidade',
+    'status': 'Status', 'valor': 'Valor', 'distancia': 'Distancia', 'tempo_corrida': 'Tempo',
+    'avaliacao': 'Nota', 'usuario_telefone': 'Telefone', 'motivo_cancelamento': 'Motivo',
+}
+
+
+@pytest.fixture
+def service(tmp_path):
+    return ImportService(upload_folder=str(tmp_path / 'uploads'))
+
+
+def _planilha(linhas):
+    colunas = ['Data', 'Cliente', 'Motorista', 'Cidade', 'Status', 'Valor', 'Distancia', 'Tempo', 'Nota',
+               'Telefone', 'Motivo']
+    return pd.DataFrame(linhas, columns=colunas)
+
+
+def test_mapeamento_converte_colunas(service):
+    df = _planilha([
+        ['2025-01-02 08:30:00', ' Ana ', 'Bia', 'São Paulo ', 'Concluída', 'R$ 12,50', '3,4', '15', '5', None, None],
+        ['03/01/2025', 'Caio', None, 'Rio de Janeiro', 'CANCELADA', '7,25', '2.5', '12.9', '4,5', ' 11 9999 ', 'chuva'],
+        [' 2025-02-02 ', 'Davi', 'Eva', 'Belo Horizonte', 'lost', 'R$ 1.234,56', 'abc', None, '4.0', None, ''],
+        ['12/31/2025', 'Fábio', 'Gil', 'Curitiba', 'em rota', '', None, '-3.7', None, None, None],
+        ['05-01-2025', 'Hugo', 'Ivo', 'Curitiba', None, 40, 1.5, 20, 3, None, None],
+    ])
+
+    corridas, erros = service.map_corridas_frame(df, MAPEAMENTO)
+    registros = service.frame_records(corridas)
+
+    assert erros.isna().all()
+    assert [r['data'] for r in registros] == [
+        datetime(2025, 1, 2, 8, 30), datetime(2025, 1, 3), datetime(2025, 2, 2), datetime(2025, 12, 31),
+        datetime(2025, 1, 5),
+    ]
+    assert [r['usuario_nome'] for r in registros] == ['Ana', 'Caio', 'Davi', 'Fábio', 'Hugo']
+    assert registros[1]['motorista_nome'] == ''
+    assert [r['municipio'] for r in registros][:2] == ['São Paulo', 'Rio de Janeiro']
+    # Status desconhecido ou ausente conta como concluída
+    assert [r['status'] for r in registros] == [
+        StatusCorrida.CONCLUIDA, StatusCorrida.CANCELADA, StatusCorrida.PERDIDA, StatusCorrida.CONCLUIDA,
+        StatusCorrida.CONCLUIDA,
+    ]
+    # Vírgula decimal sem separador de milhar (como o parser por linha anterior:
+    # 'R$ 1.234,56' não é um número reconhecido)
+    assert [r['valor'] for r in registros] == [12.5, 7.25, None, None, 40.0]
+    assert [r['distancia'] for r in registros] == [3.4, 2.5, None, None, 1.5]
+    # Inteiros truncados em direção a zero; sem vírgula decimal
+    assert [r['tempo_corrida'] for r in registros] == [15, 12, None, -3, 20]
+    assert [r['avaliacao'] for r in registros] == [5, None, 4, None, 3]
+    assert [r['usuario_telefone'] for r in registros][:2] == [None, '11 9999']
+    assert [r['motivo_cancelamento'] for r in registros][1:3] == ['chuva', '']
+    assert all(type(r['valor']) in (float, type(None)) and type(r['avaliacao']) in (int, type(None))
+               for r in registros)
+
+
+def test_datas_invalidas_vao_para_os_erros(service):
+    df = _planilha([
+        ['lixo', 'A', 'B', 'São Paulo', 'concluida', '10', None, None, None, None, None],
+        [None, 'A', 'B', 'São Paulo', 'concluida', '10', None, None, None, None, None],
+        ['2025-13-01', 'A', 'B', 'São Paulo', 'concluida', '10', None, None, None, None, None],
+        ['2025-01-31', 'A', 'B', 'São Paulo', 'concluida', '10', None, None, None, None, None],
+        [datetime(2025, 3, 1, 9), 'A', 'B', 'São Paulo', 'concluida', '10', None, None, None, None, None],
+    ])
+
+    corridas, erros = service.map_corridas_frame(df, MAPEAMENTO)
+
+    assert erros[erros.notna()].to_dict() == {
+        0: 'Formato de data inválido: lixo', 1: 'Data é obrigatória', 2: 'Formato de data inválido: 2025-13-01',
+    }
+    assert corridas['data'].iloc[3:].tolist() == [pd.Timestamp(2025, 1, 31), pd.Timestamp(2025, 3, 1, 9)]
+
+
+def test_colunas_opcionais_ausentes_ficam_fora(service):
+    df = pd.DataFrame({'Data': ['2025-01-01'], 'Valor': [np.nan]})
+
+    corridas, _ = service.map_corridas_frame(df, {'data': 'Data', 'valor': 'Valor'})
+
+    assert 'distancia' not in corridas
+    assert service.frame_records(corridas)[0]['valor'] is None
+    assert service.frame_records(corridas)[0]['usuario_nome'] == ''
+
+
+def _corridas_mapeadas(service, n):
+    linhas = [[f'2025-01-{1 + i % 28:02d} {i % 24:02d}:15:00', f'Cliente {i}', f'Motorista {i % 7}',
+               'São Paulo' if i % 2 else 'Rio de Janeiro', 'cancelada' if i % 5 == 0 else 'concluida',
+               f'{10 + i},50', None, str(i % 40), str(i % 5 + 1), None, None]
+              for i in range(n)]
+    # Texto com caracteres de controle do formato do COPY
+    linhas[0][1] = 'Tab\\tab\tnova\nlinha'
+    linhas[1][10] = None
+    corridas, _ = service.map_corridas_frame(_planilha(linhas), MAPEAMENTO)
+    return corridas
+
+
+def test_gravacao_em_massa_por_banco(database_app, service, monkeypatch):
+    copias = []
+    copiar = ImportService._copy_rows
+    monkeypatch.setattr(ImportService, '_copy_rows',
+                        staticmethod(lambda conexao, tabela, registros: copias.append(len(registros))
+                                     or copiar(conexao, tabela, registros)))
+    service.batch_size = 40
+    corridas = _corridas_mapeadas(service, 100)
+
+    lotes = service.bulk_insert_corridas(corridas)
+    db.session.commit()
+
+    assert [lote['rows'] for lote in lotes] == [40, 40, 20]
+    # COPY apenas no PostgreSQL com psycopg2; INSERT em executemany nos demais
+    assert copias == ([40, 40, 20] if db.engine.dialect.name == 'postgresql' else [])
+    gravadas = Corrida.query.order_by(Corrida.id).all()
+    esperadas = service.frame_records(corridas)
+    assert len(gravadas) == 100
+    for corrida, esperada in zip(gravadas, esperadas):
+        for campo, valor in esperada.items():
+            obtido = getattr(corrida, campo)
+            assert (float(obtido) if campo == 'valor' else obtido) == valor, campo
+        assert corrida.created_at is not None
+
+
+def _arquivo(tmp_path, nome, linhas_invalidas, total=25):
+    linhas = [[f'2025-02-{1 + i % 20:02d} 10:00:00', f'Cliente {i}', f'Motorista {i % 4}', 'São Paulo',
+               'concluida', '20,00', None, None, None, None, None] for i in range(total)]
+    for i in linhas_invalidas:
+        linhas[i][0] = f'data ruim {i}'
+    df = _planilha(linhas)
+    caminho = tmp_path / nome
+    if caminho.suffix == '.csv':
+        df.to_csv(caminho, index=False)
+    else:
+        df.to_excel(caminho, index=False)
+    return str(caminho)
+
+
+@pytest.mark.parametrize('nome', ['corridas.csv', 'corridas.xlsx'])
+def test_numero_das_linhas_com_erro_atravessa_os_blocos(app, service, tmp_path, nome):
+    # Linhas inválidas no início e no fim de cada bloco de 10
+    invalidas = [0, 9, 10, 19, 20, 24]
+    service.chunk_size = 10
+
+    resultado = service.import_corridas(_arquivo(tmp_path, nome, invalidas), MAPEAMENTO)
+
+    assert resultado['success']
+    assert (resultado['imported'], resultado['errors']) == (19, 6)
+    # Linha do arquivo: índice + 2 (cabeçalho na linha 1)
+    assert resultado['error_details'] == [f'Linha {i + 2}: Formato de data inválido: data ruim {i}'
+                                          for i in invalidas]
+    assert Corrida.query.count() == 19
+
+
+def test_erros_alem_de_dez_nao_interrompem_a_importacao(app, service, tmp_path):
+    service.chunk_size = 4
+    resultado = service.import_corridas(_arquivo(tmp_path, 'corridas.csv', range(0, 26, 2), total=26), MAPEAMENTO)
+
+    assert resultado['errors'] == 13
+    assert resultado['error_details'][:2] == ['Linha 2: Formato de data inválido: data ruim 0',
+                                              'Linha 4: Formato de data inválido: data ruim 2']
+    assert len(resultado['error_details']) == 10
+    log = db.session.get(ImportLog, resultado['import_log_id'])
+    assert (log.status, log.total_rows, log.success_rows, log.error_rows) == ('completed_with_errors', 26, 13, 13)
@@ -0,0 +1,119 @@
+"""
+Testes do recálculo incremental: recalcular só as partições (data,
+município) alteradas deve deixar as métricas e todos os rollups iguais a um
+recálculo completo a partir das corridas
+"""
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from backend.models import (db, Corrida, MetricaDiaria, MetricaHoraria, MetricaMensal, MetricaMotoristaDiaria,
+                            MetricaSemanal, StatusCorrida)
+from backend.services.import_service import ImportService
+from backend.services.partitions import PartitionSet
+from backend.services.sync_service import DataSyncService
+
+MAPEAMENTO = {'data': 'data', 'usuario_nome': 'usuario', 'motorista_nome': 'motorista', 'municipio': 'municipio',
+              'status': 'status', 'valor': 'valor', 'avaliacao': 'nota', 'distancia': 'dist'}
+ROLLUPS = (MetricaDiaria, MetricaHoraria, MetricaMotoristaDiaria, MetricaSemanal, MetricaMensal)
+INICIO_RECALCULO = datetime(2024, 1, 1)
+
+
+def _csv(caminho, n, seed, inicio, dias):
+    rnd = np.random.default_rng(seed)
+    pd.DataFrame({
+        'data': [(inicio + timedelta(minutes=int(m))).strftime('%Y-%m-%d %H:%M:%S')
+                 for m in rnd.integers(0, dias * 1440, n)],
+        'usuario': [f'u{i}' for i in rnd.integers(0, 300, n)],
+        'motorista': [f'm{i}' for i in rnd.integers(0, 40, n)],
+        'municipio': rnd.choice(['São Paulo', 'Rio de Janeiro', 'Campinas'], n),
+        'status': rnd.choice(['concluida', 'cancelada', 'perdida'], n),
+        'valor': np.round(rnd.uniform(5, 50, n), 2),
+        'nota': rnd.choice([1, 2, 3, 4, 5, np.nan], n),
+        'dist': np.round(rnd.uniform(1, 20, n), 1),
+    }).to_csv(caminho, index=False)
+    return str(caminho)
+
+
+def _snapshot():
+    """Linhas de todos os rollups (sem ids e carimbos; números arredondados e sketches em hex)"""
+    def valor(v):
+        if isinstance(v, (float, Decimal)):
+            return round(float(v), 4)
+        return v.hex() if isinstance(v, bytes) else v
+
+    tabelas = {}
+    for model in ROLLUPS:
+        colunas = [c for c in model.__table__.c.keys() if c not in ('id', 'created_at', 'updated_at')]
+        linhas = db.session.query(*[getattr(model, c) for c in colunas]).all()
+        tabelas[model.__tablename__] = sorted((tuple(valor(v) for v in linha) for linha in linhas), key=repr)
+    return tabelas
+
+
+def _assert_igual_ao_recalculo_completo(incremental):
+    DataSyncService().recalculate_daily_metrics(start_date=INICIO_RECALCULO)
+    completo = _snapshot()
+    for tabela, linhas in completo.items():
+        assert linhas, tabela
+        assert incremental[tabela] == linhas, tabela
+
+
+@pytest.fixture
+def importacao(database_app, tmp_path):
+    service = ImportService(upload_folder=str(tmp_path / 'uploads'))
+    resultado = service.import_corridas(_csv(tmp_path / 'a.csv', 3000, 1, datetime(2025, 1, 1), 90), MAPEAMENTO)
+    assert resultado['success'] and resultado['errors'] == 0
+    DataSyncService().recalculate_daily_metrics(start_date=INICIO_RECALCULO)
+    return service
+
+
+def test_importacao_recalcula_so_particoes_e_iguala_recalculo_completo(importacao, tmp_path):
+    # Arquivo B: dias recentes e uma data antiga (meses atrás) em um único município
+    caminho = _csv(tmp_path / 'b.csv', 400, 2, datetime(2025, 3, 28), 3)
+    b = pd.read_csv(caminho)
+    b.loc[:50, 'data'] = '2025-01-15 10:00:00'
+    b.loc[:50, 'municipio'] = 'Campinas'
+    b.to_csv(caminho, index=False)
+
+    resultado = importacao.import_corridas(caminho, MAPEAMENTO)
+
+    assert resultado['success']
+    alteradas = resultado['changed_partitions']
+    assert alteradas['start_date'] == '2025-01-15'
+    assert alteradas['count'] <= 1 + 4 * 3
+    _assert_igual_ao_recalculo_completo(_snapshot())
+
+
+def test_recalculo_de_particao_alterada_e_esvaziada(importacao):
+    sync = DataSyncService()
+    dia = date(2025, 2, 12)
+    inicio, fim = datetime(2025, 2, 12), datetime(2025, 2, 13)
+    no_dia = Corrida.query.filter(Corrida.data >= inicio, Corrida.data < fim)
+
+    # São Paulo: status e valores alterados; Campinas: todas as corridas do dia removidas
+    for corrida in no_dia.filter(Corrida.municipio == 'São Paulo').limit(5):
+        corrida.status = StatusCorrida.CANCELADA
+        corrida.valor = 99.9
+    no_dia.filter(Corrida.municipio == 'Campinas').delete(synchronize_session=False)
+    db.session.commit()
+
+    alteradas = PartitionSet()
+    resultado = sync.recalculate_partitions(PartitionSet([(dia, 'São Paulo'), (dia, 'Campinas')]), alteradas)
+
+    assert resultado['success']
+    assert set(alteradas) == {(dia, 'São Paulo'), (dia, 'Campinas')}
+    assert MetricaDiaria.query.filter_by(data=dia, municipio='Campinas').count() == 0
+    _assert_igual_ao_recalculo_completo(_snapshot())
+
+
+def test_recalculo_sem_mudanca_nao_altera_particoes(importacao):
+    antes = _snapshot()
+    alteradas = PartitionSet()
+
+    DataSyncService().recalculate_partitions(PartitionSet([(date(2025, 2, 1), 'Rio de Janeiro')]), alteradas)
+
+    assert len(alteradas) == 0
+    assert _snapshot() == antes
@@ -0,0 +1,74 @@
+"""
+Testes do overview com vários municípios: o detalhamento por município
+deve coincidir com o overview de cada município e o total com o conjunto
+"""
+from datetime import datetime
+
+import pytest
+from sqlalchemy import event, func
+
+from backend.models import db, Corrida
+from backend.services.sync_service import DataSyncService
+
+PERIODO = 'start_date=2025-02-01&end_date=2025-02-20'
+
+
+@pytest.fixture
+def corridas(app, seed_corridas):
+    corridas = seed_corridas(4000)
+    DataSyncService().recalculate_daily_metrics(start_date=datetime(2024, 1, 1))
+    return corridas
+
+
+def _overview(client, parametros):
+    resposta = client.get(f'/api/dashboard/overview?{PERIODO}&{parametros}').get_json()
+    assert resposta['success']
+    return resposta['data']
+
+
+def test_overview_por_municipio_igual_ao_overview_de_cada_municipio(corridas, client):
+    dados = _overview(client, 'municipios=São Paulo,Rio de Janeiro&municipios=Nada')
+
+    assert dados['periodo']['municipios'] == ['Nada', 'Rio de Janeiro', 'São Paulo']
+    por_municipio = {item['municipio']: item for item in dados['por_municipio']}
+    for municipio in ('São Paulo', 'Rio de Janeiro'):
+        individual = _overview(client, f'municipio={municipio}')
+        assert por_municipio[municipio]['metricas_principais'] == individual['metricas_principais']
+        assert por_municipio[municipio]['comparacao_anterior'] == individual['comparacao_anterior']
+    assert por_municipio['Nada']['metricas_principais']['total_corridas'] == 0
+
+
+def test_total_do_conjunto_conta_distintos_do_conjunto(corridas, client):
+    dados = _overview(client, 'municipios=São Paulo,Rio de Janeiro')
+    total = dados['metricas_principais']
+    partes = [item['metricas_principais'] for item in dados['por_municipio']]
+
+    motoristas, usuarios = db.session.query(
+        func.count(func.distinct(Corrida.motorista_nome)),
+        func.count(func.distinct(Corrida.usuario_nome))
+    ).filter(
+        Corrida.data >= datetime(2025, 2, 1),
+        Corrida.data < datetime(2025, 2, 21),
+        Corrida.municipio.in_(['São Paulo', 'Rio de Janeiro'])
+    ).one()
+
+    assert total['total_corridas'] == sum(p['total_corridas'] for p in partes)
+    assert total['receita_total'] == pytest.approx(sum(p['receita_total'] for p in partes))
+    # Motoristas que atendem as duas cidades contam uma vez no total
+    assert total['motoristas_ativos'] == motoristas < sum(p['motoristas_ativos'] for p in partes)
+    assert total['usuarios_unicos'] == usuarios
+
+
+def test_overview_de_varios_municipios_le_corridas_uma_vez(corridas, app, client):
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        _overview(client, 'municipios=São Paulo,Rio de Janeiro,Belo Horizonte')
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', listener)
+
+    # Uma única agregação (agrupada por município) para os três municípios
+    agregacoes = [s for s in statements if 'FROM corridas' in s and 'sum(CASE' in s]
+    assert len(agregacoes) == 1
+    assert 'GROUP BY corridas.municipio' in agregacoes[0]
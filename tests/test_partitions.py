@@ -0,0 +1,113 @@
+"""
+Testes das partições alteradas e da invalidação do cache por escopo: só as
+entradas que dependem das partições alteradas são invalidadas
+"""
+import json
+from datetime import date, datetime
+
+import pytest
+from werkzeug.datastructures import MultiDict
+
+from backend.api.dashboard import overview_fragment
+
+from backend.services.cache_service import cache_service
+from backend.services.partitions import GLOBAL_SCOPE, PartitionScope, PartitionSet
+from backend.services.sync_service import DataSyncService
+
+ALTERADAS = PartitionSet([
+    (date(2025, 2, 10), 'São Paulo'),
+    ('2025-02-11', 'São Paulo'),
+    (date(2025, 2, 14), 'São Paulo'),
+    (date(2025, 1, 3), 'Curitiba'),
+])
+
+
+def test_partition_set_agrupa_por_municipio():
+    assert len(ALTERADAS) == 4
+    assert (date(2025, 2, 11), 'São Paulo') in ALTERADAS
+    assert ALTERADAS.date_runs() == {
+        'São Paulo': [(date(2025, 2, 10), date(2025, 2, 11)), (date(2025, 2, 14), date(2025, 2, 14))],
+        'Curitiba': [(date(2025, 1, 3), date(2025, 1, 3))],
+    }
+    assert ALTERADAS.to_dict() == {'count': 4, 'start_date': '2025-01-03', 'end_date': '2025-02-14',
+                                   'municipios': ['Curitiba', 'São Paulo']}
+
+
+@pytest.mark.parametrize('escopo, cruza', [
+    (PartitionScope('2025-02-01', '2025-02-09', ['São Paulo']), False),
+    (PartitionScope('2025-02-12', '2025-02-13', ['São Paulo']), False),
+    (PartitionScope('2025-02-12', '2025-02-14', ['São Paulo']), True),
+    (PartitionScope('2025-02-01', '2025-02-28', ['Rio de Janeiro']), False),
+    (PartitionScope('2025-01-01', '2025-01-31'), True),
+    (PartitionScope(None, '2025-01-02'), False),
+    (PartitionScope('2025-02-14', None, ['São Paulo', 'Rio de Janeiro']), True),
+    (GLOBAL_SCOPE, True),
+])
+def test_escopo_cruza_particoes(escopo, cruza):
+    assert escopo.overlaps(ALTERADAS) is cruza
+    assert PartitionScope.decode(escopo.encode().encode()).encode() == escopo.encode()
+
+
+PERIODO = 'start_date=2025-02-01&end_date=2025-02-20'
+URLS = {
+    'sao_paulo': f'/api/dashboard/overview?{PERIODO}&municipio=São Paulo',
+    'rio': f'/api/dashboard/overview?{PERIODO}&municipio=Rio de Janeiro',
+    'sao_paulo_antigo': '/api/dashboard/overview?start_date=2025-01-01&end_date=2025-01-05&municipio=São Paulo',
+    'todos': f'/api/dashboard/overview?{PERIODO}',
+    'metricas_rio': f'/api/dashboard/metricas-diarias?{PERIODO}&municipio=Rio de Janeiro',
+    'municipios': '/api/dashboard/municipios',
+}
+
+
+@pytest.fixture(params=['memoria', 'redis'])
+def cache_do_app(request, app, seed_corridas):
+    if request.param == 'redis':
+        fakeredis = pytest.importorskip('fakeredis')
+        pytest.importorskip('lupa')
+        cache_service.redis_client = fakeredis.FakeRedis()
+    seed_corridas(1000)
+    DataSyncService().recalculate_daily_metrics(start_date=datetime(2024, 1, 1))
+    cache_service.invalidate_dashboard_cache()
+    return cache_service
+
+
+def test_invalidacao_por_particoes_marca_so_o_que_cruza(cache_do_app, client):
+    for url in URLS.values():
+        assert client.get(url).get_json()['from_cache'] is False, url
+    particoes = PartitionSet([(date(2025, 2, 10), 'São Paulo')])
+
+    resultado = cache_do_app.invalidate_partitions(particoes)
+
+    assert resultado == {'keys_checked': len(URLS), 'keys_invalidated': 3}
+    # As entradas marcadas só saem do cache quando o warm-up não as regrava
+    assert cache_do_app.purge_invalidated(particoes) == 3
+    em_cache = {nome: client.get(url).get_json()['from_cache'] for nome, url in URLS.items()}
+    assert em_cache == {'sao_paulo': False, 'rio': True, 'sao_paulo_antigo': True, 'todos': False,
+                        'metricas_rio': True, 'municipios': False}
+
+
+def test_entrada_invalidada_servida_obsoleta(cache_do_app, client, monkeypatch):
+    antes = client.get(URLS['todos']).get_json()
+    particoes = PartitionSet([(date(2025, 2, 10), 'São Paulo')])
+    refreshes = []
+    monkeypatch.setattr(cache_do_app, '_schedule_refresh', lambda key, *args: refreshes.append(key))
+    fragmento = overview_fragment(MultiDict({'start_date': '2025-02-01', 'end_date': '2025-02-20'}))
+
+    cache_do_app.invalidate_partitions(particoes)
+    record, estado = cache_do_app.get_or_refresh_record(*fragmento)
+
+    # Até o warm-up: valor anterior servido e um refresh agendado
+    assert estado == 'stale' and len(refreshes) == 1
+    assert json.loads(record.json()) == antes['data']
+    # O warm-up recalcula a entrada invalidada no lugar
+    with cache_do_app.recompute_invalidated():
+        assert cache_do_app.get_or_refresh_record(*fragmento)[1] == 'miss'
+    assert cache_do_app.get_or_refresh_record(*fragmento)[1] == 'fresh'
+    assert cache_do_app.purge_invalidated(particoes) == 0
+
+
+def test_invalidacao_sem_particoes_nao_remove_nada(cache_do_app, client):
+    client.get(URLS['sao_paulo'])
+
+    assert cache_do_app.invalidate_partitions(PartitionSet()) == {'keys_checked': 0, 'keys_invalidated': 0}
+    assert client.get(URLS['sao_paulo']).get_json()['from_cache'] is True
@@ -0,0 +1,61 @@
+"""
+Testes da impressão digital das consultas: requisições equivalentes devem
+produzir os mesmos parâmetros canônicos e compartilhar a entrada de cache
+"""
+from datetime import date
+
+import pytest
+from werkzeug.datastructures import MultiDict
+
+from backend.services.query_fingerprint import canonical_query, normalize_municipio
+
+
+@pytest.fixture
+def municipios(app, seed_corridas):
+    seed_corridas(200)
+
+
+@pytest.mark.parametrize('grafia', ['sao  paulo', ' SÃO PAULO ', 'São Paulo', 'sÃo\tpaulo'])
+def test_normaliza_grafia_do_municipio(municipios, grafia):
+    assert normalize_municipio(grafia) == 'São Paulo'
+
+
+def test_municipio_desconhecido_mantem_grafia(municipios):
+    assert normalize_municipio('  Nova   Cidade ') == 'Nova Cidade'
+    assert normalize_municipio('   ') is None
+    assert normalize_municipio(None) is None
+
+
+def test_parametros_equivalentes_tem_mesma_impressao(municipios):
+    a = canonical_query(MultiDict([
+        ('start_date', '2025-02-01'), ('end_date', '2025-02-20'),
+        ('municipios', 'rio de janeiro,são paulo'), ('municipios', 'Rio de Janeiro'),
+    ]))
+    b = canonical_query(MultiDict([
+        ('municipios', 'SAO PAULO'), ('municipios', 'Rio de Janeiro'),
+        ('end_date', '2025-02-20T18:00:00'), ('start_date', ' 2025-02-01 00:00:00'),
+    ]))
+
+    assert a.cache_params() == b.cache_params() == {
+        'start_date': '2025-02-01', 'end_date': '2025-02-20', 'municipio': None,
+        'municipios': ['Rio de Janeiro', 'São Paulo'],
+    }
+    assert a.scope_municipios() == ['Rio de Janeiro', 'São Paulo']
+
+
+def test_periodo_padrao_resolvido_para_datas_concretas(municipios):
+    consulta = canonical_query(MultiDict({'end_date': '2025-03-01', 'municipio': 'belo horizonte'}),
+                               default_days=10)
+
+    assert (consulta.periodo.start_date, consulta.periodo.end_date) == (date(2025, 2, 19), date(2025, 3, 1))
+    assert consulta.municipio == 'Belo Horizonte'
+    assert consulta.scope_municipios() == ['Belo Horizonte']
+
+
+def test_grafia_diferente_acerta_o_cache_do_endpoint(municipios, client):
+    url = '/api/dashboard/overview?start_date=2025-02-01&end_date=2025-02-20&municipio='
+    primeira = client.get(url + 'São Paulo').get_json()
+    segunda = client.get(url.replace('2025-02-20', '2025-02-20T23:59:59') + 'sao%20%20paulo').get_json()
+
+    assert (primeira['from_cache'], segunda['from_cache']) == (False, True)
+    assert segunda['data'] == primeira['data']
@@ -0,0 +1,36 @@
+"""
+Testes do resumo do dashboard: cada parte deve ser igual à resposta do
+endpoint correspondente e compartilhar com ele a mesma entrada de cache
+"""
+from datetime import datetime
+
+import pytest
+
+from backend.services.sync_service import DataSyncService
+
+PARTES = {
+    'overview': '/api/dashboard/overview',
+    'metricas_diarias': '/api/dashboard/metricas-diarias',
+    'ranking_municipios': '/api/dashboard/ranking-municipios',
+    'municipios': '/api/dashboard/municipios',
+}
+
+
+@pytest.fixture
+def metricas(app, seed_corridas):
+    seed_corridas(1000)
+    DataSyncService().recalculate_daily_metrics(start_date=datetime(2024, 1, 1))
+
+
+@pytest.mark.parametrize('parametros', ['', 'start_date=2025-02-01&end_date=2025-02-20&municipio=São Paulo'])
+def test_resumo_igual_aos_endpoints_individuais(metricas, client, parametros):
+    resumo = client.get(f'/api/dashboard/resumo?{parametros}').get_json()
+
+    assert resumo['success']
+    assert resumo['from_cache'] == {parte: False for parte in PARTES}
+    for parte, caminho in PARTES.items():
+        individual = client.get(f'{caminho}?{parametros}').get_json()
+        assert individual['from_cache'] is True, parte
+        assert individual['data'] == resumo['data'][parte], parte
+
+    assert set(client.get(f'/api/dashboard/resumo?{parametros}').get_json()['from_cache'].values()) == {True}
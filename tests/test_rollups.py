@@ -0,0 +1,213 @@
+"""
+Testes dos rollups derivados de corridas: cada tabela deve reproduzir as
+mesmas agregações calculadas diretamente sobre a tabela de corridas
+"""
+import logging
+from collections import defaultdict
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy import case, event, func
+
+from backend.models import (db, Corrida, Meta, MetricaDiaria, MetricaHoraria, MetricaMensal, MetricaSemanal,
+                            StatusCorrida)
+from backend.services.rollup_service import month_start, rollup_service, week_start
+from backend.services.sync_service import DataSyncService
+
+# Margem das contagens HyperLogLog (conjuntos pequenos: erro absoluto de poucas unidades)
+ERRO_HLL = {'rel': 0.05, 'abs': 5}
+
+
+@pytest.fixture
+def corridas(app, seed_corridas):
+    corridas = seed_corridas(3000)
+    DataSyncService().recalculate_daily_metrics(start_date=datetime(2024, 1, 1))
+    return corridas
+
+
+def _receita(valor):
+    return round(float(valor or 0), 2)
+
+
+def test_rollup_horario_reproduz_corridas(corridas):
+    esperado = defaultdict(lambda: [0, 0.0])
+    for corrida in corridas:
+        chave = (corrida['data'].date(), corrida['data'].hour, corrida['municipio'], corrida['status'])
+        esperado[chave][0] += 1
+        esperado[chave][1] += corrida['valor'] or 0
+
+    obtido = {
+        (linha.data, linha.hora, linha.municipio, linha.status): [linha.total_corridas, linha.receita_total]
+        for linha in MetricaHoraria.query.all()
+    }
+
+    assert obtido.keys() == esperado.keys()
+    for chave, (total, receita) in esperado.items():
+        assert obtido[chave][0] == total
+        assert _receita(obtido[chave][1]) == _receita(receita)
+
+
+def test_distribuicao_horarios_igual_a_consulta_em_corridas(corridas, client):
+    hora = func.extract('hour', Corrida.data)
+    concluida = Corrida.status == StatusCorrida.CONCLUIDA
+    consulta = db.session.query(
+        hora,
+        func.count(Corrida.id),
+        func.sum(case((concluida, 1), else_=0)),
+        func.coalesce(func.sum(case((concluida, Corrida.valor), else_=0)), 0)
+    ).filter(
+        Corrida.data >= datetime(2025, 1, 6),
+        Corrida.data < datetime(2025, 2, 10),
+        Corrida.municipio == 'São Paulo'
+    ).group_by(hora).order_by(hora).all()
+
+    resposta = client.get('/api/metrics/distribuicao-horarios?start_date=2025-01-06'
+                          '&end_date=2025-02-09&municipio=São Paulo').get_json()
+
+    assert resposta['success']
+    assert [(h['hora'], h['total_corridas'], h['corridas_concluidas'], _receita(h['receita_total']))
+            for h in resposta['data']['distribuicao_horarios']] == \
+        [(int(h), total, concluidas, _receita(receita)) for h, total, concluidas, receita in consulta]
+
+
+@pytest.mark.parametrize('model, chave, inicio_de', [
+    (MetricaSemanal, 'semana', week_start),
+    (MetricaMensal, 'mes', month_start),
+])
+def test_rollups_semanal_e_mensal_reproduzem_corridas(corridas, model, chave, inicio_de):
+    grupos = defaultdict(list)
+    for corrida in corridas:
+        grupos[(inicio_de(corrida['data'].date()), corrida['municipio'])].append(corrida)
+
+    linhas = {(getattr(linha, chave), linha.municipio): linha for linha in model.query.all()}
+
+    assert linhas.keys() == grupos.keys()
+    for grupo, itens in grupos.items():
+        linha = linhas[grupo]
+        avaliacoes = [c['avaliacao'] for c in itens if c['avaliacao'] is not None]
+        assert linha.total_corridas == len(itens)
+        assert linha.corridas_concluidas == sum(c['status'] == StatusCorrida.CONCLUIDA for c in itens)
+        assert linha.corridas_canceladas == sum(c['status'] == StatusCorrida.CANCELADA for c in itens)
+        assert linha.corridas_perdidas == sum(c['status'] == StatusCorrida.PERDIDA for c in itens)
+        assert _receita(linha.receita_total) == _receita(sum(c['valor'] or 0 for c in itens))
+        # Média ponderada pelas corridas avaliadas (não a média das médias diárias)
+        assert linha.avaliacoes_quantidade == len(avaliacoes)
+        assert linha.avaliacao_media == pytest.approx(sum(avaliacoes) / len(avaliacoes))
+        assert linha.dias_com_dados == len({c['data'].date() for c in itens})
+        # Distintos do período estimados pelos sketches mesclados
+        assert linha.motoristas_ativos == pytest.approx(len({c['motorista_nome'] for c in itens}), **ERRO_HLL)
+        assert linha.usuarios_unicos == pytest.approx(len({c['usuario_nome'] for c in itens}), **ERRO_HLL)
+
+
+def test_rollup_sem_sketch_diario_usa_maior_valor_diario_e_avisa(corridas, caplog):
+    dia = date(2025, 2, 12)
+    diarias = MetricaDiaria.query.filter_by(data=dia, municipio='São Paulo').all()
+    for metrica in diarias:
+        metrica.motoristas_hll = None
+    db.session.commit()
+
+    with caplog.at_level(logging.WARNING, logger='backend.services.rollup_service'):
+        rollup_service.refresh_for_days([dia])
+    db.session.commit()
+
+    mensal = MetricaMensal.query.filter_by(mes=date(2025, 2, 1), municipio='São Paulo').one()
+    maior_diario = db.session.query(func.max(MetricaDiaria.motoristas_ativos)).filter(
+        MetricaDiaria.data >= date(2025, 2, 1), MetricaDiaria.data < date(2025, 3, 1),
+        MetricaDiaria.municipio == 'São Paulo'
+    ).scalar()
+    assert mensal.motoristas_hll is None
+    assert mensal.motoristas_ativos == maior_diario
+    assert 'sem sketch HyperLogLog' in caplog.text
+
+
+def _performance_por_metricas_diarias(meta):
+    """Realizado de uma meta somando metricas_diarias do mês (uma query por meta)"""
+    inicio = month_start(meta.mes)
+    fim = date(inicio.year + inicio.month // 12, inicio.month % 12 + 1, 1)
+    linha = db.session.query(
+        func.sum(MetricaDiaria.corridas_concluidas),
+        func.sum(MetricaDiaria.receita_total),
+        func.avg(MetricaDiaria.motoristas_ativos)
+    ).filter(
+        MetricaDiaria.municipio == meta.municipio,
+        MetricaDiaria.data >= inicio,
+        MetricaDiaria.data < fim
+    ).one()
+    return {'corridas': int(linha[0] or 0), 'receita': _receita(linha[1]), 'motoristas': int(linha[2] or 0)}
+
+
+@pytest.fixture
+def metas(corridas):
+    metas = [Meta(municipio=municipio, mes=mes, meta_corridas=300, meta_receita=6000, meta_motoristas=20)
+             for mes in (date(2025, 1, 1), date(2025, 2, 1), date(2025, 3, 1))
+             for municipio in ('São Paulo', 'Rio de Janeiro', 'Belo Horizonte', 'Curitiba')]
+    db.session.add_all(metas)
+    db.session.commit()
+    return metas
+
+
+def test_metas_performance_igual_ao_calculo_por_meta(metas, client):
+    resposta = client.get('/api/dashboard/metas-performance?mes_inicio=2025-01-01&mes_fim=2025-03-01').get_json()
+
+    assert resposta['success']
+    assert len(resposta['data']) == len(metas)
+    for item in resposta['data']:
+        meta = next(m for m in metas if m.municipio == item['municipio'] and m.mes.isoformat() == item['mes'])
+        esperado = _performance_por_metricas_diarias(meta)
+        assert {**item['realizado'], 'receita': _receita(item['realizado']['receita'])} == esperado
+        assert item['percentual_atingimento']['corridas'] == round(esperado['corridas'] / 300 * 100, 2)
+
+
+def test_metas_performance_sem_consulta_por_meta(metas, client):
+    def contar_queries(url):
+        """Queries sobre metas e rollups (sem a leitura da versão do dataset para o ETag)"""
+        queries = []
+        listener = lambda conn, cursor, statement, *args: queries.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            assert client.get(url).get_json()['success']
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+        return sum(1 for statement in queries if 'FROM metas' in statement or 'FROM metricas_' in statement)
+
+    um_mes = contar_queries('/api/dashboard/metas-performance?mes=2025-02-01&municipio=São Paulo')
+    tres_meses = contar_queries('/api/dashboard/metas-performance?mes_inicio=2025-01-01&mes_fim=2025-03-01')
+
+    assert um_mes == tres_meses
+
+
+def test_rollup_por_motorista_e_paginacao_reproduzem_corridas(corridas, client):
+    receitas = defaultdict(float)
+    for corrida in corridas:
+        if date(2025, 1, 1) <= corrida['data'].date() <= date(2025, 1, 31):
+            concluida = corrida['status'] == StatusCorrida.CONCLUIDA
+            receitas[(corrida['motorista_nome'], corrida['municipio'])] += corrida['valor'] if concluida else 0
+
+    url = '/api/dashboard/motoristas-performance?start_date=2025-01-01&end_date=2025-01-31'
+
+    def paginar(limit):
+        paginas, cursor = [], None
+        while True:
+            pagina = client.get(url + f'&limit={limit}' + (f'&cursor={cursor}' if cursor else '')).get_json()
+            assert len(pagina['data']) <= min(limit, 100)
+            paginas += pagina['data']
+            cursor = pagina['paginacao']['next_cursor']
+            if not cursor:
+                return paginas
+
+    completo = paginar(1000)
+    assert client.get(url + '&limit=100000').get_json()['paginacao']['limit'] == 100
+
+    assert paginar(7) == completo
+    assert {(m['nome'], m['municipio']): _receita(m['receita_total']) for m in completo} == \
+        {chave: _receita(receita) for chave, receita in receitas.items()}
+    ordem = [(-m['receita_total'], m['nome'], m['municipio']) for m in completo]
+    assert ordem == sorted(ordem)
+
+
+@pytest.mark.parametrize('parametros', ['cursor=zzz', 'limit=abc', 'limit=0', 'limit=-1'])
+def test_motoristas_performance_rejeita_parametros_invalidos(app, client, parametros):
+    resposta = client.get(f'/api/dashboard/motoristas-performance?{parametros}')
+
+    assert resposta.status_code == 400
+    assert resposta.get_json()['success'] is False
@@ -0,0 +1,86 @@
+"""
+Testes do warm-up do cache: depois de aquecidos, os payloads padrão do
+dashboard saem do cache já na primeira requisição
+"""
+import threading
+from datetime import date, datetime
+
+import pytest
+
+from backend.services.cache_service import cache_service
+from backend.services.partitions import PartitionSet
+from backend.services.sync_service import DataSyncService
+from backend.services.warmup_service import WARMUP_ENDPOINTS, warmup_service
+
+URLS = [
+    '/api/dashboard/overview',
+    '/api/dashboard/overview?municipio=Rio de Janeiro',
+    '/api/dashboard/metricas-diarias?municipio=São Paulo',
+    '/api/dashboard/ranking-municipios',
+    '/api/dashboard/municipios',
+]
+
+
+def _aguardar_refresh():
+    for thread in threading.enumerate():
+        if thread.name.startswith('cache-refresh:'):
+            thread.join(timeout=5)
+
+
+@pytest.fixture
+def metricas(app, seed_corridas):
+    seed_corridas(1500)
+    DataSyncService().recalculate_daily_metrics(start_date=datetime(2024, 1, 1))
+    cache_service.invalidate_dashboard_cache()
+
+
+def test_warm_up_publica_geracao_com_payloads_padrao(metricas, client):
+    geracao = cache_service.current_generation('dashboard')
+
+    resultado = warmup_service.warm_up()
+
+    assert resultado['success'], resultado['errors']
+    assert resultado['municipios'] == 3
+    assert resultado['generation'] == cache_service.current_generation('dashboard') != geracao
+    # 3 endpoints por período (2 deles também por município) e a lista de municípios
+    assert resultado['payloads_warmed'] == resultado['periods'] * (1 + 4 * 2) + 1
+    assert len(WARMUP_ENDPOINTS) == 4
+    for url in URLS:
+        assert client.get(url).get_json()['from_cache'] is True, url
+
+
+def test_warm_up_por_particoes_reaquece_na_geracao_atual(metricas, client):
+    warmup_service.warm_up()
+    geracao = cache_service.current_generation('dashboard')
+
+    resultado = warmup_service.warm_up(PartitionSet([(date(2025, 2, 1), 'São Paulo')]))
+
+    assert resultado['generation'] == geracao
+    assert resultado['municipios'] == 1
+
+
+def test_publicacao_por_particoes_nao_esvazia_o_cache(metricas, client, monkeypatch):
+    assert client.get('/api/dashboard/overview').get_json()['from_cache'] is False
+    leituras = []
+    warm_up = warmup_service.warm_up
+
+    def ler_antes_do_warm_up(partitions=None):
+        # Entre a invalidação e o warm-up
+        leituras.append(client.get('/api/dashboard/overview').get_json()['from_cache'])
+        return warm_up(partitions)
+
+    monkeypatch.setattr(warmup_service, 'warm_up', ler_antes_do_warm_up)
+    resultado = DataSyncService().publish_data_change('teste', PartitionSet([(date(2025, 2, 3), 'São Paulo')]))
+    _aguardar_refresh()
+
+    assert resultado['cache_invalidation']['keys_invalidated'] == 1
+    assert leituras == [True]
+    assert resultado['cache_warmup']['success'], resultado['cache_warmup']
+    assert resultado['cache_purged'] == 0
+    assert client.get('/api/dashboard/overview').get_json()['from_cache'] is True
+
+
+def test_warm_up_desativado(metricas, monkeypatch):
+    monkeypatch.setenv('CACHE_WARMUP', '0')
+
+    assert warmup_service.warm_up() == {'success': True, 'skipped': True}